@@ -1,38 +1,22 @@
-import requests
-import time
-import hashlib
-import hmac
 import os
 from decimal import Decimal
 from dotenv import load_dotenv
+from trade.client import binance
 
 load_dotenv()
 
-# 載入 BitoPro API 的金鑰、密鑰與 Email
-API_KEY = os.getenv('BINANCE_API_KEY')
-API_SECRET = os.getenv('BINANCE_API_SECRET')
+# 載入 Binance Email (API 金鑰由 trade/client.py 統一載入)
 EMAIL = os.getenv('BINANCE_EMAIL')
-BASE_URL = "https://api.binance.com/api/v3"
 
 def get_all_symbols():
-    url = 'https://api.binance.com/api/v3/exchangeInfo'
-    response = requests.get(url)
+    response = binance.public('GET', '/api/v3/exchangeInfo')
     data = response.json()
     symbols = [s['symbol'] for s in data['symbols']]
     print("所有交易對：", symbols)  # 只列前10個作為範例
     return symbols
 
 def get_account_balance():
-    base_url = 'https://api.binance.com'
-    endpoint = '/api/v3/account'
-    timestamp = int(time.time() * 1000)
-
-    query_string = f'timestamp={timestamp}'
-    signature = hmac.new(API_SECRET.encode(), query_string.encode(), hashlib.sha256).hexdigest()
-    headers = {'X-MBX-APIKEY': API_KEY}
-    url = f'{base_url}{endpoint}?{query_string}&signature={signature}'
-
-    response = requests.get(url, headers=headers)
+    response = binance.signed('GET', '/api/v3/account')
     print(response.json())
     if response.status_code == 200:
         balances = response.json().get('balances', [])
@@ -48,19 +32,7 @@ def get_fee_info_from_trades(order_id, symbol):
     fee_symbol = None
 
     try:
-        timestamp = int(time.time() * 1000)
-        query_string = f"symbol={symbol}&orderId={order_id}&timestamp={timestamp}"
-        signature = hmac.new(
-            API_SECRET.encode('utf-8'),
-            query_string.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        headers = {
-            'X-MBX-APIKEY': API_KEY
-        }
-
-        url = f"{BASE_URL}/myTrades?{query_string}&signature={signature}"
-        response = requests.get(url, headers=headers)
+        response = binance.signed('GET', '/api/v3/myTrades', {'symbol': symbol, 'orderId': order_id})
 
         if response.status_code == 200:
             trades = response.json()
@@ -77,8 +49,7 @@ def get_fee_info_from_trades(order_id, symbol):
     return fee, fee_symbol
 
 def get_all_base_assets_from_exchange_info():
-    url = 'https://api.binance.com/api/v3/exchangeInfo'
-    response = requests.get(url)
+    response = binance.public('GET', '/api/v3/exchangeInfo')
     symbols = response.json().get('symbols', [])
     base_assets = {s['baseAsset'] for s in symbols if s['status'] == 'TRADING'}
     return sorted(base_assets)
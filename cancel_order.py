@@ -1,46 +1,18 @@
 import os
-import json
 import time
-import hmac
-import base64
-import requests
-import hashlib
 from dotenv import load_dotenv
+from trade.client import bito
 load_dotenv()
 
-# 你的 BitoPro API Key & Secret & Email
-API_KEY = os.getenv('API_KEY')
-API_SECRET = os.getenv('API_SECRET')
+# 你的 BitoPro Email (API Key & Secret 由 trade/client.py 統一載入)
 EMAIL = os.getenv('EMAIL')
-BASEURL = 'https://api.bitopro.com/v3'
-
-def get_headers(params):
-        """ 產生 BitoPro API 驗證標頭 """
-        payload = base64.urlsafe_b64encode(
-            json.dumps(params).encode('utf-8')).decode('utf-8')
-
-        signature = hmac.new(
-            bytes(API_SECRET, 'utf-8'),
-            bytes(payload, 'utf-8'),
-            hashlib.sha384,
-        ).hexdigest()
-
-        return {
-            "X-BITOPRO-APIKEY": API_KEY,
-            "X-BITOPRO-PAYLOAD": payload,
-            "X-BITOPRO-SIGNATURE": signature,
-        }
 
 params = {
     'identity' : EMAIL,
     'nonce': int(time.time() * 1000)
 }
 
-headers = get_headers(params)
-
-url = f'{BASEURL}/orders/all/'
-
-response = requests.delete(url=url, headers=headers)
+response = bito.signed('DELETE', '/v3/orders/all/', params)
 if response is not None:
     print("Cancel Order:", response.json())
 else:
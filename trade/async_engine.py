@@ -0,0 +1,276 @@
+import os
+import json
+import asyncio
+import inspect
+import threading
+from .client import AsyncBinanceClient, binance
+from .persistence import TradeWriter
+from .history_log import history_print
+from .market_data import MARKET_DATA_STREAM, MARKET_DATA_MAX_AGE, AsyncMarketData
+from .metrics import record_retry
+from .events import publish_balance_event
+from .reports import publish_flushed
+from .async_ws import connect, WebSocketClosed
+from .user_stream import LISTEN_KEY_KEEPALIVE
+from .registry import BaseBotRegistry
+from .grid_bot import GridBot, Request, Parallel, Blocking, PRICE_CHECK_INTERVAL
+from . import user_stream
+
+# thread：每個機器人以執行緒處理 I/O (預設)；async：所有交易對共用一個 asyncio 事件迴圈
+TRADE_ENGINE = os.getenv('TRADE_ENGINE', 'thread')
+
+# websocket 斷線後重新連線的等待秒數
+RECONNECT_DELAY = 5
+
+# 同步介面 (views) 等待事件迴圈結果的上限秒數，逾時取消該工作
+ENGINE_CALL_TIMEOUT = float(os.getenv('ENGINE_CALL_TIMEOUT', 60))
+
+
+class AsyncGridBot(GridBot):
+    """在 AsyncEngine 的事件迴圈上執行 GridBot：REST 走 httpx，平行請求以 asyncio.gather 送出"""
+
+    def __init__(self, engine, pair):
+        super().__init__(engine.trade_writer, engine.market_data)
+        self.engine = engine
+        self.pair = pair
+        self.events = asyncio.Queue()
+        self.consumer_task = None
+        self.price_task = None
+
+    async def run(self, steps):
+        """執行 GridBot 流程並回傳結果"""
+        value, error = None, None
+        while True:
+            try:
+                effect = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration as stop:
+                return stop.value
+            value, error = None, None
+            try:
+                value = await self.perform(effect)
+            except Exception as e:
+                error = e
+
+    async def perform(self, effect):
+        if isinstance(effect, Request):
+            return await getattr(self.engine.client, effect.auth)(effect.method, effect.path, effect.params)
+        if isinstance(effect, Parallel):
+            return await asyncio.gather(*(self.run(steps) for steps in effect.steps), return_exceptions=True)
+        if isinstance(effect, Blocking):
+            # Django ORM 與同步快取不能在事件迴圈中呼叫
+            return await asyncio.to_thread(effect.fn, *effect.args)
+        result = effect.fn(*effect.args)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def spawn(self, steps):
+        return self.engine.spawn(self.run(steps))
+
+    async def consume_events(self):
+        """依序處理本交易對的 executionReport；不同交易對各自一個 task，互不等待"""
+        while True:
+            event = await self.events.get()
+            try:
+                await self.run(self.on_execution_report(event))
+            except Exception as e:
+                self.history_print(f"❌ 處理 executionReport 失敗: {e}")
+
+    async def connect(self):
+        error = await self.engine.ensure_user_stream()
+        if error is None and self.consumer_task is None:
+            self.consumer_task = asyncio.create_task(self.consume_events())
+        return error
+
+    async def disconnect(self):
+        if self.consumer_task is not None and self.consumer_task is not asyncio.current_task():
+            self.consumer_task.cancel()
+        self.consumer_task = None
+        await self.engine.release()
+
+    def schedule_price_check(self):
+        self.price_task = asyncio.create_task(self.check_price_periodically())
+
+    def cancel_price_check(self):
+        if self.price_task is not None and self.price_task is not asyncio.current_task():
+            self.price_task.cancel()
+        self.price_task = None
+
+    async def check_price_periodically(self):
+        while self.is_running:
+            try:
+                await self.run(self.check_price())
+            except Exception as e:
+                self.history_print(f"❌ 查價失敗: {e}")
+            await asyncio.sleep(PRICE_CHECK_INTERVAL)
+
+    def run_guard_action(self, action, change_pct):
+        self.spawn(action(change_pct))
+
+
+class AsyncEngine:
+    """一條執行緒上的 asyncio 事件迴圈，承載所有交易對的 REST (httpx)、user-data / 行情 websocket 與計時工作"""
+
+    def __init__(self, client=None, ws_url=None, stream=MARKET_DATA_STREAM, max_age=MARKET_DATA_MAX_AGE, log=history_print):
+        self.client = client
+        self.ws_url = ws_url
+        self.log = log
+        self.bots = {}
+        self.trade_writer = TradeWriter(log=log, on_flushed=publish_flushed)
+        self.market_data = AsyncMarketData(url=ws_url, stream=stream, max_age=max_age, log=log)
+        self.loop = None
+        self.thread = None
+        self.lock = None
+        self.listen_key = None
+        self.user_task = None
+        self.keepalive_task = None
+        self.background = set()  # 事件迴圈只保留 task 的弱參照，需自行持有
+        self._thread_lock = threading.Lock()
+
+    def call(self, coroutine, timeout=ENGINE_CALL_TIMEOUT):
+        """由其他執行緒 (Django view) 執行 coroutine 並等待結果，逾時取消並拋出 TimeoutError"""
+        with self._thread_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='trade-engine', daemon=True)
+                self.thread.start()
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"交易引擎 {timeout} 秒內未完成") from None
+
+    def running_bots(self):
+        return [bot for bot in self.bots.values() if bot.is_running]
+
+    def spawn(self, coroutine):
+        """在事件迴圈上背景執行 (風控動作、手續費補齊等)"""
+        task = asyncio.create_task(coroutine)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+        return task
+
+    async def start_bot(self, pair, **params):
+        if self.client is None:
+            # httpx.AsyncClient 需在事件迴圈內建立；與同步 client 共用排程器，額度一起計算
+            self.client = AsyncBinanceClient(
+                binance.api_key, os.getenv('BINANCE_API_SECRET'), base_url=binance.base_url, scheduler=binance.scheduler,
+            )
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            bot = self.bots.get(pair)
+            if bot is not None and bot.is_running:
+                return "機器人運作中"
+            if bot is None:
+                bot = self.bots[pair] = AsyncGridBot(self, pair)
+            resp = await bot.run(bot.start(pair, **params))
+            if resp != 0 and not bot.is_running:
+                await self.release()
+            return resp
+
+    async def release(self):
+        """沒有任何機器人運行時關閉 websocket，並寫完待寫入的成交"""
+        if self.running_bots():
+            return
+        for task in (self.user_task, self.keepalive_task):
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+        if self.user_task is not None:
+            self.log("🛑 已關閉 user-data WebSocket")
+        self.user_task = self.keepalive_task = None
+        self.market_data.stop()
+        await asyncio.to_thread(self.trade_writer.stop)
+
+    def _url(self, path):
+        return f"{self.ws_url or user_stream.BINANCE_WS_URL}{path}"
+
+    async def ensure_user_stream(self, timeout=5):
+        """建立 listenKey 與 user-data websocket，成功回傳 None，失敗回傳錯誤訊息"""
+        if self.user_task is not None and not self.user_task.done():
+            return None
+        self.log("嘗試建立 WebSocket 連線中...")
+        response = await self.client.keyed('POST', '/api/v3/userDataStream')
+        if response.status_code != 200:
+            return "無法取得 listenKey"
+        self.listen_key = response.json()['listenKey']
+        try:
+            ws = await connect(self._url(f"/ws/{self.listen_key}"), timeout=timeout)
+        except (OSError, asyncio.TimeoutError, WebSocketClosed) as e:
+            self.log(f"WS 連線超時: {e}")
+            return "WS 連線超時"
+        self.log("✅ WebSocket 連線成功，開始監聽訂單狀態")
+        self.user_task = asyncio.create_task(self.user_stream(ws))
+        self.keepalive_task = asyncio.create_task(self.keepalive())
+        return None
+
+    async def user_stream(self, ws):
+        attempt = 0
+        while True:
+            if ws is not None:
+                try:
+                    async for message in ws:
+                        self.dispatch(json.loads(message))
+                except (OSError, WebSocketClosed) as e:
+                    self.log(f"❌ WebSocket 錯誤: {e}")
+                finally:
+                    await ws.close()
+                self.log("🔴 WebSocket 連線關閉")
+
+            if attempt > 3:
+                self.log("❌ WebSocket 連線失敗，超過最大嘗試次數")
+                self.user_task = None
+                self.on_stream_lost("WebSocket 連線失敗，超過最大嘗試次數，機器人停止")
+                return
+
+            self.log(f"⚠️ WebSocket 斷線，嘗試重新連線 (第 {attempt} 次)...")
+            record_retry('/ws', 'user_stream_reconnect')
+            await asyncio.sleep(RECONNECT_DELAY)
+            attempt += 1
+            try:
+                ws = await connect(self._url(f"/ws/{self.listen_key}"))
+                self.log("✅ WebSocket 連線成功，開始監聽訂單狀態")
+            except (OSError, asyncio.TimeoutError, WebSocketClosed) as e:
+                self.log(f"❌ WebSocket 錯誤: {e}")
+                ws = None
+
+    async def keepalive(self):
+        while True:
+            await asyncio.sleep(LISTEN_KEY_KEEPALIVE)
+            try:
+                await self.client.keyed('PUT', '/api/v3/userDataStream', {'listenKey': self.listen_key})
+                self.log("listenKey 已自動續約")
+            except Exception as e:
+                self.log(f"❌ listenKey 續約失敗: {e}")
+
+    def dispatch(self, event):
+        """依 executionReport 的 symbol 排入對應機器人的佇列，餘額異動直接推送給前端"""
+        if event.get('e') == 'outboundAccountPosition':
+            publish_balance_event(event)
+            return
+        if event.get('e') != 'executionReport':
+            return
+        bot = self.bots.get(event.get('s'))
+        if bot is not None and bot.is_running:
+            bot.events.put_nowait(event)
+
+    def on_stream_lost(self, reason):
+        for bot in self.running_bots():
+            bot.error_message.append(reason)
+            bot.history_print(f"❌ {reason}")
+            bot.spawn(bot.stop())
+
+
+class AsyncBotRegistry(BaseBotRegistry):
+    """與 BotRegistry 相同的同步介面 (供 views 使用)，stream、writer 與行情由 AsyncEngine 持有，工作交給其事件迴圈"""
+
+    def __init__(self, engine=None):
+        self.engine = engine or AsyncEngine()
+        super().__init__(self.engine.bots)
+
+    def start(self, pair, **params):
+        return self.engine.call(self.engine.start_bot(pair, **params))
+
+    def execute(self, bot, steps):
+        return self.engine.call(bot.run(steps))
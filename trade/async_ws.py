@@ -0,0 +1,26 @@
+import os
+from websockets.asyncio.client import connect as ws_connect
+from websockets.exceptions import WebSocketException
+
+# 握手逾時秒數
+WS_HANDSHAKE_TIMEOUT = 10
+# 每隔幾秒送出 ping；超過 WS_PING_TIMEOUT 秒沒收到 pong 即關閉連線，
+# 讀取端 (async for) 隨即結束並走重連流程，half-open 連線不會卡住
+WS_PING_INTERVAL = float(os.getenv('WS_PING_INTERVAL', 20))
+WS_PING_TIMEOUT = float(os.getenv('WS_PING_TIMEOUT', 20))
+# 送出 close frame 後等待對方回應的秒數，逾時直接關閉 TCP 連線
+WS_CLOSE_TIMEOUT = float(os.getenv('WS_CLOSE_TIMEOUT', 5))
+
+# 握手失敗、連線中斷或收到 close frame
+WebSocketClosed = WebSocketException
+
+
+async def connect(url, timeout=WS_HANDSHAKE_TIMEOUT):
+    """建立 ws:// 或 wss:// 連線 (wss 驗證憑證與主機名稱)，回傳 websockets 的 ClientConnection"""
+    return await ws_connect(
+        url,
+        open_timeout=timeout,
+        ping_interval=WS_PING_INTERVAL,
+        ping_timeout=WS_PING_TIMEOUT,
+        close_timeout=WS_CLOSE_TIMEOUT,
+    )
@@ -0,0 +1,289 @@
+import csv
+import numpy as np
+from .grid import ladder
+from .fifo import fifo_from_trades
+from .volatility import VOLATILITY_WINDOW
+from decimal import Decimal
+from collections import namedtuple
+
+# Binance 現貨 taker/maker 預設手續費率
+BACKTEST_FEE_RATE = 0.001
+# 搜尋穿價時第一個區塊的筆數，找不到時加倍
+SEARCH_BLOCK = 1024
+
+Fill = namedtuple('Fill', ['index', 'timestamp', 'side', 'price', 'quantity', 'fee'])
+
+
+def load_prices(path, price_column=None):
+    """讀取本地歷史價格，回傳 (秒為單位的時間戳陣列, 價格陣列)
+
+    支援：
+      .npy  形狀 (n, 2) 的 [timestamp, price]，或 (n,) 的每秒價格
+      .csv  Binance kline (open_time, open, high, low, close, ...，取 close)、
+            Binance 成交 (id, price, qty, quote_qty, time, ...) 或 timestamp,price 兩欄
+    毫秒時間戳會自動轉為秒
+    """
+    if str(path).endswith('.npy'):
+        data = np.load(path)
+        if data.ndim == 1:
+            timestamps, prices = np.arange(len(data), dtype=np.float64), data.astype(np.float64)
+        else:
+            timestamps, prices = data[:, 0].astype(np.float64), data[:, 1].astype(np.float64)
+    else:
+        with open(path, newline='') as f:
+            rows = [row for row in csv.reader(f) if row and row[0].strip()[:1].isdigit()]
+        if not rows:
+            raise ValueError(f'沒有價格資料: {path}')
+        width = len(rows[0])
+        if price_column is not None:
+            time_column = 4 if width in (6, 7) else 0
+        elif width >= 11:
+            time_column, price_column = 0, 4   # kline: close
+        elif width in (6, 7):
+            time_column, price_column = 4, 1   # aggTrades / trades
+        else:
+            time_column, price_column = 0, 1
+        timestamps = np.array([float(row[time_column]) for row in rows])
+        prices = np.array([float(row[price_column]) for row in rows])
+
+    if len(timestamps) and timestamps.max() > 1e11:
+        timestamps = timestamps / 1000
+    order = np.argsort(timestamps, kind='stable')
+    return timestamps[order], prices[order]
+
+
+def resample(timestamps, prices, step=1.0):
+    """轉為固定間隔：每個時間點取當時最後一筆價格 (與行情串流只看最新價相同)"""
+    grid = np.arange(timestamps[0], timestamps[-1] + step / 2, step)
+    index = np.searchsorted(timestamps, grid, side='right') - 1
+    return grid, prices[index]
+
+
+def rolling_extreme(values, window, accumulate, combine, fill):
+    """固定筆數視窗的滾動最小 / 最大值 (van Herk / Gil-Werman，O(n) 向量化)
+
+    結果第 i 筆為 values[max(0, i - window + 1) : i + 1] 的極值
+    """
+    count = len(values)
+    padded = np.concatenate((np.full(window - 1, fill), values))
+    blocks = -(-len(padded) // window)
+    padded = np.concatenate((padded, np.full(blocks * window - len(padded), fill))).reshape(blocks, window)
+    prefix = accumulate(padded, axis=1).ravel()
+    suffix = accumulate(padded[:, ::-1], axis=1)[:, ::-1].ravel()
+    index = np.arange(count)
+    return combine(suffix[index], prefix[index + window - 1])
+
+
+def guard_hits(prices, low, high, cv):
+    """與 VolatilityGuard 相同的判斷：與視窗內最低 / 最高價相差超過 cv"""
+    return (prices >= low * (1 + cv)) | (prices <= high * (1 - cv))
+
+
+class GridBacktest:
+    """以歷史價格離線重播網格策略
+
+    掛單與補單規則與 TradeWSManager 相同：
+      初始掛單 ladder(current, current, ...)；
+      賣單成交 -> 於 last_trade_price 掛買單、於 last_trade_price + origin * up * (賣單數 + 1) 掛賣單；
+      買單成交 -> 於 last_trade_price - origin * down * (買單數 + 1) 掛買單、於 last_trade_price 掛賣單；
+      超過 reset_cv 取消全部並以當前價重新掛單，超過 cancel_cv 停止。
+    限價單在價格觸及掛單價時以掛單價成交。
+    下一次成交以滾動極值 + searchsorted 一次找出，不逐筆報價執行 Python 迴圈
+    """
+
+    def __init__(self, timestamps, prices, order_size, price_increase_percentage, price_decrease_percentage,
+                 trade_count, price_reset_cv, price_cancel_cv, precision=2, fee_rate=BACKTEST_FEE_RATE,
+                 window_seconds=VOLATILITY_WINDOW):
+        if price_increase_percentage <= 0 or price_decrease_percentage <= 0:
+            raise ValueError('網格間距必須大於 0')
+        self.timestamps = timestamps
+        self.prices = prices
+        self.order_size = order_size
+        self.price_increase_percentage = price_increase_percentage
+        self.price_decrease_percentage = price_decrease_percentage
+        self.trade_count = trade_count
+        self.price_reset_cv = price_reset_cv
+        self.price_cancel_cv = price_cancel_cv
+        self.precision = precision
+        self.fee_rate = fee_rate
+
+        step = float(np.median(np.diff(timestamps))) if len(timestamps) > 1 else 1.0
+        # 視窗包含 ts - window_seconds 之後 (含) 的報價
+        self.window = int(window_seconds // step) + 1
+        low = rolling_extreme(prices, self.window, np.minimum.accumulate, np.minimum, np.inf)
+        high = rolling_extreme(prices, self.window, np.maximum.accumulate, np.maximum, -np.inf)
+        self.cancel_hits = guard_hits(prices, low, high, price_cancel_cv)
+        self.guard_index = np.flatnonzero(self.cancel_hits | guard_hits(prices, low, high, price_reset_cv))
+
+        self.buy_orders = []
+        self.sell_orders = []
+        self.fills = []
+        self.resets = []
+        self.stopped_at = None
+
+    def place_order(self, side, price):
+        orders = self.buy_orders if side == 'BUY' else self.sell_orders
+        orders.append(round(price, self.precision))
+
+    def place_initial_orders(self, index):
+        current_price = float(self.prices[index])
+        self.origin_price = current_price
+        self.last_trade_price = current_price
+        self.buy_orders, self.sell_orders = [], []
+        for side, price in ladder(current_price, current_price, self.price_increase_percentage,
+                                  self.price_decrease_percentage, self.trade_count, self.precision):
+            self.place_order(side, price)
+
+    def next_guard(self, start, window_start):
+        """start 之後第一個觸發風控的位置；視窗在 window_start 重新起算"""
+        # 重新起算後的前 window 筆視窗不完整，以累積極值計算
+        partial_end = min(window_start + self.window - 1, len(self.prices))
+        if start < partial_end:
+            block = self.prices[window_start:partial_end]
+            low = np.minimum.accumulate(block)
+            high = np.maximum.accumulate(block)
+            offset = start - window_start
+            hits = guard_hits(block[offset:], low[offset:], high[offset:], self.price_reset_cv)
+            hits |= guard_hits(block[offset:], low[offset:], high[offset:], self.price_cancel_cv)
+            found = np.flatnonzero(hits)
+            if len(found):
+                index = start + int(found[0])
+                cancel = guard_hits(block[index - window_start], low[index - window_start],
+                                    high[index - window_start], self.price_cancel_cv)
+                return index, bool(cancel)
+            start = partial_end
+
+        position = np.searchsorted(self.guard_index, start)
+        if position >= len(self.guard_index):
+            return None, False
+        index = int(self.guard_index[position])
+        return index, bool(self.cancel_hits[index])
+
+    def next_fill(self, start, end):
+        """[start, end) 之間價格第一次觸及最低賣單或最高買單的位置"""
+        best_sell = min(self.sell_orders) if self.sell_orders else np.inf
+        best_buy = max(self.buy_orders) if self.buy_orders else -np.inf
+        block = SEARCH_BLOCK
+        while start < end:
+            stop = min(start + block, end)
+            chunk = self.prices[start:stop]
+            # 累積最高 / 最低價單調，可直接 searchsorted 找第一次穿價
+            hit_sell = np.searchsorted(np.maximum.accumulate(chunk), best_sell, side='left')
+            hit_buy = np.searchsorted(-np.minimum.accumulate(chunk), -best_buy, side='left')
+            hit = min(hit_sell, hit_buy)
+            if hit < len(chunk):
+                return start + int(hit)
+            start = stop
+            block *= 2
+        return None
+
+    def fill(self, index, side, price):
+        fee = price * self.order_size * self.fee_rate
+        self.fills.append(Fill(index, float(self.timestamps[index]), side, price, self.order_size, fee))
+
+    def on_fill(self, index):
+        """處理此筆報價觸及的最近一張掛單，沒有可成交的掛單時回傳 False"""
+        current = float(self.prices[index])
+        if self.sell_orders and current >= min(self.sell_orders):
+            price = min(self.sell_orders)
+            self.fill(index, 'SELL', price)
+            self.place_order('BUY', self.last_trade_price)
+            self.place_order('SELL', self.last_trade_price + self.origin_price * self.price_increase_percentage * (len(self.sell_orders) + 1))
+            self.sell_orders.remove(price)
+        elif self.buy_orders and current <= max(self.buy_orders):
+            price = max(self.buy_orders)
+            self.fill(index, 'BUY', price)
+            self.place_order('BUY', self.last_trade_price - self.origin_price * self.price_decrease_percentage * (len(self.buy_orders) + 1))
+            self.place_order('SELL', self.last_trade_price)
+            self.buy_orders.remove(price)
+        else:
+            return False
+        self.last_trade_price = price
+        return True
+
+    def run(self):
+        count = len(self.prices)
+        if count == 0:
+            return self.report()
+        self.place_initial_orders(0)
+        cursor = 1
+        window_start = 0
+        guard, cancel = self.next_guard(cursor, window_start)
+
+        while cursor < count:
+            end = guard if guard is not None else count
+            index = self.next_fill(cursor, end + 1 if guard is not None else end)
+            if index is not None and (guard is None or index <= guard):
+                # 同一筆報價可能連續觸及多張掛單 (含剛補上的掛單)；
+                # 補單價與成交價相同時可能互相成交，以掛單數為上限避免無限循環
+                for _ in range(2 * self.trade_count + 2):
+                    if not self.on_fill(index):
+                        break
+                cursor = index + 1
+                if guard is None or cursor <= guard:
+                    continue
+
+            if guard is None:
+                break
+            if cancel:
+                self.stopped_at = guard
+                break
+            # 取消全部掛單，以當前價重新掛單，視窗從下一筆報價重新起算
+            self.resets.append(guard)
+            self.place_initial_orders(guard)
+            cursor = guard + 1
+            window_start = cursor
+            guard, cancel = self.next_guard(cursor, window_start)
+
+        return self.report()
+
+    def report(self):
+        """成交、手續費與損益 (已實現損益以 FIFO 計算，手續費以報價幣計)"""
+        buys = [f for f in self.fills if f.side == 'BUY']
+        sells = [f for f in self.fills if f.side == 'SELL']
+        fees = sum(f.fee for f in self.fills)
+        position = (len(buys) - len(sells)) * self.order_size
+        cash = sum(f.price * f.quantity for f in sells) - sum(f.price * f.quantity for f in buys)
+        last_price = float(self.prices[-1]) if len(self.prices) else 0.0
+
+        # 賣單先於買單成交時賣的是起始持有的幣，成本以起始價計
+        start_price = float(self.prices[0]) if len(self.prices) else 0.0
+        net = np.cumsum([1 if f.side == 'SELL' else -1 for f in self.fills]) if self.fills else np.zeros(1)
+        inventory = max(int(net.max()), 0)
+        lots = [Fill(-1, 0.0, 'BUY', start_price, self.order_size, 0.0)] * inventory + buys
+        realized = 0.0
+        if sells:
+            _, fifo = fifo_from_trades(
+                [self._decimal_fill(f, 0.0) for f in lots],
+                [self._decimal_fill(f, f.fee) for f in sells],
+            )
+            realized = float(sum(fifo['profits']))
+        realized -= sum(f.fee for f in buys)
+
+        return {
+            'ticks': len(self.prices),
+            'start': float(self.timestamps[0]) if len(self.timestamps) else None,
+            'end': float(self.timestamps[-1]) if len(self.timestamps) else None,
+            'fills': len(self.fills),
+            'buys': len(buys),
+            'sells': len(sells),
+            'volume': sum(f.price * f.quantity for f in self.fills),
+            'fees': fees,
+            'realized_pnl': realized,
+            'position': position,
+            'mark_to_market_pnl': cash + position * last_price - fees,
+            'resets': len(self.resets),
+            'stopped_at': float(self.timestamps[self.stopped_at]) if self.stopped_at is not None else None,
+        }
+
+    @staticmethod
+    def _decimal_fill(fill, fee):
+        return Fill(fill.index, fill.timestamp, fill.side, Decimal(str(fill.price)),
+                    Decimal(str(fill.quantity)), Decimal(str(round(fee, 10))))
+
+
+def run_backtest(path, step=1.0, **params):
+    """讀取歷史價格檔並執行回測，params 同 GridBacktest"""
+    timestamps, prices = load_prices(path)
+    timestamps, prices = resample(timestamps, prices, step)
+    return GridBacktest(timestamps, prices, **params).run()
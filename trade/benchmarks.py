@@ -0,0 +1,290 @@
+import json
+import time
+import random
+import statistics
+import platform
+import itertools
+import contextlib
+from pathlib import Path
+from decimal import Decimal
+from unittest import mock
+from datetime import datetime, timedelta, timezone
+from collections import namedtuple
+from django.db import transaction
+from .client import BinanceClient
+from .fifo import fifo_from_trades
+from .grid import ladder
+from .history_log import history_logger
+from .models import SpotTrade
+from .reports import spot_report
+from .ws import TradeWSManager
+
+# 預設的基準值檔案 (以 benchmark --update-baseline 產生)
+BENCHMARK_BASELINE = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+# 指標低於基準值的 (1 - tolerance) 倍即視為退步
+BENCHMARK_TOLERANCE = 0.3
+BENCHMARK_EMAIL = 'benchmark@example.com'
+BENCHMARK_PAIR = 'BTCUSDT'
+
+Fill = namedtuple('Fill', ['id', 'quantity', 'price', 'fee', 'trade_date'])
+
+QUANTUM = Decimal('1e-10')  # 與資料庫讀出的 DecimalField 相同的指數
+
+
+def synthetic_fills(count, seed=0):
+    """網格成交的模擬資料：大多數賣單與買單數量相同，少數不同以觸發部分扣減"""
+    rng = random.Random(seed)
+    order_size = Decimal('0.00150000')
+    buys, sells = [], []
+    price = 60000.0
+    for i in range(count // 2):
+        price *= 1 + rng.uniform(-0.002, 0.002)
+        qty = order_size if rng.random() < 0.9 else order_size * rng.randint(1, 3)
+        buy_price = Decimal(f'{price:.2f}')
+        buys.append(Fill(f'b{i}', qty.quantize(QUANTUM), buy_price.quantize(QUANTUM), (qty / 1000).quantize(QUANTUM), None))
+        sell_price = (buy_price * Decimal('1.003')).quantize(Decimal('0.01'))
+        sells.append(Fill(f's{i}', qty.quantize(QUANTUM), sell_price.quantize(QUANTUM), (sell_price * qty / 1000).quantize(QUANTUM), None))
+    return buys, sells
+
+
+class StubResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self.payload
+
+
+class StubBinanceClient(BinanceClient):
+    """query 組裝與 HMAC 簽章走真實程式碼，只把 HTTP 請求換成固定回應"""
+
+    def __init__(self):
+        super().__init__('benchmark-key', 'benchmark-secret')
+        self.order_ids = itertools.count(1)
+
+    def request(self, method, path, query=None, headers=None, data=None):
+        if method == 'POST' and path == '/api/v3/order':
+            return StubResponse({'orderId': next(self.order_ids)})
+        return StubResponse({})
+
+    def prewarm(self, connections=1):
+        pass
+
+
+class StubMarketData:
+    def __init__(self, price):
+        self.price = price
+
+    def get_price(self, symbol):
+        return self.price
+
+    def subscribe(self, symbol, listener=None):
+        pass
+
+    def unsubscribe(self, symbol):
+        pass
+
+
+class StubTradeWriter:
+    def __init__(self):
+        self.rows = 0
+
+    def offer(self, fields):
+        self.rows += 1
+        return True
+
+    def submit(self, fields):
+        self.rows += 1
+
+    def start(self):
+        pass
+
+    def stop(self, timeout=None):
+        pass
+
+    def join(self):
+        pass
+
+
+@contextlib.contextmanager
+def stubbed_bot(price=60000.0, trade_count=10):
+    """不連線的 TradeWSManager：REST 換成 StubBinanceClient，行情、stream、寫入皆為 stub，並關閉交易歷程記錄"""
+    client = StubBinanceClient()
+    disabled = history_logger.disabled
+    history_logger.disabled = True
+    try:
+        with mock.patch('trade.ws.binance', client):
+            bot = TradeWSManager(stream=mock.Mock(), trade_writer=StubTradeWriter(), market_data=StubMarketData(price))
+            bot.pair = BENCHMARK_PAIR
+            bot.order_size = 0.0015
+            bot.precision = 2
+            bot.price_increase_percentage = 0.001
+            bot.price_decrease_percentage = 0.001
+            bot.trade_count = trade_count
+            bot.is_running = True
+            yield bot
+            bot.dispatcher.shutdown()
+    finally:
+        history_logger.disabled = disabled
+
+
+def best_of(fn, repeat=5):
+    """執行 repeat 次取最短秒數 (排除排程雜訊)"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibration(loops=200_000):
+    """固定的純 Python 工作量 (每秒迴圈數)，用來抵銷機器本身快慢與執行期間 CPU 頻率的變化"""
+    def run():
+        total = 0
+        for i in range(loops):
+            total += i * i % 7
+        return total
+
+    return loops / best_of(run)
+
+
+def execution_report(order_id, side, price, sequence):
+    ts = int(time.time() * 1000)
+    return {
+        'e': 'executionReport', 's': BENCHMARK_PAIR, 'i': order_id, 'S': side, 'x': 'TRADE', 'X': 'FILLED',
+        'p': str(price), 'q': '0.0015', 'z': '0.0015', 'l': '0.0015', 'n': '0.0000015', 'N': 'BTC',
+        't': sequence, 'T': ts, 'O': ts,
+    }
+
+
+def bench_execution_reports(events):
+    """成交回報處理 (含補單的簽章與下單)：每秒事件數"""
+    def run():
+        with stubbed_bot() as bot:
+            bot.run(bot.place_initial_orders())
+            for i in range(events):
+                # 買賣單輪流成交，網格維持在初始價附近
+                if i % 2 == 0:
+                    order_id, side = bot.buy_orders[-1], 'BUY'
+                else:
+                    order_id, side = bot.sell_orders[-1], 'SELL'
+                bot.run(bot.on_execution_report(execution_report(order_id, side, bot.last_trade_price, i)))
+
+    return events / best_of(run), 'events/s'
+
+
+def bench_place_order(orders):
+    """place_order 的參數組裝、簽章與回應處理：每秒下單數"""
+    def run():
+        with stubbed_bot() as bot:
+            for i in range(orders):
+                bot.run(bot.place_order('BUY' if i % 2 else 'SELL', 60000 + i * 0.01))
+
+    return orders / best_of(run), 'orders/s'
+
+
+def bench_ladder(count, trade_count=50):
+    """place_initial_orders 的網格價位產生：每秒網格數"""
+    def run():
+        for i in range(count):
+            ladder(60000.0 + i, 60000.0 + i, 0.001, 0.001, trade_count, 2)
+
+    return count / best_of(run), 'ladders/s'
+
+
+def bench_fifo(size):
+    """整段歷史的 FIFO 損益配對 (ledger.rebuild_pair 的計算部分)：每秒成交筆數"""
+    buys, sells = synthetic_fills(size)
+    return size / best_of(lambda: fifo_from_trades(buys, sells)), 'trades/s'
+
+
+def synthetic_lots(size, open_ratio=0.1, seed=0):
+    """size 筆成交歷史對應的 open lot：一半為買單，其中 open_ratio 比例仍有持倉"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    lots = []
+    for i in range(size // 2):
+        quantity = Decimal('0.0015')
+        is_open = rng.random() < open_ratio
+        lots.append(SpotTrade(
+            id=f'bench{i}',
+            user_email=BENCHMARK_EMAIL,
+            pair=BENCHMARK_PAIR,
+            quantity=quantity,
+            price=Decimal(f'{60000 + rng.uniform(-500, 500):.2f}'),
+            open_position=quantity if is_open else 0,
+            sold_or_not=not is_open,
+            fee=Decimal('0.0000015'),
+            fee_symbol='BTC',
+            trade_date=start + timedelta(seconds=i),
+        ))
+    return lots
+
+
+def bench_spot_report(size):
+    """持倉報表 (原 get_spots_by_pair)：size 筆成交歷史下每秒可處理的歷史筆數，資料於結束時 rollback"""
+    with transaction.atomic():
+        SpotTrade.objects.bulk_create(synthetic_lots(size), batch_size=5000)
+        elapsed = best_of(lambda: spot_report(BENCHMARK_EMAIL))
+        transaction.set_rollback(True)
+    return size / elapsed, 'trades/s'
+
+
+def run_benchmarks(sizes=(10_000, 100_000), events=5000, orders=20000, ladders=20000):
+    """回傳 {指標名稱: {'value': 每秒處理量, 'unit': 單位, 'relative': 相對於校準工作量的比值}}
+
+    所有指標皆為越大越好；每項前後各校準一次，relative 以兩次平均計算，比較基準值時使用 relative
+    """
+    cases = [
+        ('execution_report', lambda: bench_execution_reports(events)),
+        ('place_order', lambda: bench_place_order(orders)),
+        ('ladder', lambda: bench_ladder(ladders)),
+    ]
+    for size in sizes:
+        cases.append((f'fifo_{size}', lambda size=size: bench_fifo(size)))
+        cases.append((f'spot_report_{size}', lambda size=size: bench_spot_report(size)))
+
+    metrics = {}
+    for name, case in cases:
+        before = calibration()
+        value, unit = case()
+        speed = (before + calibration()) / 2
+        metrics[name] = {'value': round(value, 1), 'unit': unit, 'relative': round(value / speed, 6)}
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'metrics': metrics,
+    }
+
+
+def median_of(runs):
+    """多次 run_benchmarks 的結果取各指標中位數，降低單次執行的雜訊 (建立基準值時使用)"""
+    merged = dict(runs[-1])
+    merged['metrics'] = {
+        name: {
+            'value': round(statistics.median(run['metrics'][name]['value'] for run in runs), 1),
+            'unit': metric['unit'],
+            'relative': round(statistics.median(run['metrics'][name]['relative'] for run in runs), 6),
+        }
+        for name, metric in runs[-1]['metrics'].items()
+    }
+    merged['runs'] = len(runs)
+    return merged
+
+
+def regressions(results, baseline, tolerance=BENCHMARK_TOLERANCE):
+    """與基準值比較 (兩邊都有 relative 時比較 relative)，回傳退步的指標 [(名稱, 目前值, 基準值)]；基準值沒有的指標略過"""
+    found = []
+    for name, metric in results['metrics'].items():
+        expected = baseline.get('metrics', {}).get(name)
+        if not expected:
+            continue
+        key = 'relative' if 'relative' in metric and 'relative' in expected else 'value'
+        if metric[key] < expected[key] * (1 - tolerance):
+            found.append((name, metric[key], expected[key]))
+    return found
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import hmac
+import base64
+import hashlib
+import logging
+import threading
+import httpx
+import requests
+from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from .metrics import observe_rest
+from .scheduler import RequestScheduler, request_cost
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BINANCE_BASE_URL = os.getenv('BINANCE_BASE_URL', 'https://api.binance.com')
+BITO_BASE_URL = os.getenv('BITO_BASE_URL', 'https://api.bitopro.com')
+
+# 每個 host 的連線池大小 (需大於同時下單的併發數)
+POOL_MAXSIZE = int(os.getenv('REST_POOL_MAXSIZE', 32))
+REQUEST_TIMEOUT = float(os.getenv('REST_TIMEOUT', 10))
+
+
+class Signer:
+    """預先建立 HMAC key 物件，每次簽章只 copy() 再 update，不重複處理密鑰"""
+
+    def __init__(self, secret, digestmod):
+        self._base = hmac.new((secret or '').encode('utf-8'), digestmod=digestmod)
+
+    def sign(self, message):
+        h = self._base.copy()
+        h.update(message.encode('utf-8'))
+        return h.hexdigest()
+
+
+class RestClient:
+    """單一 host 的持久連線池 (keep-alive)，所有模組共用"""
+
+    name = 'rest'  # metrics 的 exchange 標籤
+
+    def __init__(self, base_url, pool_maxsize=POOL_MAXSIZE, timeout=REQUEST_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, path, query=None, headers=None, data=None):
+        url = f"{self.base_url}{path}"
+        if query:
+            url = f"{url}?{query}"
+        # 每次請求都記錄耗時、狀態碼與傳輸量 (/metrics/)
+        sent_bytes = len(url) + len(data or '')
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, headers=headers, data=data, timeout=self.timeout)
+        except requests.RequestException:
+            observe_rest(self.name, method, path, None, time.perf_counter() - started, sent_bytes, 0)
+            raise
+        observe_rest(self.name, method, path, response.status_code, time.perf_counter() - started, sent_bytes, len(response.content))
+        return response
+
+    def prewarm(self, path, connections=1):
+        """預先建立 TCP+TLS 連線放進連線池，避免第一筆下單付出握手延遲"""
+        def ping():
+            try:
+                self.request('GET', path)
+            except requests.RequestException as e:
+                logger.warning("預熱連線失敗 %s: %s", self.base_url, e)
+
+        threads = [threading.Thread(target=ping, daemon=True) for _ in range(min(connections, self.pool_maxsize))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=self.timeout)
+
+
+class BinanceClient(RestClient):
+    """Binance REST：query string 以 HMAC-SHA256 簽章"""
+
+    name = 'binance'
+
+    def __init__(self, api_key, api_secret, base_url=BINANCE_BASE_URL, scheduler=None, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.api_key = api_key
+        self.signer = Signer(api_secret, hashlib.sha256)
+        self.scheduler = scheduler or RequestScheduler()
+
+    def request(self, method, path, query=None, headers=None, data=None):
+        """所有 Binance 請求先經排程器取得 weight / 下單額度，回應後以標頭校正用量"""
+        lane, weight, orders = request_cost(method, path)
+        self.scheduler.acquire(lane, weight, orders)
+        response = super().request(method, path, query, headers=headers, data=data)
+        self.scheduler.observe(response.status_code, response.headers)
+        return response
+
+    def sign_query(self, params=None):
+        """加上 timestamp 並回傳帶 signature 的 query string"""
+        params = dict(params or {})
+        params['timestamp'] = int(time.time() * 1000)
+        query = urlencode(params)
+        return f"{query}&signature={self.signer.sign(query)}"
+
+    def public(self, method, path, params=None):
+        return self.request(method, path, urlencode(params) if params else None)
+
+    def keyed(self, method, path, params=None):
+        """只需 API key 的端點 (例如 userDataStream)"""
+        return self.request(method, path, urlencode(params) if params else None, headers={'X-MBX-APIKEY': self.api_key})
+
+    def signed(self, method, path, params=None):
+        return self.request(method, path, self.sign_query(params), headers={'X-MBX-APIKEY': self.api_key})
+
+    def prewarm(self, connections=1):
+        super().prewarm('/api/v3/ping', connections)
+
+
+class AsyncBinanceClient:
+    """Binance REST 的 httpx.AsyncClient 版本 (TRADE_ENGINE=async)，簽章與排程器與同步版共用"""
+
+    name = 'binance'
+    sign_query = BinanceClient.sign_query
+
+    def __init__(self, api_key, api_secret, base_url=BINANCE_BASE_URL, scheduler=None,
+                 pool_maxsize=POOL_MAXSIZE, timeout=REQUEST_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.signer = Signer(api_secret, hashlib.sha256)
+        self.scheduler = scheduler or RequestScheduler()
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+            timeout=timeout,
+        )
+
+    async def request(self, method, path, query=None, headers=None, data=None):
+        lane, weight, orders = request_cost(method, path)
+        await self.scheduler.acquire_async(lane, weight, orders)
+        url = f"{self.base_url}{path}"
+        if query:
+            url = f"{url}?{query}"
+        sent_bytes = len(url) + len(data or '')
+        # 與 requests 相同，略過值為 None 的標頭 (例如未設定 API key)
+        headers = {name: value for name, value in (headers or {}).items() if value is not None}
+        started = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, headers=headers, content=data)
+        except httpx.HTTPError:
+            observe_rest(self.name, method, path, None, time.perf_counter() - started, sent_bytes, 0)
+            raise
+        observe_rest(self.name, method, path, response.status_code, time.perf_counter() - started, sent_bytes, len(response.content))
+        self.scheduler.observe(response.status_code, response.headers)
+        return response
+
+    async def public(self, method, path, params=None):
+        return await self.request(method, path, urlencode(params) if params else None)
+
+    async def keyed(self, method, path, params=None):
+        return await self.request(method, path, urlencode(params) if params else None, headers={'X-MBX-APIKEY': self.api_key})
+
+    async def signed(self, method, path, params=None):
+        return await self.request(method, path, self.sign_query(params), headers={'X-MBX-APIKEY': self.api_key})
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+class BitoClient(RestClient):
+    """BitoPro REST：payload 以 base64 編碼後用 HMAC-SHA384 簽章並放在標頭"""
+
+    name = 'bito'
+
+    def __init__(self, api_key, api_secret, base_url=BITO_BASE_URL, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.api_key = api_key
+        self.signer = Signer(api_secret, hashlib.sha384)
+
+    def signed_headers(self, params):
+        payload = base64.urlsafe_b64encode(json.dumps(params).encode('utf-8')).decode('utf-8')
+        return {
+            "X-BITOPRO-APIKEY": self.api_key,
+            "X-BITOPRO-PAYLOAD": payload,
+            "X-BITOPRO-SIGNATURE": self.signer.sign(payload),
+        }
+
+    def signed(self, method, path, params):
+        return self.request(method, path, headers=self.signed_headers(params))
+
+    def prewarm(self, connections=1):
+        super().prewarm('/v3/provisioning/currencies', connections)
+
+
+# 全域共用的 REST client
+binance = BinanceClient(os.getenv('BINANCE_API_KEY'), os.getenv('BINANCE_API_SECRET'))
+bito = BitoClient(os.getenv('API_KEY'), os.getenv('API_SECRET'))
@@ -0,0 +1,30 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# 同時送出的下單請求上限
+ORDER_CONCURRENCY = int(os.getenv('ORDER_CONCURRENCY', 8))
+
+
+class OrderDispatcher:
+    """以有上限的執行緒池平行送出互不相依的訂單請求"""
+
+    def __init__(self, max_workers=ORDER_CONCURRENCY):
+        self.max_workers = max(1, max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='order')
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def run_all(self, fn, args_list):
+        """對每組參數平行呼叫 fn，依輸入順序回傳結果；單筆例外不影響其他請求"""
+        futures = [self.executor.submit(fn, *args) for args in args_list]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import itertools
+import threading
+from collections import deque
+from django.core.serializers.json import DjangoJSONEncoder
+
+# 保留最近幾筆事件，SSE 斷線重連時依 Last-Event-ID 補送
+EVENT_BUFFER = int(os.getenv('EVENT_BUFFER', 1000))
+# 每個連線最多積壓的事件數，超過代表前端跟不上，改送 resync 要求重新載入
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', 1000))
+# 沒有事件時送出註解保持連線 (避免 proxy 逾時斷線)
+EVENT_KEEPALIVE = float(os.getenv('EVENT_KEEPALIVE', 15))
+# WSGI 每條 SSE 連線最多保持的秒數：到期即結束回應、釋放 worker 執行緒，
+# 瀏覽器依 retry 自動重連並以 Last-Event-ID 補送期間的事件 (ASGI 不受限)
+EVENT_WSGI_MAX_SECONDS = float(os.getenv('EVENT_WSGI_MAX_SECONDS', 25))
+# 瀏覽器斷線後重新連線的等待毫秒數
+EVENT_RETRY_MS = 3000
+
+# 事件類型：
+#   order_placed / order_cancelled / fill  executionReport (NEW / CANCELED / 成交)
+#   trade / spot                           成交寫入後的明細列與持倉列 (格式同 /get_trades/、/get_spots/)
+#   guard                                  波動風控觸發 (action: reset / cancel)
+#   balance                                outboundAccountPosition 的餘額異動
+#   bot_state                              機器人啟動、更新或停止
+#   resync                                 事件遺失，前端需重新載入完整資料
+
+
+class Subscription:
+    """一個 SSE 連線的事件佇列 (WSGI：執行緒阻塞等待)"""
+
+    def __init__(self, maxsize=EVENT_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize)
+        self.overflow = False
+        self.start_id = 0  # 訂閱當下最新的事件 id
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflow = True
+
+    def get(self, timeout):
+        """回傳下一筆事件，逾時回傳 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.overflow = False
+
+
+class AsyncSubscription(Subscription):
+    """ASGI 版本：由發布端執行緒以 call_soon_threadsafe 放入事件迴圈的佇列，等待時不佔用執行緒"""
+
+    def __init__(self, loop, maxsize=EVENT_QUEUE_SIZE):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.overflow = False
+        self.start_id = 0
+
+    def put(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflow = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflow = False
+
+
+class EventHub:
+    """交易事件的發布 / 訂閱：機器人與寫入執行緒 publish，每個 SSE 連線一個 Subscription"""
+
+    def __init__(self, buffer=EVENT_BUFFER):
+        self.recent = deque(maxlen=buffer)
+        self.subscribers = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, **data):
+        with self._lock:
+            event = {'id': next(self._ids), 'type': event_type, 'ts': time.time(), **data}
+            self.recent.append(event)
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.put(event)
+        return event
+
+    def subscribe(self, subscription, last_id=None):
+        """加入訂閱；有 last_id 時先補送之後的事件，已超出保留範圍則送 resync"""
+        with self._lock:
+            if last_id is not None:
+                missed = [event for event in self.recent if event['id'] > last_id]
+                if self.recent and self.recent[0]['id'] > last_id + 1:
+                    subscription.put(self.resync_event())
+                else:
+                    for event in missed:
+                        subscription.put(event)
+            # 有補送時維持瀏覽器原本的進度，補送完之前斷線仍可再補
+            subscription.start_id = self.last_id() if last_id is None else last_id
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscribers.discard(subscription)
+
+    def last_id(self):
+        return self.recent[-1]['id'] if self.recent else 0
+
+    def resync_event(self):
+        return {'id': self.last_id(), 'type': 'resync', 'ts': time.time()}
+
+
+hub = EventHub()
+
+
+def publish(event_type, **data):
+    return hub.publish(event_type, **data)
+
+
+def format_sse(event):
+    """text/event-stream 的一則訊息"""
+    data = json.dumps(event, cls=DjangoJSONEncoder, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+def handshake(subscription):
+    """連線後的第一則訊息：重連間隔，並以 id 記下目前進度，
+    讓還沒收到任何事件就斷線的瀏覽器也能帶 Last-Event-ID 重連補送"""
+    return f"retry: {EVENT_RETRY_MS}\nid: {subscription.start_id}\n: connected\n\n"
+
+
+def parse_last_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def event_stream(last_id=None, keepalive=EVENT_KEEPALIVE, events=hub, max_seconds=EVENT_WSGI_MAX_SECONDS):
+    """WSGI 用的同步產生器：輸出事件，閒置時送出 keepalive 註解，max_seconds 後結束連線"""
+    subscription = events.subscribe(Subscription(), last_id)
+    deadline = time.monotonic() + max_seconds
+    try:
+        yield handshake(subscription)
+        while True:
+            if subscription.overflow:
+                subscription.drain()
+                yield format_sse(events.resync_event())
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            event = subscription.get(min(keepalive, remaining))
+            if event is not None:
+                yield format_sse(event)
+            elif time.monotonic() < deadline:
+                yield ": keepalive\n\n"
+    finally:
+        events.unsubscribe(subscription)
+
+
+async def async_event_stream(last_id=None, keepalive=EVENT_KEEPALIVE, events=hub):
+    """ASGI 用的非同步產生器，與 event_stream 輸出相同"""
+    subscription = events.subscribe(AsyncSubscription(asyncio.get_running_loop()), last_id)
+    try:
+        yield handshake(subscription)
+        while True:
+            if subscription.overflow:
+                subscription.drain()
+                yield format_sse(events.resync_event())
+            event = await subscription.get(keepalive)
+            yield ": keepalive\n\n" if event is None else format_sse(event)
+    finally:
+        events.unsubscribe(subscription)
+
+
+def publish_order_event(pair, order_data):
+    """executionReport 對應的掛單 / 取消 / 成交事件"""
+    status = order_data.get('status')
+    fields = {
+        'pair': pair,
+        'order_id': order_data.get('orderId'),
+        'side': order_data.get('side'),
+        'price': order_data.get('price'),
+        'quantity': order_data.get('origQty'),
+    }
+    if status == 'NEW':
+        publish('order_placed', **fields)
+    elif status in ('CANCELED', 'EXPIRED'):
+        publish('order_cancelled', **fields)
+    elif status in ('FILLED', 'PARTIALLY_FILLED'):
+        publish('fill', status=status, executed=order_data.get('executedQty'), **fields)
+
+
+def publish_balance_event(event):
+    """outboundAccountPosition -> 與 /balance/ 相同格式的 [{asset, free, locked}]"""
+    publish('balance', balances=[
+        {'asset': b['a'], 'free': b['f'], 'locked': b['l']} for b in event.get('B', [])
+    ])
+
+
+def publish_bot_state(bot):
+    publish(
+        'bot_state',
+        pair=bot.pair,
+        running=bot.is_running,
+        state=bot.get_manager_state() if bot.is_running else None,
+    )
@@ -0,0 +1,140 @@
+import os
+import json
+import math
+import logging
+import time
+import threading
+from pathlib import Path
+from .client import binance
+from .metrics import record_retry
+
+logger = logging.getLogger(__name__)
+
+# exchangeInfo 快取存活秒數與本地快照路徑
+EXCHANGE_INFO_TTL = int(os.getenv('EXCHANGE_INFO_TTL', 3600))
+EXCHANGE_INFO_SNAPSHOT = os.getenv(
+    'EXCHANGE_INFO_SNAPSHOT',
+    str(Path(__file__).resolve().parent.parent / 'exchange_info.json')
+)
+
+
+def _decimals(step):
+    """將 tickSize / minQty 轉為小數位數，例如 0.001 -> 3"""
+    step = float(step)
+    if step <= 0:
+        return 0
+    return int(round(-1 * math.log10(step)))
+
+
+def parse_symbol(symbol_info):
+    """把單一交易對的 filters 預先解析成扁平的 dict"""
+    info = {
+        'symbol': symbol_info['symbol'],
+        'status': symbol_info.get('status'),
+        'baseAsset': symbol_info.get('baseAsset'),
+        'quoteAsset': symbol_info.get('quoteAsset'),
+        'tickSize': None,
+        'precision': None,
+        'minQty': None,
+        'stepSize': None,
+        'min_qty_precision': None,
+        'min_notional': None,
+    }
+    for f in symbol_info.get('filters', []):
+        if f['filterType'] == 'PRICE_FILTER':
+            info['tickSize'] = float(f['tickSize'])
+            info['precision'] = _decimals(f['tickSize'])
+        elif f['filterType'] == 'LOT_SIZE':
+            info['minQty'] = float(f['minQty'])
+            info['stepSize'] = float(f['stepSize'])
+            info['min_qty_precision'] = _decimals(f['minQty'])
+        elif f['filterType'] == 'NOTIONAL':
+            info['min_notional'] = float(f['minNotional'])
+    return info
+
+
+class ExchangeInfoCache:
+    """exchangeInfo 共用快取：只解析一次並以 symbol 為 key，支援 TTL 與本地快照"""
+
+    def __init__(self, client=binance, ttl=EXCHANGE_INFO_TTL, snapshot_path=EXCHANGE_INFO_SNAPSHOT):
+        self.client = client
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.symbols = None
+        self.pairs = []
+        self.base_assets = []
+        self.fetched_at = 0
+        self._lock = threading.RLock()
+
+    def _index(self, symbols, fetched_at):
+        self.symbols = symbols
+        self.pairs = list(symbols)
+        self.base_assets = sorted({s['baseAsset'] for s in symbols.values() if s['status'] == 'TRADING'})
+        self.fetched_at = fetched_at
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            return snapshot['symbols'], snapshot['fetched_at']
+        except (OSError, ValueError, KeyError):
+            return None, 0
+
+    def _save_snapshot(self):
+        tmp_path = f'{self.snapshot_path}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'fetched_at': self.fetched_at, 'symbols': self.symbols}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.warning("寫入 exchangeInfo 快照失敗: %s", e)
+
+    def refresh(self):
+        """重新下載 exchangeInfo，失敗時沿用快照 (即使已過期)"""
+        with self._lock:
+            try:
+                response = self.client.public('GET', '/api/v3/exchangeInfo')
+                response.raise_for_status()
+                symbols = {s['symbol']: parse_symbol(s) for s in response.json()['symbols']}
+                self._index(symbols, time.time())
+                self._save_snapshot()
+            except Exception:
+                record_retry('/api/v3/exchangeInfo', 'refresh_failed')
+                if self.symbols is not None:
+                    # 保留舊資料，60 秒後再重試下載
+                    self.fetched_at = time.time() - self.ttl + 60
+                    return
+                symbols, fetched_at = self._load_snapshot()
+                if symbols is None:
+                    raise
+                self._index(symbols, time.time() - self.ttl + 60)
+
+    def _ensure_fresh(self):
+        if self.symbols is not None and time.time() - self.fetched_at < self.ttl:
+            return
+        with self._lock:
+            if self.symbols is None:
+                # 冷啟動優先使用未過期的本地快照
+                symbols, fetched_at = self._load_snapshot()
+                if symbols is not None and time.time() - fetched_at < self.ttl:
+                    self._index(symbols, fetched_at)
+                    return
+            if self.symbols is None or time.time() - self.fetched_at >= self.ttl:
+                self.refresh()
+
+    def get_symbol(self, symbol):
+        """取得單一交易對的預解析資訊，找不到時回傳 None"""
+        self._ensure_fresh()
+        return self.symbols.get(symbol)
+
+    def get_all_pairs(self):
+        self._ensure_fresh()
+        return self.pairs
+
+    def get_all_base_assets(self):
+        self._ensure_fresh()
+        return self.base_assets
+
+
+# 全域共用的 exchangeInfo 快取
+exchange_info = ExchangeInfoCache()
@@ -0,0 +1,50 @@
+import threading
+from decimal import Decimal
+
+
+class FeeAccumulator:
+    """以 orderId 累計 executionReport 每次成交的手續費 (n) 與手續費幣別 (N)"""
+
+    def __init__(self):
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    def add(self, report):
+        """累計一筆 executionReport，只處理執行類型為 TRADE 的推送"""
+        if report.get('x') != 'TRADE':
+            return
+
+        order_id = report.get('i')
+        trade_id = report.get('t')
+        with self._lock:
+            entry = self._orders.setdefault(order_id, {
+                'fee': Decimal(0),
+                'fee_symbol': None,
+                'qty': Decimal(0),
+                'trade_ids': set(),
+            })
+            # 斷線重連可能重送同一筆成交，以 trade id 去重
+            if trade_id in entry['trade_ids']:
+                return
+            entry['trade_ids'].add(trade_id)
+            entry['fee'] += Decimal(report.get('n') or 0)
+            entry['fee_symbol'] = report.get('N') or entry['fee_symbol']
+            entry['qty'] += Decimal(report.get('l') or 0)
+
+    def get(self, order_id, executed_qty):
+        """回傳 (fee, fee_symbol, complete)，complete 代表串流累計成交量與訂單累計成交量一致"""
+        with self._lock:
+            entry = self._orders.get(order_id)
+            if entry is None:
+                return Decimal(0), None, Decimal(executed_qty or 0) == 0
+            complete = entry['qty'] == Decimal(executed_qty or 0)
+            return entry['fee'], entry['fee_symbol'], complete
+
+    def pop(self, order_id):
+        """訂單結束 (FILLED / CANCELED) 後移除累計資料"""
+        with self._lock:
+            self._orders.pop(order_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._orders.clear()
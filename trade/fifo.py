@@ -0,0 +1,289 @@
+from decimal import Decimal, localcontext
+import numpy as np
+
+# Decimal 預設 context 為 28 位有效數字，超過時原本的 Decimal 計算會四捨五入
+DECIMAL_DIGITS_LIMIT = 10 ** 28
+# 向量化計算的 int64 安全上限 (保留一個 bit 給加總)
+INT64_LIMIT = 2 ** 62
+# Trade 的 DecimalField 小數位數，資料庫讀出的值必為 10^-10 的整數倍
+TRADE_DECIMAL_PLACES = 10
+# float 轉換可保證精確的上限
+FLOAT_EXACT_LIMIT = 2 ** 51
+
+
+def from_fixed(value, scale):
+    return Decimal(int(value)).scaleb(-scale)
+
+
+def fixed_column(values):
+    """Decimal 欄位轉為 10^-scale 單位的整數列表，scale 為欄位實際用到的小數位數 (交易對的定點精度)
+
+    小數位數不超過 TRADE_DECIMAL_PLACES 且放大後小於 2^51 時，經 float 放大再四捨五入必為精確整數
+    (相對誤差不超過 2^-52)，以 NumPy 一次轉換；另以總和核對，不符時改逐筆以分數轉換
+    """
+    if not values:
+        return [], 0
+    unit = 10 ** TRADE_DECIMAL_PLACES
+    scaled = np.fromiter(map(float, values), dtype=np.float64, count=len(values)) * unit
+    if np.abs(scaled).max() >= FLOAT_EXACT_LIMIT:
+        return exact_fixed_column(values)
+
+    fixed = np.rint(scaled).astype(np.int64)
+    with localcontext() as ctx:
+        ctx.prec = 80
+        exact = sum(values, Decimal(0)) * unit == sum(fixed.tolist())
+    if not exact:
+        return exact_fixed_column(values)
+
+    # 去掉整欄共同的尾數 0
+    scale = TRADE_DECIMAL_PLACES
+    divisor = int(np.gcd.reduce(fixed))
+    factor = 1
+    while scale > 0 and divisor and divisor % (factor * 10) == 0:
+        factor *= 10
+        scale -= 1
+    return (fixed // factor).tolist(), scale
+
+
+def exact_fixed_column(values):
+    """小數位數不固定時的轉換 (逐筆以分數計算)"""
+    ratios = [value.as_integer_ratio() for value in values]
+    denominators = {denominator for _, denominator in ratios}
+    scale = 0
+    for denominator in denominators:
+        while (10 ** scale) % denominator:
+            scale += 1
+    unit = 10 ** scale
+    return [numerator * (unit // denominator) for numerator, denominator in ratios], scale
+
+
+def within_digits(*values):
+    """Decimal 對這些值的運算不會發生進位捨入"""
+    for value in values:
+        if not -DECIMAL_DIGITS_LIMIT < value < DECIMAL_DIGITS_LIMIT:
+            return False
+    return True
+
+
+class FixedColumns:
+    """買賣單的數量 / 價格 / 手續費定點整數欄位
+
+    數量、價格、手續費各自使用買賣單共用的 scale；
+    價差 (數量 x 價格) 的單位為 10^-(qty_scale + price_scale)，
+    損益的單位 profit_scale 取價差與手續費兩者較細者
+    """
+
+    def __init__(self, buy_trades, sell_trades):
+        self.buy_count = len(buy_trades)
+        trades = list(buy_trades) + list(sell_trades)
+        quantity, self.qty_scale = fixed_column([trade.quantity for trade in trades])
+        price, self.price_scale = fixed_column([trade.price for trade in trades])
+        fee, self.fee_scale = fixed_column([trade.fee for trade in trades])
+        self.gain_scale = self.qty_scale + self.price_scale
+        self.profit_scale = max(self.gain_scale, self.fee_scale)
+        self.gain_shift = 10 ** (self.profit_scale - self.gain_scale)
+        self.fee_shift = 10 ** (self.profit_scale - self.fee_scale)
+        split = self.buy_count
+        self.buy_qty, self.sell_qty = quantity[:split], quantity[split:]
+        self.buy_price, self.sell_price = price[:split], price[split:]
+        self.buy_fee, self.sell_fee = fee[:split], fee[split:]
+
+    def decimal_step(self, profit, matched_qty, buy_qty, sell_price, buy_price, sell_fee, buy_fee):
+        """與原本 Decimal 版本完全相同的單步運算"""
+        matched = from_fixed(matched_qty, self.qty_scale)
+        profit += matched * (from_fixed(sell_price, self.price_scale) - from_fixed(buy_price, self.price_scale))
+        profit -= from_fixed(sell_fee, self.fee_scale)
+        profit -= from_fixed(buy_fee, self.fee_scale) * (matched / from_fixed(buy_qty, self.qty_scale))
+        return profit
+
+    def fits_int64(self):
+        """向量化計算的所有中間值都不會超出 int64"""
+        qty_max = max(map(abs, self.buy_qty + self.sell_qty), default=0)
+        price_max = max(map(abs, self.buy_price + self.sell_price), default=0)
+        fee_max = max(map(abs, self.buy_fee + self.sell_fee), default=0)
+        total_qty = max(sum(self.buy_qty), sum(self.sell_qty))
+        segments = len(self.buy_qty) + len(self.sell_qty)
+        bound = (
+            total_qty * 2 * price_max * self.gain_shift
+            + segments * 2 * fee_max * self.fee_shift
+        )
+        return total_qty < INT64_LIMIT and qty_max * 2 * price_max < INT64_LIMIT and bound < INT64_LIMIT
+
+
+def fifo_match(columns):
+    """以定點整數逐筆計算 FIFO 損益 (純 Python，數值超出 int64 時使用)
+
+    比例為 1 (買單整筆扣完) 或買單手續費為 0 時，原本 Decimal 的手續費攤提必為精確值，
+    以整數累加；其餘情況 (或數值超過 28 位有效數字) 該筆賣單剩下的步驟改用相同的 Decimal 運算
+    """
+    c = columns
+    buy_count = c.buy_count
+    consumed = [0] * buy_count
+    gains = [0] * buy_count
+    last_sell = [-1] * buy_count
+    profits = []
+    unmatched = []
+
+    buy_index = 0
+    current = -1
+    buy_qty = 0
+    buy_price = buy_fee = 0
+
+    for sell_index, sell_qty in enumerate(c.sell_qty):
+        sell_price = c.sell_price[sell_index]
+        sell_fee = c.sell_fee[sell_index]
+        sell_fee_shifted = sell_fee * c.fee_shift
+        profit = 0
+        exact = True
+
+        while sell_qty > 0:
+            if buy_qty <= 0:
+                if buy_index >= buy_count:
+                    break
+                current = buy_index
+                buy_qty, buy_price, buy_fee = c.buy_qty[buy_index], c.buy_price[buy_index], c.buy_fee[buy_index]
+                buy_index += 1
+                continue
+
+            matched_qty = sell_qty if sell_qty < buy_qty else buy_qty
+            gain = matched_qty * (sell_price - buy_price)
+            consumed[current] += matched_qty
+            gains[current] += gain
+            last_sell[current] = sell_index
+
+            if exact:
+                if matched_qty == buy_qty:
+                    fee_term = buy_fee * c.fee_shift
+                elif buy_fee == 0:
+                    fee_term = 0
+                else:
+                    fee_term = None
+                if fee_term is not None:
+                    after_gain = profit + gain * c.gain_shift
+                    after_sell_fee = after_gain - sell_fee_shifted
+                    after_buy_fee = after_sell_fee - fee_term
+                if fee_term is not None and within_digits(gain * c.gain_shift, after_gain, after_sell_fee, after_buy_fee):
+                    profit = after_buy_fee
+                else:
+                    exact = False
+                    profit = from_fixed(profit, c.profit_scale)
+
+            if not exact:
+                profit = c.decimal_step(profit, matched_qty, buy_qty, sell_price, buy_price, sell_fee, buy_fee)
+
+            sell_qty -= matched_qty
+            buy_qty -= matched_qty
+
+        profits.append(from_fixed(profit, c.profit_scale) if exact else profit)
+        unmatched.append(sell_qty)
+
+    return {
+        'profits': profits,
+        'unmatched': unmatched,
+        'consumed': consumed,
+        'gains': gains,
+        'last_sell': last_sell,
+        'buy_index': buy_index,
+        'buy_remaining': buy_qty,
+    }
+
+
+def fifo_match_vectorized(columns):
+    """NumPy 累積和版本：買單與賣單的累積數量切出所有對應區段，一次算完
+
+    每個區段 [x, x + m) 剛好對應一筆買單 k 與一筆賣單 j，等同原本迴圈中的一次 matched_qty；
+    買單剩餘量為 buy_cum[k] - x。需要按比例攤提手續費的賣單改以 Decimal 逐段重算
+    """
+    c = columns
+    buy_qty = np.array(c.buy_qty, dtype=np.int64)
+    sell_qty = np.array(c.sell_qty, dtype=np.int64)
+    buy_price = np.array(c.buy_price, dtype=np.int64)
+    sell_price = np.array(c.sell_price, dtype=np.int64)
+    buy_fee = np.array(c.buy_fee, dtype=np.int64)
+    sell_fee = np.array(c.sell_fee, dtype=np.int64)
+    buy_count, sell_count = len(buy_qty), len(sell_qty)
+
+    buy_cum = np.cumsum(buy_qty)
+    sell_cum = np.cumsum(sell_qty)
+    buy_total = int(buy_cum[-1]) if buy_count else 0
+    sell_total = int(sell_cum[-1]) if sell_count else 0
+    matched_total = min(buy_total, sell_total)
+
+    # 兩條累積數量合併排序後去重，即為所有區段的切點
+    points = np.sort(np.concatenate(([0], buy_cum, sell_cum)), kind='stable')
+    points = points[np.concatenate(([True], points[1:] != points[:-1]))]
+    points = points[points <= matched_total]
+    starts, lengths = points[:-1], np.diff(points)
+    k = np.searchsorted(buy_cum, starts, side='right')
+    j = np.searchsorted(sell_cum, starts, side='right')
+    remaining = buy_cum[k] - starts
+
+    gain = lengths * (sell_price[j] - buy_price[k])
+    whole = lengths == remaining
+    fee_term = np.where(whole, buy_fee[k], 0) * c.fee_shift
+    segment_profit = gain * c.gain_shift - sell_fee[j] * c.fee_shift - fee_term
+
+    # 區段依 j / k 遞增排列，以差分找出每筆賣單 / 買單的第一個區段再 reduceat 加總
+    sell_profit = np.zeros(sell_count, dtype=np.int64)
+    sell_matched = np.zeros(sell_count, dtype=np.int64)
+    consumed = np.zeros(buy_count, dtype=np.int64)
+    gains = np.zeros(buy_count, dtype=np.int64)
+    last_sell = np.full(buy_count, -1, dtype=np.int64)
+    tainted = []
+    if len(j):
+        sell_first = np.flatnonzero(np.concatenate(([True], j[1:] != j[:-1])))
+        sells = j[sell_first]
+        sell_profit[sells] = np.add.reduceat(segment_profit, sell_first)
+        sell_matched[sells] = np.add.reduceat(lengths, sell_first)
+        sell_end = np.append(sell_first[1:], len(j))
+        # 部分扣減且手續費不為 0 的區段無法以整數重現，該賣單依原本順序以 Decimal 重算
+        tainted = np.unique(np.searchsorted(sells, j[~whole & (buy_fee[k] != 0)])).tolist()
+
+        lot_first = np.flatnonzero(np.concatenate(([True], k[1:] != k[:-1])))
+        lots = k[lot_first]
+        consumed[lots] = np.add.reduceat(lengths, lot_first)
+        gains[lots] = np.add.reduceat(gain, lot_first)
+        last_sell[lots] = j[np.append(lot_first[1:], len(k)) - 1]
+
+    profit_exponent = -c.profit_scale
+    profits = [Decimal(profit).scaleb(profit_exponent) for profit in sell_profit.tolist()]
+    for position in tainted:
+        index = int(sells[position])
+        profit = Decimal('0')
+        for segment in range(int(sell_first[position]), int(sell_end[position])):
+            buy = int(k[segment])
+            profit = c.decimal_step(
+                profit, int(lengths[segment]), int(remaining[segment]),
+                c.sell_price[index], c.buy_price[buy], c.sell_fee[index], c.buy_fee[buy],
+            )
+        profits[index] = profit
+
+    # 迴圈結束時的游標：賣單總量超過買單時會把買單全部取完
+    if sell_total == 0:
+        buy_index, buy_remaining = 0, 0
+    elif sell_total > buy_total:
+        buy_index, buy_remaining = buy_count, 0
+    else:
+        lot = int(np.searchsorted(buy_cum, matched_total - 1, side='right'))
+        buy_index, buy_remaining = lot + 1, int(buy_cum[lot]) - matched_total
+
+    return {
+        'profits': profits,
+        'unmatched': (sell_qty - sell_matched).tolist(),
+        'consumed': consumed.tolist(),
+        'gains': gains.tolist(),
+        'last_sell': last_sell.tolist(),
+        'buy_index': buy_index,
+        'buy_remaining': buy_remaining,
+    }
+
+
+def fifo_from_trades(buy_trades, sell_trades):
+    """從 Trade (或具有 quantity / price / fee 屬性的物件) 列表計算 FIFO 損益
+
+    結果與 ledger.match_sells 的 Decimal 版本逐筆相同，回傳 (FixedColumns, 結果 dict)
+    """
+    columns = FixedColumns(buy_trades, sell_trades)
+    if columns.fits_int64():
+        return columns, fifo_match_vectorized(columns)
+    return columns, fifo_match(columns)
@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+
+def ladder(center, base_price, price_increase_percentage, price_decrease_percentage, trade_count, precision):
+    """產生目標網格 [(side, price)]：賣單在 center 之上、買單在 center 之下，每格間距為 base_price * 百分比"""
+    orders = []
+    for i in range(1, trade_count + 1):
+        orders.append(("SELL", round(center + base_price * price_increase_percentage * i, precision)))
+    for i in range(1, trade_count + 1):
+        orders.append(("BUY", round(center - base_price * price_decrease_percentage * i, precision)))
+    return orders
+
+
+def diff_ladder(target, live_orders, quantity):
+    """比對目標網格與交易所上的掛單 (GET /openOrders 的回傳格式)
+
+    以 (side, price) 配對價位，回傳:
+      cancel: 需要取消的 orderId (多出來的價位或無法改量的訂單)
+      amend:  [(orderId, newQty)]，同價位只需下修數量的訂單 (保留排隊順位)
+      place:  [(side, price)]，需要新掛的價位
+    """
+    quantity = Decimal(str(quantity))
+    live_by_level = {}
+    for order in live_orders:
+        key = (order['side'], Decimal(order['price']))
+        live_by_level.setdefault(key, []).append(order)
+
+    plan = {'cancel': [], 'amend': [], 'place': []}
+    for side, price in target:
+        orders = live_by_level.get((side, Decimal(str(price))))
+        if not orders:
+            plan['place'].append((side, price))
+            continue
+
+        order = orders.pop(0)
+        orig_qty = Decimal(order['origQty'])
+        executed_qty = Decimal(order.get('executedQty') or 0)
+        if orig_qty == quantity:
+            continue
+        if executed_qty < quantity < orig_qty:
+            plan['amend'].append((order['orderId'], quantity))
+        else:
+            plan['cancel'].append(order['orderId'])
+            plan['place'].append((side, price))
+
+    for orders in live_by_level.values():
+        plan['cancel'].extend(order['orderId'] for order in orders)
+    return plan
@@ -0,0 +1,694 @@
+import os
+import time
+import threading
+from collections import namedtuple
+from decimal import Decimal, ROUND_CEILING
+from datetime import datetime, timezone as dt_timezone
+from dotenv import load_dotenv
+from telegram import Bot
+from .models import Trade
+from .binance import get_symbol_info
+from .fees import FeeAccumulator
+from .ledger import TERMINAL_STATUSES, rebuild_pair
+from .grid import ladder, diff_ladder
+from .volatility import VolatilityGuard
+from .history_log import history_print
+from .metrics import observe_fill_reaction, record_retry
+from .events import publish, publish_order_event, publish_bot_state
+
+load_dotenv()
+
+# 載入 Binance 帳號 Email (API 金鑰由 client.py 統一載入)
+EMAIL = os.getenv('BINANCE_EMAIL')
+
+# 行情串流斷線時，以 REST 查價補做波動檢查的間隔秒數
+PRICE_CHECK_INTERVAL = float(os.getenv('PRICE_CHECK_INTERVAL', 30))
+
+# executionReport 推送欄位 -> REST /order 回傳欄位
+EXECUTION_REPORT_FIELDS = {
+    'orderId': 'i',
+    'symbol': 's',
+    'side': 'S',
+    'status': 'X',
+    'price': 'p',
+    'origQty': 'q',
+    'executedQty': 'z',
+    'updateTime': 'T',
+    'time': 'O',
+}
+
+# GridBot 流程交給執行端 (TradeWSManager / AsyncGridBot) 的 I/O 指令，執行結果以 send() 送回流程
+Request = namedtuple('Request', 'auth method path params')  # REST：auth 為 public / keyed / signed
+Parallel = namedtuple('Parallel', 'steps')  # 平行執行多個子流程，依序回傳結果 (例外以物件回傳)
+Blocking = namedtuple('Blocking', 'fn args')  # 同步阻塞呼叫 (ORM、exchangeInfo)，async 引擎交給執行緒
+Call = namedtuple('Call', 'fn args')  # 執行端掛勾或 coroutine (連線、Telegram)，回傳值可為 awaitable
+
+
+def exchange_time(epoch_ms):
+    """將交易所的 epoch 毫秒時間轉為 UTC aware datetime"""
+    if epoch_ms is None:
+        return None
+    return datetime.fromtimestamp(int(epoch_ms) / 1000, tz=dt_timezone.utc)
+
+def order_fields(report):
+    """executionReport 推送欄位轉為 REST /order 格式，缺少欄位時回傳 (None, 缺少的 key)"""
+    order_data = {}
+    for field, key in EXECUTION_REPORT_FIELDS.items():
+        value = report.get(key)
+        if value is None:
+            return None, key
+        order_data[field] = value
+    return order_data, None
+
+def trade_fields(data, fee, fee_symbol):
+    """訂單資料轉為 TradeWriter 寫入的 Trade 欄位"""
+    return {
+        'user_email': EMAIL,
+        'id': data.get('orderId'),
+        'pair': data.get('symbol'),
+        'action': data.get('side'),
+        'quantity': Decimal(data.get('executedQty', 0)),
+        'price': Decimal(data.get('price', 0)),
+        'fee': fee,
+        'fee_symbol': fee_symbol,
+        'trade_date': exchange_time(data.get('updateTime') or data.get('transactTime')) or datetime.now(dt_timezone.utc),
+        'trade_or_not': True if data.get('status') == 'FILLED' else False,
+        'status': data.get('status'),
+    }
+
+def pending_start_times(pending):
+    """{orderId: (symbol, 下單時間)} -> {symbol: 最早的下單時間}，作為 myTrades 的 startTime"""
+    symbols = {}
+    for order_id, (symbol, order_time) in pending.items():
+        start_time = symbols.get(symbol)
+        if order_time is not None and (start_time is None or order_time < start_time):
+            start_time = order_time
+        symbols[symbol] = start_time
+    return symbols
+
+def apply_trade_fees(symbol, pending, trades, trade_writer, log):
+    """以 myTrades 的成交明細補齊 pending 訂單的手續費，並重算該交易對損益 (同步 ORM)"""
+    # 先等 TradeWriter 把待寫入的訂單落地，避免 bulk_update 找不到資料
+    trade_writer.join()
+    fees = {}
+    for t in trades:
+        if t.get('orderId') not in pending:
+            continue
+        fee, _ = fees.get(t['orderId'], (Decimal(0), None))
+        fees[t['orderId']] = (fee + Decimal(t.get('commission', 0)), t.get('commissionAsset'))
+
+    rows = list(Trade.objects.filter(pk__in=[str(order_id) for order_id in fees]))
+    for row in rows:
+        row.fee, row.fee_symbol = fees[int(row.id)]
+    Trade.objects.bulk_update(rows, ['fee', 'fee_symbol'])
+    log(f"✅ 已補齊 {len(rows)} 筆訂單手續費 ({symbol})")
+    # 手續費變動會影響已算好的損益，重算該交易對 (僅在串流漏訊息時發生)
+    try:
+        rebuild_pair(EMAIL, symbol)
+    except Exception as e:
+        log(f"❌ 重算 {symbol} 損益失敗: {e}")
+
+async def send_telegram(message, log):
+    """發送 Telegram 通知 (適配 22.0 版本)"""
+    bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
+    chat_id = os.getenv('TELEGRAM_CHAT_ID')
+
+    if not bot_token or not chat_id:
+        log("❌ Telegram 配置缺失，無法發送通知")
+        return
+
+    try:
+        bot = Bot(token=bot_token)
+        await bot.send_message(chat_id=chat_id, text=message)
+        log(f"✅ 已發送 Telegram 通知: {message}")
+    except Exception as e:
+        log(f"❌ 發送 Telegram 通知失敗: {e}")
+
+
+class GridBot:
+    """單一交易對網格的決策邏輯，執行緒與 asyncio 兩種引擎共用
+
+    會用到 I/O 的方法都是 generator：yield Request / Parallel / Blocking / Call 指令，
+    由子類別的 run() 實際執行後把結果送回 (失敗時把例外丟回 yield 處)。子類別需提供：
+      run(steps) / spawn(steps)          執行流程 / 背景執行流程
+      connect() / disconnect()           啟動時建立、停止後釋放 user-data stream 等資源
+      schedule_price_check() / cancel_price_check()
+      run_guard_action(action, change_pct)
+    """
+
+    def __init__(self, trade_writer, market_data):
+        self.error_message = []  # 儲存錯誤訊息列表
+        self.pair = None
+        self.order_size = None
+        self.is_running = False
+        self.price_increase_percentage = None
+        self.price_decrease_percentage = None
+        self.start_time = None
+        self.sell_orders = []
+        self.buy_orders = []
+        self.user = None
+        self.precision = None
+        self.min_qty_precision = None
+        self.min_notional = None
+        self.volatility_guard = None
+        self.trade_count = None
+        self.origin_price = None
+        self.last_trade_price = None
+        self.price_cancel_cv = None
+        self.price_reset_cv = None
+        self.fee_accumulator = FeeAccumulator()
+        self.pending_fee_orders = {}  # 串流手續費不完整、待 myTrades 補齊的訂單
+        self.fee_lock = threading.Lock()
+        self.trade_writer = trade_writer
+        self.market_data = market_data
+        self.orders_lock = threading.Lock()  # 保護 buy_orders / sell_orders 的並行寫入
+        self.last_update_summary = None  # 最近一次 update 異動的訂單數
+
+    def on_execution_report(self, response):
+        """處理單筆 executionReport (由 BotRegistry / AsyncEngine 依 symbol 分派)"""
+        order_id = response.get('i')
+        self.fee_accumulator.add(response)
+        order_data = yield from self.order_from_execution_report(response)
+
+        #  檢查訂單資料是否取得成功
+        if not order_data:
+            self.history_print(f"無法取得訂單資料 (ID: {order_id}），略過處理")
+            return
+
+        self.history_print("==訂單更新==")
+        self.history_print(order_data, event='order_update', order_id=order_id)
+        try:
+            publish_order_event(self.pair, order_data)
+        except Exception as e:
+            # 推送只影響前端即時顯示，不能中斷成交處理與補單
+            self.history_print(f"❌ 推送訂單事件失敗: {e}")
+        if order_data.get('status') == 'NEW':
+            self.history_print('新建訂單')
+            return
+
+        if order_data.get('status') == "CANCELED":
+            self.history_print('取消訂單', event='order_cancelled', order_id=order_id)
+            if Decimal(order_data.get('executedQty') or 0) > 0:
+                # 部分成交後取消：保存最終成交量，已成交的部分一樣計入損益
+                yield from self.save_order(order_data)
+            else:
+                self.fee_accumulator.pop(order_id)
+            return
+
+        yield from self.save_order(order_data)
+
+        if order_data.get('status') == 'FILLED':
+            order_id = order_data.get('orderId')
+            if order_id in self.sell_orders:
+                self.history_print("==賣單成交==", event='fill', order_id=order_id)
+                # 補單的買單與賣單互不相依，平行送出
+                yield from self.place_orders([
+                    ("BUY", self.last_trade_price),
+                    ("SELL", self.last_trade_price + self.origin_price * self.price_increase_percentage * (len(self.sell_orders) + 1)),
+                ])
+                self.forget_order(self.sell_orders, order_id)
+            elif order_id in self.buy_orders:
+                self.history_print("==買單成交==", event='fill', order_id=order_id)
+                yield from self.place_orders([
+                    ("BUY", self.last_trade_price - self.origin_price * self.price_decrease_percentage * (len(self.buy_orders) + 1)),
+                    ("SELL", self.last_trade_price),
+                ])
+                self.forget_order(self.buy_orders, order_id)
+            else:
+                return
+            self.last_trade_price = float(order_data.get('price'))
+            # 補單送出完成的時間與交易所推送事件時間的差距
+            observe_fill_reaction(self.pair, response.get('E'))
+
+    def start(self, pair, order_size, price_increase_percentage, price_decrease_percentage, user, trade_count, price_reset_cv, price_cancel_cv):
+        if self.is_running:
+            return "機器人運作中"
+
+        try:
+            # exchangeInfo 快取可能打 REST
+            symbol_info = yield Blocking(get_symbol_info, (pair,))
+            if symbol_info is None:
+                self.error_message.append(f"找不到交易對資訊: {pair}")
+                return "\n".join(self.error_message)
+            # 設定價格精度（price tick size）、最小下單精度與最小下單金額
+            self.precision = symbol_info['precision']
+            self.tickSize = symbol_info['tickSize']
+            self.min_qty_precision = symbol_info['min_qty_precision']
+            self.min_notional = symbol_info['min_notional']
+
+        except Exception as e:
+            self.error_message.append(f"取得交易對精度失敗: {e}")
+            return "\n".join(self.error_message)
+
+        self.error_message = []  # 清空錯誤訊息列表
+        self.pair = pair
+        self.order_size = order_size
+        self.price_increase_percentage = price_increase_percentage
+        self.price_decrease_percentage = price_decrease_percentage
+        self.start_time = datetime.now().isoformat(timespec='seconds') + "Z"
+        self.user = user
+        self.price_reset_cv = price_reset_cv
+        self.price_cancel_cv = price_cancel_cv
+        self.trade_count = trade_count
+        self.trade_writer.start()
+
+        # 共用的 stream 已連線時直接返回 None
+        error = yield Call(self.connect, ())
+        if error:
+            self.error_message.append(error)
+            return "\n".join(self.error_message)
+
+        # 訂閱行情串流，之後查價直接讀記憶體
+        self.market_data.subscribe(pair)
+        yield Call(self.market_data.wait_for_price, (pair,))
+
+        self.is_running = True
+        yield from self.place_initial_orders()
+        if self.is_running:
+            self.start_price_timer()
+            publish_bot_state(self)
+
+        # 如果有錯誤訊息，返回它們
+        if self.error_message:
+            return "\n".join(self.error_message)
+
+        return 0  # 成功時返回 0
+
+    def update(self, order_size, price_increase_percentage, price_decrease_percentage, trade_count, price_reset_cv, price_cancel_cv, incremental=True):
+        if not self.is_running:
+            return '機器人未運行'
+        self.error_message = []  # 清空錯誤訊息列表
+        self.order_size = order_size
+        self.price_increase_percentage = price_increase_percentage
+        self.price_decrease_percentage = price_decrease_percentage
+        self.trade_count = trade_count
+        self.price_reset_cv = price_reset_cv
+        self.price_cancel_cv = price_cancel_cv
+        self.start_time = datetime.now().isoformat(timespec='seconds') + "Z"
+        summary = (yield from self.update_ladder_incremental()) if incremental else None
+        if summary is None:
+            # 全部取消後重新掛單
+            result = yield from self.cancel_all_orders()
+            yield from self.place_initial_orders()
+            summary = {
+                'cancelled': len(result['cancelled']),
+                'amended': 0,
+                'placed': len(self.buy_orders) + len(self.sell_orders),
+            }
+        summary['touched'] = summary['cancelled'] + summary['amended'] + summary['placed']
+        self.last_update_summary = summary
+        self.history_print(f"🔧 網格更新完成: {summary}")
+        self.start_price_timer()
+        publish_bot_state(self)
+        return "\n".join(self.error_message) if self.error_message else 0
+
+    def update_ladder_incremental(self):
+        """只取消、改量或新增與目標網格不同的價位；無法取得掛單時回傳 None 改走全部重掛"""
+        if self.last_trade_price is None or self.origin_price is None:
+            return None
+
+        response = yield Request('signed', 'GET', '/api/v3/openOrders', {'symbol': self.pair})
+        if response.status_code != 200:
+            self.history_print(f"⚠️ 無法取得掛單列表，改為全部重掛: {response.text}")
+            record_retry('/api/v3/openOrders', 'full_relayout')
+            return None
+
+        target = ladder(
+            self.last_trade_price, self.origin_price,
+            self.price_increase_percentage, self.price_decrease_percentage,
+            self.trade_count, self.precision,
+        )
+        live_orders = {order['orderId']: order for order in response.json()}
+        plan = diff_ladder(target, live_orders.values(), self.order_size)
+
+        cancel_results = yield Parallel([self.cancel_order(order_id) for order_id in plan['cancel']])
+        cancelled = {o for o, ok in zip(plan['cancel'], cancel_results) if ok is True}
+
+        amend_results = yield Parallel([self.amend_order(order_id, qty) for order_id, qty in plan['amend']])
+        amended = 0
+        for (order_id, _), ok in zip(plan['amend'], amend_results):
+            if ok is True:
+                amended += 1
+            elif (yield from self.cancel_order(order_id)):
+                # 改量失敗則改為取消後重掛
+                record_retry('/api/v3/order/amend/keepPriority', 'cancel_and_replace')
+                cancelled.add(order_id)
+                live = live_orders[order_id]
+                plan['place'].append((live['side'], float(live['price'])))
+
+        self.forget_orders(cancelled)
+
+        place_results = yield from self.place_orders(plan['place'])
+        placed = sum(1 for order_id in place_results if order_id is not None and not isinstance(order_id, Exception))
+
+        return {'cancelled': len(cancelled), 'amended': amended, 'placed': placed}
+
+    def amend_order(self, order_id, new_qty):
+        """以 keepPriority 下修訂單數量 (保留排隊順位)"""
+        response = yield Request('signed', 'PUT', '/api/v3/order/amend/keepPriority', {
+            'symbol': self.pair,
+            'orderId': order_id,
+            'newQty': str(new_qty),
+        })
+        if response.status_code == 200:
+            self.history_print(f"✅ 訂單 {order_id} 數量已改為 {new_qty}")
+            return True
+        self.history_print(f"⚠️ 訂單 {order_id} 改量失敗: {response.text}")
+        return False
+
+    def unexpected_stop(self):
+        yield from self.cancel_all_orders()
+        yield from self.shutdown()
+
+        # 發送 Telegram 通知
+        yield Call(send_telegram, (f"交易機器人已停止運行 ({self.pair})", self.history_print))
+
+        return "\n".join(self.error_message) if self.error_message else 0
+
+    def stop(self):
+        if not self.is_running:
+            return '機器人未運行'
+        self.history_print("⏳ 停止交易機器人中...")
+        self.error_message = []  # 清空錯誤訊息列表
+        return (yield from self.unexpected_stop())
+
+    def shutdown(self):
+        """停止查價計時並取消行情訂閱，再交由執行端釋放 stream / writer"""
+        self.cancel_price_check()
+        self.volatility_guard = None
+        self.market_data.unsubscribe(self.pair)
+        self.is_running = False
+        self.history_print("機器人已停止")
+        publish_bot_state(self)
+        yield Call(self.disconnect, ())
+
+    def get_manager_state(self):
+        return {
+            "pair": self.pair,
+            "order_size": self.order_size,
+            "price_up_percentage": self.price_increase_percentage * 100,
+            "price_down_percentage": self.price_decrease_percentage * 100,
+            "start_time": self.start_time,
+            "trade_count": self.trade_count,
+            "price_reset_cv": self.price_reset_cv * 100,
+            "price_cancel_cv" : self.price_cancel_cv * 100,
+        }
+
+    def order_from_execution_report(self, report):
+        """由 executionReport 推送欄位組出訂單資料，欄位缺漏時才退回 REST 查詢"""
+        order_data, missing = order_fields(report)
+        if order_data is None:
+            self.history_print(f"executionReport 缺少欄位 {missing}，改用 REST 查詢訂單 (ID: {report.get('i')})")
+            return (yield from self.get_order_data(report.get('i')))
+        return order_data
+
+    def get_order_data(self, order_id):
+        """使用 Binance API 查詢單筆訂單資訊"""
+        try:
+            response = yield Request('signed', 'GET', '/api/v3/order', {'symbol': self.pair, 'orderId': order_id})
+            data = response.json()
+            if response.status_code == 200 and "orderId" in data:
+                return data
+            else:
+                self.history_print(f"❌ 查詢訂單失敗: {data}")
+                return {}
+        except Exception as e:
+            self.history_print(f"❌ get_order_data 發生錯誤: {e}")
+            return {}
+
+    def get_current_price(self):
+        """優先讀取行情串流的最新價格，串流過期或未連線時才以 REST 查價"""
+        price = self.market_data.get_price(self.pair)
+        if price is not None:
+            return price
+        response = yield Request('public', 'GET', '/api/v3/ticker/price', {'symbol': self.pair})
+        data = response.json()
+        return float(data["price"])
+
+    def place_orders(self, orders):
+        """平行送出多筆 (side, price)，依輸入順序回傳結果；單筆例外不影響其他請求"""
+        return (yield Parallel([self.place_order(action, price) for action, price in orders]))
+
+    def place_order(self, action, price):
+        params = {
+            "symbol": self.pair,
+            "side": action.upper(),
+            "type": "LIMIT",
+            "timeInForce": "GTC",
+            "quantity": str(self.order_size),
+            "price": str(round(price, self.precision)),
+        }
+
+        response = yield Request('signed', 'POST', '/api/v3/order', params)
+
+        if response.status_code == 200:
+            order_id = response.json().get("orderId")
+
+            with self.orders_lock:
+                if action == 'BUY':
+                    self.buy_orders.append(order_id)
+                elif action == 'SELL':
+                    self.sell_orders.append(order_id)
+
+            msg = f"✅ {action} 限價單建立成功: 價格 {str(round(price, self.precision))}, 訂單 ID: {order_id}"
+            self.history_print(msg, event='order_placed', order_id=order_id)
+            return order_id
+        else:
+            error_info = response.json()
+            self.history_print(error_info)
+            if error_info.get('msg') == 'Filter failure: NOTIONAL':
+                current_price = yield from self.get_current_price()
+                value = Decimal(str(self.min_notional)) / Decimal(str(current_price))
+                min_qty_required = value.quantize(Decimal(f'1e-{self.min_qty_precision}'), rounding=ROUND_CEILING)
+                error_info = f'最小下單數量: {min_qty_required}'
+            error_msg = f"下單失敗: {error_info}"
+            self.history_print(error_msg)
+            with self.orders_lock:
+                if error_msg not in self.error_message : self.error_message.append(error_msg)
+            return None
+
+    def place_initial_orders(self):
+        current_price = yield from self.get_current_price()
+        self.origin_price = current_price
+        self.last_trade_price = current_price
+
+        self.history_print(f"📈 當前價格: {current_price}")
+
+        orders = ladder(
+            current_price, current_price,
+            self.price_increase_percentage, self.price_decrease_percentage,
+            self.trade_count, self.precision,
+        )
+
+        # 各價位掛單互不相依，平行送出 (執行緒引擎上限 ORDER_CONCURRENCY)
+        yield from self.place_orders(orders)
+
+        if (len(self.sell_orders) == 0) and (len(self.buy_orders) == 0):
+            error_msg = "初始掛單全部失敗，請檢查 API 金鑰/網路/參數/餘額 等問題"
+            yield from self.unexpected_stop()
+            self.error_message.append(error_msg)
+            self.history_print(f"❌ {error_msg}")
+
+    def cancel_all_orders(self):
+        """以 DELETE /openOrders 一次取消交易對所有掛單，失敗時退回平行逐筆取消
+
+        回傳 {'cancelled': [...], 'failed': [...]}，並依結果更新 buy_orders / sell_orders
+        """
+        response = yield Request('signed', 'DELETE', '/api/v3/openOrders', {'symbol': self.pair})
+
+        try:
+            res_data = response.json()
+        except Exception:
+            res_data = {}
+
+        if response.status_code == 200 and isinstance(res_data, list):
+            result = {'cancelled': [], 'failed': []}
+            for order in res_data:
+                # OCO 訂單會以 orderReports 回傳其下各筆訂單
+                for report in order.get('orderReports', [order]):
+                    if report.get('orderId') is not None:
+                        result['cancelled'].append(report['orderId'])
+        elif isinstance(res_data, dict) and res_data.get('code') == -2011:
+            # 交易所上已沒有任何掛單
+            result = {'cancelled': [], 'failed': []}
+            with self.orders_lock:
+                self.buy_orders.clear()
+                self.sell_orders.clear()
+        else:
+            self.history_print(f"⚠️ 批次取消失敗，改為逐筆取消: {res_data}")
+            record_retry('/api/v3/openOrders', 'cancel_one_by_one')
+            result = yield from self.cancel_orders_parallel()
+            if result is None:
+                return {'cancelled': [], 'failed': []}
+
+        cancelled = set(result['cancelled'])
+        self.forget_orders(cancelled)
+
+        if result['failed']:
+            self.history_print(f"❌ 取消訂單失敗: {result['failed']}")
+        else:
+            self.history_print(f'訂單全部取消成功 (共 {len(cancelled)} 筆)')
+        return result
+
+    def cancel_orders_parallel(self):
+        """列出掛單後平行逐筆取消，無法取得掛單列表時回傳 None"""
+        response = yield Request('signed', 'GET', '/api/v3/openOrders', {'symbol': self.pair})
+
+        if response.status_code != 200:
+            error_msg = f"❌ 無法取得掛單列表: {response.text}"
+            self.error_message.append(error_msg)
+            self.history_print(error_msg)
+            return None
+
+        order_ids = [order.get("orderId") for order in response.json()]
+        results = yield Parallel([self.cancel_order(order_id) for order_id in order_ids])
+        return {
+            'cancelled': [o for o, ok in zip(order_ids, results) if ok is True],
+            'failed': [o for o, ok in zip(order_ids, results) if ok is not True],
+        }
+
+    def cancel_order(self, order_id):
+        if order_id is None:
+            return False
+
+        response = yield Request('signed', 'DELETE', '/api/v3/order', {'symbol': self.pair, 'orderId': order_id})
+
+        try:
+            res_data = response.json()
+        except Exception:
+            res_data = {}
+
+        if response.status_code == 200 and not res_data.get("code"):
+            self.history_print(f"✅ 訂單 {order_id} 取消成功", event='order_cancelled', order_id=order_id)
+            return True
+        else:
+            error_msg = f"❌ 訂單 {order_id} 取消失敗: {res_data}"
+            with self.orders_lock:
+                self.error_message.append(error_msg)
+            self.history_print(error_msg)
+            return False
+
+    def forget_order(self, orders, order_id):
+        with self.orders_lock:
+            try:
+                orders.remove(order_id)
+            except ValueError:
+                pass  # 補單期間已被取消流程移除
+
+    def forget_orders(self, order_ids):
+        with self.orders_lock:
+            self.buy_orders[:] = [o for o in self.buy_orders if o not in order_ids]
+            self.sell_orders[:] = [o for o in self.sell_orders if o not in order_ids]
+
+    def save_order(self, data):
+        order_id = data.get('orderId')
+        symbol = data.get('symbol')
+
+        fee, fee_symbol, complete = self.fee_accumulator.get(order_id, data.get('executedQty'))
+        if not complete:
+            # 串流漏掉部分成交推送，先存目前累計值，之後以 myTrades 批次補齊
+            self.history_print(f"⚠️ 訂單 {order_id} 串流手續費不完整，排入補齊")
+            with self.fee_lock:
+                self.pending_fee_orders[order_id] = (symbol, data.get('time'))
+
+        # 交由背景 TradeWriter 批次寫入，成交處理不等待資料庫；
+        # 佇列滿時才改為阻塞等待 (async 引擎在執行緒中等待，不卡住事件迴圈)
+        row = trade_fields(data, fee, fee_symbol)
+        if not self.trade_writer.offer(row):
+            yield Blocking(self.trade_writer.submit, (row,))
+
+        if data.get('status') == 'FILLED' or data.get('status') in TERMINAL_STATUSES:
+            self.fee_accumulator.pop(order_id)
+            if self.pending_fee_orders:
+                self.spawn(self.reconcile_fees())
+
+    def reconcile_fees(self):
+        """以每個交易對一次 myTrades 查詢，批次補齊串流漏掉的手續費"""
+        with self.fee_lock:
+            pending = dict(self.pending_fee_orders)
+            self.pending_fee_orders.clear()
+
+        for symbol, start_time in pending_start_times(pending).items():
+            trades = yield from self.get_my_trades(symbol, start_time)
+            if trades is None:
+                # 查詢失敗，放回待補齊清單下次再試
+                record_retry('/api/v3/myTrades', 'requeue')
+                with self.fee_lock:
+                    for order_id, value in pending.items():
+                        if value[0] == symbol:
+                            self.pending_fee_orders.setdefault(order_id, value)
+                continue
+            yield Blocking(apply_trade_fees, (symbol, pending, trades, self.trade_writer, self.history_print))
+
+    def get_my_trades(self, symbol, start_time=None):
+        """查詢 Binance 成交明細 (單次最多 1000 筆)，失敗時回傳 None"""
+        try:
+            params = {'symbol': symbol, 'limit': 1000}
+            if start_time is not None:
+                params['startTime'] = start_time
+            response = yield Request('signed', 'GET', '/api/v3/myTrades', params)
+
+            if response.status_code == 200:
+                return response.json()
+            self.history_print(f"查詢成交明細失敗: {response.text}")
+        except Exception as e:
+            self.history_print(f"取得成交明細錯誤: {e}")
+        return None
+
+    def start_price_timer(self):
+        """依目前的 price_reset_cv / price_cancel_cv 建立波動風控，每筆行情報價都檢查一次
+
+        行情串流斷線時收不到報價，另由執行端每 PRICE_CHECK_INTERVAL 秒執行 check_price 以 REST 補檢查
+        """
+        self.cancel_price_check()
+        self.volatility_guard = VolatilityGuard(
+            self.price_reset_cv,
+            self.price_cancel_cv,
+            on_reset=self.on_volatility_reset,
+            on_cancel=self.on_volatility_cancel,
+            runner=self.run_guard_action,
+        )
+        self.market_data.subscribe(self.pair, self.on_price_tick)
+        self.schedule_price_check()
+
+    def check_price(self):
+        if self.is_running and self.market_data.get_price(self.pair) is None:
+            price = yield from self.get_current_price()
+            self.on_price_tick(self.pair, price, time.monotonic())
+
+    def on_price_tick(self, symbol, price, ts):
+        guard = self.volatility_guard
+        if guard is not None and self.is_running:
+            guard.on_tick(symbol, price, ts)
+
+    def on_volatility_reset(self, change_pct):
+        # 風控在背景執行，期間可能已被 stop / shutdown 清掉 volatility_guard
+        guard = self.volatility_guard
+        if guard is None or not self.is_running:
+            return
+        window = int(guard.window.seconds)
+        self.history_print(f"⚠️ 價格在 {window} 秒內變動 {round(change_pct*100, 2)}%，超過風控重設值，重新掛單", event='guard_reset')
+        publish('guard', pair=self.pair, action='reset', change=change_pct)
+        # 取消掛單
+        yield from self.cancel_all_orders()
+        if not self.is_running:
+            return  # 取消期間機器人已停止，不再重新掛單
+        # 重新掛單
+        yield from self.place_initial_orders()
+        guard.rearm()
+
+    def on_volatility_cancel(self, change_pct):
+        guard = self.volatility_guard
+        if guard is None or not self.is_running:
+            return
+        window = int(guard.window.seconds)
+        self.history_print(f"⚠️ 價格在 {window} 秒內變動 {round(change_pct*100, 2)}%，超過風控中斷值，取消掛單", event='guard_cancel')
+        publish('guard', pair=self.pair, action='cancel', change=change_pct)
+        yield from self.stop()
+
+    def history_print(self, txt, event=None, order_id=None):
+        # 只放入記錄佇列，檔案與 console 輸出由背景執行緒批次處理
+        # 多交易對同時運行時以交易對前綴區分
+        if self.pair:
+            txt = f"[{self.pair}] {txt}"
+        history_print(txt, pair=self.pair, event=event, order_id=order_id)
@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+HISTORY_LOG_FILE = os.getenv('HISTORY_LOG_FILE', 'debug.txt')
+HISTORY_LOG_MAX_BYTES = int(os.getenv('HISTORY_LOG_MAX_BYTES', 10 * 1024 * 1024))
+HISTORY_LOG_BACKUP_COUNT = int(os.getenv('HISTORY_LOG_BACKUP_COUNT', 5))
+# 設為 1 時以 JSON lines 輸出 (含 event / pair / order_id)
+HISTORY_LOG_JSON = os.getenv('HISTORY_LOG_JSON', '0') == '1'
+# 檔案寫入最多累積多久才 flush 一次
+HISTORY_LOG_FLUSH_INTERVAL = float(os.getenv('HISTORY_LOG_FLUSH_INTERVAL', 1.0))
+
+
+class TextFormatter(logging.Formatter):
+    """沿用 debug.txt 原本的 `時間 : 訊息` 格式"""
+
+    def format(self, record):
+        return f'{datetime.fromtimestamp(record.created)} : {record.getMessage()}'
+
+
+class JsonLineFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({
+            'ts': datetime.fromtimestamp(record.created).isoformat(),
+            'event': getattr(record, 'event', None),
+            'pair': getattr(record, 'pair', None),
+            'order_id': getattr(record, 'order_id', None),
+            'message': record.getMessage(),
+        }, ensure_ascii=False, default=str)
+
+
+class BatchingRotatingFileHandler(RotatingFileHandler):
+    """依大小輪替的檔案 handler，寫入先進緩衝區，最多每 flush_interval 秒才 flush 一次"""
+
+    def __init__(self, *args, flush_interval=HISTORY_LOG_FLUSH_INTERVAL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._last_flush = now
+            super().flush()
+
+    def close(self):
+        self._last_flush = 0
+        super().close()
+
+
+class FlushingQueueListener(QueueListener):
+    """佇列閒置時也定期 flush，避免最後幾行一直停在緩衝區"""
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block=block, timeout=HISTORY_LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+
+def _build_listener(log_queue):
+    file_handler = BatchingRotatingFileHandler(
+        HISTORY_LOG_FILE,
+        maxBytes=HISTORY_LOG_MAX_BYTES,
+        backupCount=HISTORY_LOG_BACKUP_COUNT,
+        encoding='utf-8',
+        delay=True,
+    )
+    file_handler.setFormatter(JsonLineFormatter() if HISTORY_LOG_JSON else TextFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(message)s'))
+    return FlushingQueueListener(log_queue, file_handler, console_handler, respect_handler_level=False)
+
+
+_log_queue = queue.SimpleQueue()
+_listener = _build_listener(_log_queue)
+_listener.start()
+atexit.register(_listener.stop)
+
+history_logger = logging.getLogger('trade.history')
+history_logger.setLevel(logging.INFO)
+history_logger.propagate = False
+history_logger.addHandler(QueueHandler(_log_queue))
+
+
+def history_print(txt, pair=None, event=None, order_id=None):
+    """記錄交易歷程：呼叫端只需放入佇列，檔案與 console 輸出由背景執行緒處理"""
+    history_logger.info(txt, extra={'pair': pair, 'event': event, 'order_id': order_id})
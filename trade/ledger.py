@@ -0,0 +1,250 @@
+import logging
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Length
+from .models import Trade, PnlLedger, RealizedProfit, SpotTrade
+from .fifo import fifo_from_trades, from_fixed
+
+LOT_UPDATE_FIELDS = ['open_position', 'sold_price', 'sold_or_not', 'profit']
+
+logger = logging.getLogger(__name__)
+
+# 已結束但可能有部分成交的訂單狀態，已成交的數量一樣計入損益
+TERMINAL_STATUSES = ('CANCELED', 'EXPIRED', 'EXPIRED_IN_MATCH')
+
+
+def fill_key(trade_date, trade_id):
+    """成交順序：trade_date 相同時依 orderId 數值排序 (id 為字串欄位，先比長度再比字串)"""
+    trade_id = str(trade_id)
+    return (trade_date, len(trade_id), trade_id)
+
+
+def is_fill(row):
+    """TradeWriter 寫入的欄位是否為成交：完全成交，或取消 / 過期前已部分成交"""
+    return bool(row.get('trade_or_not')) or (row.get('status') in TERMINAL_STATUSES and row.get('quantity', 0) > 0)
+
+
+def filled_trades(email, pair, action):
+    """有成交的訂單 (同 is_fill)，依 fill_key 排序確保重算與增量更新順序一致"""
+    return Trade.objects.filter(
+        Q(trade_or_not=True) | Q(status__in=TERMINAL_STATUSES, quantity__gt=0),
+        user_email=email, pair=pair, action=action,
+    ).annotate(id_length=Length('id')).order_by('trade_date', 'id_length', 'id')
+
+
+def after(queryset, trade_date, trade_id):
+    """filled_trades 中排在 (trade_date, id) 之後的資料 (keyset)"""
+    trade_id = str(trade_id)
+    return queryset.filter(
+        Q(trade_date__gt=trade_date)
+        | Q(trade_date=trade_date, id_length__gt=len(trade_id))
+        | Q(trade_date=trade_date, id_length=len(trade_id), id__gt=trade_id)
+    )
+
+
+def match_sells(ledger, sells, next_buy, consumed=None):
+    """以 ledger 的游標對賣單做 FIFO 對應，回傳 [(賣單, 損益, 未對應數量)] 並推進游標
+
+    next_buy() 回傳下一筆買單，沒有時回傳 None；
+    手續費的扣法沿用原本 get_trades_by_pair 的計算方式。
+    consumed 若有給，記錄每筆買單被扣減的 (數量, 最後賣價, 價差)
+    """
+    results = []
+    buy = ledger.buy_trade
+    buy_qty = ledger.buy_remaining
+
+    for sell in sells:
+        sell_qty = sell.quantity
+        sell_price = sell.price
+        profit = Decimal('0')
+
+        while sell_qty > 0:
+            if buy_qty <= 0:
+                next_lot = next_buy()
+                if next_lot is None:
+                    break
+                buy = next_lot
+                buy_qty = buy.quantity
+                continue
+
+            matched_qty = min(sell_qty, buy_qty)
+            if consumed is not None:
+                qty, _, gain = consumed.get(buy.id, (Decimal('0'), None, Decimal('0')))
+                consumed[buy.id] = (qty + matched_qty, sell_price, gain + matched_qty * (sell_price - buy.price))
+            profit += matched_qty * (sell_price - buy.price)
+            profit -= sell.fee
+            profit -= buy.fee * (matched_qty / buy_qty)
+            sell_qty -= matched_qty
+            buy_qty -= matched_qty
+
+        if sell_qty > 0:
+            logger.warning("異常 : 出現未匹配的賣出單據 (訂單 %s，未匹配數量 %s)", sell.id, sell_qty)
+
+        results.append((sell, profit, sell_qty))
+        ledger.last_sell_date = sell.trade_date
+        ledger.last_sell_id = sell.id
+
+    ledger.buy_trade = buy
+    ledger.buy_remaining = buy_qty
+    return results
+
+
+def lot_from_trade(trade):
+    return SpotTrade(
+        user_email=trade.user_email,
+        id=trade.id,
+        pair=trade.pair,
+        quantity=trade.quantity,
+        price=trade.price,
+        open_position=trade.quantity,
+        fee=trade.fee,
+        fee_symbol=trade.fee_symbol,
+        trade_date=trade.trade_date,
+    )
+
+
+def consume_lots(lots, consumed):
+    """依 FIFO 對應結果扣減 open lot，lots 為 {買單 id: SpotTrade}"""
+    for buy_id, (qty, sold_price, gain) in consumed.items():
+        lot = lots.get(buy_id)
+        if lot is None:
+            continue  # 建立 open lot 之前的舊買單，需以 rebuild_ledger 補齊
+        lot.open_position -= qty
+        lot.sold_price = sold_price
+        lot.profit += gain
+        lot.sold_or_not = lot.open_position <= 0
+    return [lots[buy_id] for buy_id in consumed if buy_id in lots]
+
+
+def apply_new_sells(email, pair, touched=None):
+    """成交寫入後呼叫：只處理游標之後新成交的賣單，不重算歷史；touched 若有給，加入被扣減的 lot id"""
+    with transaction.atomic():
+        ledger, _ = PnlLedger.objects.select_for_update().select_related('buy_trade').get_or_create(
+            user_email=email, pair=pair
+        )
+        sells = filled_trades(email, pair, 'SELL')
+        if ledger.last_sell_id is not None:
+            sells = after(sells, ledger.last_sell_date, ledger.last_sell_id)
+        sells = list(sells)
+        if not sells:
+            return 0
+
+        buys = filled_trades(email, pair, 'BUY')
+        current = ledger.buy_trade
+
+        def next_buy():
+            nonlocal current
+            queryset = buys if current is None else after(buys, current.trade_date, current.id)
+            next_lot = queryset.first()
+            if next_lot is not None:
+                current = next_lot
+            return next_lot
+
+        consumed = {}
+        results = [
+            RealizedProfit(trade=sell, profit=profit, unmatched_qty=unmatched)
+            for sell, profit, unmatched in match_sells(ledger, sells, next_buy, consumed)
+        ]
+        RealizedProfit.objects.bulk_create(
+            results, update_conflicts=True, unique_fields=['trade'], update_fields=['profit', 'unmatched_qty']
+        )
+        lots = consume_lots(SpotTrade.objects.in_bulk(list(consumed)), consumed)
+        SpotTrade.objects.bulk_update(lots, LOT_UPDATE_FIELDS)
+        ledger.save()
+        if touched is not None:
+            touched.extend(lot.id for lot in lots)
+        return len(results)
+
+
+def out_of_order(ledger, fills):
+    """是否有成交排在 ledger 游標之前 (晚到的推送或補寫)，增量更新會漏掉它們
+
+    賣單早於已處理的最後一筆賣單，或買單早於已處理的賣單 / 目前對應中的買單，都需重算
+    """
+    sell_cursor = fill_key(ledger.last_sell_date, ledger.last_sell_id) if ledger.last_sell_id is not None else None
+    buy = ledger.buy_trade
+    buy_cursor = fill_key(buy.trade_date, buy.id) if buy is not None else None
+    for row in fills:
+        key = fill_key(row['trade_date'], row['id'])
+        if sell_cursor is not None and key < sell_cursor:
+            return True
+        if row['action'] == 'BUY' and buy_cursor is not None and key < buy_cursor:
+            return True
+    return False
+
+
+def apply_fills(rows):
+    """TradeWriter 寫入一批訂單後：有成交的買單 (含部分成交後取消 / 過期) 建立 open lot，有賣單成交的交易對推進 ledger
+
+    成交早於 ledger 游標時該交易對改為 rebuild_pair；回傳新增或扣減的 open lot id
+    """
+    fills = [row for row in rows if is_fill(row)]
+    buys = [Trade(**row) for row in fills if row.get('action') == 'BUY']
+    touched = [str(buy.id) for buy in buys]
+    if buys:
+        SpotTrade.objects.bulk_create([lot_from_trade(buy) for buy in buys], ignore_conflicts=True)
+
+    by_pair = {}
+    for row in fills:
+        by_pair.setdefault((row['user_email'], row['pair']), []).append(row)
+    for (email, pair), pair_fills in by_pair.items():
+        ledger = PnlLedger.objects.select_related('buy_trade').filter(user_email=email, pair=pair).first()
+        if ledger is not None and out_of_order(ledger, pair_fills):
+            logger.warning("%s %s 收到早於 ledger 游標的成交，重算該交易對損益", email, pair)
+            rebuild_pair(email, pair)
+            touched.extend(SpotTrade.objects.filter(user_email=email, pair=pair).values_list('id', flat=True))
+        elif any(row['action'] == 'SELL' for row in pair_fills):
+            apply_new_sells(email, pair, touched)
+    return touched
+
+
+def rebuild_pair(email, pair):
+    """從頭重播該交易對的成交紀錄，重建游標、所有賣單損益與 open lot"""
+    with transaction.atomic():
+        RealizedProfit.objects.filter(trade__user_email=email, trade__pair=pair).delete()
+        SpotTrade.objects.filter(user_email=email, pair=pair).delete()
+        ledger, _ = PnlLedger.objects.select_for_update().get_or_create(user_email=email, pair=pair)
+
+        buy_trades = list(filled_trades(email, pair, 'BUY'))
+        sell_trades = list(filled_trades(email, pair, 'SELL'))
+        # 整段歷史以定點整數 / NumPy 計算，結果與 match_sells 相同
+        columns, fifo = fifo_from_trades(buy_trades, sell_trades)
+
+        results = []
+        for sell, profit, unmatched in zip(sell_trades, fifo['profits'], fifo['unmatched']):
+            unmatched_qty = from_fixed(unmatched, columns.qty_scale)
+            if unmatched > 0:
+                logger.warning("異常 : 出現未匹配的賣出單據 (訂單 %s，未匹配數量 %s)", sell.id, unmatched_qty)
+            results.append(RealizedProfit(trade=sell, profit=profit, unmatched_qty=unmatched_qty))
+
+        lots = []
+        for index, buy in enumerate(buy_trades):
+            lot = lot_from_trade(buy)
+            if fifo['consumed'][index]:
+                lot.open_position -= from_fixed(fifo['consumed'][index], columns.qty_scale)
+                lot.sold_price = sell_trades[fifo['last_sell'][index]].price
+                lot.profit = from_fixed(fifo['gains'][index], columns.gain_scale)
+                lot.sold_or_not = lot.open_position <= 0
+            lots.append(lot)
+
+        ledger.buy_trade = buy_trades[fifo['buy_index'] - 1] if fifo['buy_index'] else None
+        ledger.buy_remaining = from_fixed(fifo['buy_remaining'], columns.qty_scale)
+        ledger.last_sell_date = sell_trades[-1].trade_date if sell_trades else None
+        ledger.last_sell_id = sell_trades[-1].id if sell_trades else None
+
+        RealizedProfit.objects.bulk_create(results, batch_size=1000)
+        SpotTrade.objects.bulk_create(lots, batch_size=1000)
+        ledger.save()
+        return len(results)
+
+
+def rebuild(email=None):
+    """重建所有 (或指定使用者) 交易對的 ledger，回傳 {(user_email, pair): 賣單筆數}"""
+    trades = Trade.objects.all()
+    if email is not None:
+        trades = trades.filter(user_email=email)
+    counts = {}
+    for user_email, pair in trades.order_by('user_email', 'pair').values_list('user_email', 'pair').distinct():
+        counts[(user_email, pair)] = rebuild_pair(user_email, pair)
+    return counts
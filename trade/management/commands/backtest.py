@@ -0,0 +1,43 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from trade.backtest import run_backtest, BACKTEST_FEE_RATE
+from trade.volatility import VOLATILITY_WINDOW
+
+
+class Command(BaseCommand):
+    help = '以本地歷史 kline / 成交 (CSV 或 NPY) 離線回測網格參數，輸出成交、手續費與損益'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='歷史價格檔 (.csv / .npy)')
+        parser.add_argument('--order-size', type=float, required=True)
+        # 百分比參數與 start_trade 相同，以 % 輸入
+        parser.add_argument('--price-up-percentage', type=float, required=True)
+        parser.add_argument('--price-down-percentage', type=float, required=True)
+        parser.add_argument('--trade-count', type=int, required=True)
+        parser.add_argument('--price-reset-cv', type=float, required=True)
+        parser.add_argument('--price-cancel-cv', type=float, required=True)
+        parser.add_argument('--precision', type=int, default=2, help='價格小數位數')
+        parser.add_argument('--fee-rate', type=float, default=BACKTEST_FEE_RATE)
+        parser.add_argument('--window', type=float, default=VOLATILITY_WINDOW, help='風控觀察視窗秒數')
+        parser.add_argument('--step', type=float, default=1.0, help='重新取樣的間隔秒數')
+
+    def handle(self, *args, **options):
+        if options['price_reset_cv'] >= options['price_cancel_cv']:
+            raise CommandError('風控中斷值必須大於風控重設值!')
+        try:
+            result = run_backtest(
+                options['path'],
+                step=options['step'],
+                order_size=options['order_size'],
+                price_increase_percentage=options['price_up_percentage'] * 0.01,
+                price_decrease_percentage=options['price_down_percentage'] * 0.01,
+                trade_count=options['trade_count'],
+                price_reset_cv=options['price_reset_cv'] * 0.01,
+                price_cancel_cv=options['price_cancel_cv'] * 0.01,
+                precision=options['precision'],
+                fee_rate=options['fee_rate'],
+                window_seconds=options['window'],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(json.dumps(result))
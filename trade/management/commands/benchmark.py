@@ -0,0 +1,44 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from trade.benchmarks import run_benchmarks, median_of, regressions, BENCHMARK_BASELINE, BENCHMARK_TOLERANCE
+
+
+class Command(BaseCommand):
+    help = '離線執行熱路徑效能測試 (I/O 皆為 stub)，輸出 JSON 結果並與基準值比較，退步時以非零狀態結束'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000', help='成交歷史筆數，以逗號分隔 (例如 10000,100000,1000000)')
+        parser.add_argument('--events', type=int, default=5000, help='executionReport 事件數')
+        parser.add_argument('--runs', type=int, default=1, help='完整執行次數，各指標取中位數 (更新基準值時建議 3 次以上)')
+        parser.add_argument('--output', default='benchmark_results.json', help='結果輸出路徑')
+        parser.add_argument('--baseline', default=str(BENCHMARK_BASELINE))
+        parser.add_argument('--tolerance', type=float, default=BENCHMARK_TOLERANCE, help='允許低於基準值的比例')
+        parser.add_argument('--update-baseline', action='store_true', help='以本次結果覆寫基準值')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size]
+        except ValueError:
+            raise CommandError(f"--sizes 格式錯誤: {options['sizes']}")
+
+        results = median_of([run_benchmarks(sizes=sizes, events=options['events']) for _ in range(max(1, options['runs']))])
+        Path(options['output']).write_text(json.dumps(results, indent=2))
+        for name, metric in results['metrics'].items():
+            self.stdout.write(f"{name}: {metric['value']} {metric['unit']}")
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            baseline_path.write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'已更新基準值 {baseline_path}'))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f'找不到基準值 {baseline_path}，略過比較'))
+            return
+
+        found = regressions(results, json.loads(baseline_path.read_text()), options['tolerance'])
+        for name, value, expected in found:
+            self.stderr.write(f'{name}: {value} < 基準值 {expected} x {1 - options["tolerance"]:.2f}')
+        if found:
+            raise CommandError(f'{len(found)} 項指標退步')
+        self.stdout.write(self.style.SUCCESS('所有指標皆未低於基準值'))
@@ -0,0 +1,60 @@
+import io
+import json
+import time
+import contextlib
+from decimal import Decimal
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from trade.ledger import match_sells
+from trade.fifo import FixedColumns, fifo_match, fifo_match_vectorized
+from trade.benchmarks import synthetic_fills
+
+
+def run(count):
+    buys, sells = synthetic_fills(count)
+
+    ledger = SimpleNamespace(buy_trade=None, buy_remaining=Decimal('0'), last_sell_date=None, last_sell_id=None)
+    buy_iter = iter(buys)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        reference = match_sells(ledger, sells, lambda: next(buy_iter, None))
+    decimal_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    columns = FixedColumns(buys, sells)
+    convert_seconds = time.perf_counter() - started
+    vectorized = columns.fits_int64()
+    started = time.perf_counter()
+    fifo = fifo_match_vectorized(columns) if vectorized else fifo_match(columns)
+    match_seconds = time.perf_counter() - started
+
+    identical = len(reference) == len(fifo['profits']) and all(
+        profit == fixed for (_, profit, _), fixed in zip(reference, fifo['profits'])
+    )
+    fixed_seconds = convert_seconds + match_seconds
+    return {
+        'trades': count,
+        'qty_scale': columns.qty_scale,
+        'price_scale': columns.price_scale,
+        'fee_scale': columns.fee_scale,
+        'vectorized': vectorized,
+        'decimal_seconds': round(decimal_seconds, 3),
+        'convert_seconds': round(convert_seconds, 3),
+        'match_seconds': round(match_seconds, 3),
+        'speedup': round(decimal_seconds / fixed_seconds, 2) if fixed_seconds else None,
+        'match_speedup': round(decimal_seconds / match_seconds, 2) if match_seconds else None,
+        'identical': identical,
+    }
+
+
+class Command(BaseCommand):
+    help = '比較 Decimal 與定點整數 FIFO 損益計算的速度，並確認結果逐筆相同'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trades', type=int, default=1_000_000)
+
+    def handle(self, *args, **options):
+        result = run(options['trades'])
+        self.stdout.write(json.dumps(result))
+        if not result['identical']:
+            raise SystemExit('定點整數結果與 Decimal 版本不一致')
@@ -0,0 +1,64 @@
+import time
+import random
+from django.core.management.base import BaseCommand, CommandError
+from trade.backtest import load_prices
+from trade.mock_exchange import MockExchange, MockExchangeServer, MOCK_EXCHANGE_HOST, MOCK_EXCHANGE_PORT, symbol_info
+
+
+def random_walk(start, volatility, count, seed=0):
+    rng = random.Random(seed)
+    prices = [start]
+    for _ in range(count - 1):
+        prices.append(round(prices[-1] * (1 + rng.gauss(0, volatility)), 2))
+    return prices
+
+
+class Command(BaseCommand):
+    help = '啟動本地模擬 Binance (REST + websocket)，以腳本價格撮合限價單，供整合與壓力測試'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=MOCK_EXCHANGE_HOST)
+        parser.add_argument('--port', type=int, default=MOCK_EXCHANGE_PORT)
+        parser.add_argument('--symbol', default='BTCUSDT')
+        parser.add_argument('--base-asset', default='BTC')
+        parser.add_argument('--quote-asset', default='USDT')
+        parser.add_argument('--prices', help='歷史價格檔 (.csv / .npy，格式同 backtest)；未指定時使用隨機漫步')
+        parser.add_argument('--start-price', type=float, default=60000)
+        parser.add_argument('--volatility', type=float, default=0.0005, help='隨機漫步每步標準差')
+        parser.add_argument('--steps', type=int, default=100_000)
+        parser.add_argument('--interval', type=float, default=1.0, help='每個價格停留秒數 (0 為最快)')
+        parser.add_argument('--loop', action='store_true', help='價格播完後從頭重播')
+        parser.add_argument('--api-key', help='設定後檢查 X-MBX-APIKEY')
+        parser.add_argument('--api-secret', help='設定後檢查 HMAC 簽章')
+
+    def handle(self, *args, **options):
+        if options['prices']:
+            try:
+                _, prices = load_prices(options['prices'])
+            except (OSError, ValueError) as e:
+                raise CommandError(str(e))
+            prices = prices.tolist()
+        else:
+            prices = random_walk(options['start_price'], options['volatility'], options['steps'])
+
+        symbol = options['symbol']
+        exchange = MockExchange(
+            symbols=[symbol_info(symbol, options['base_asset'], options['quote_asset'])],
+            api_key=options['api_key'],
+            api_secret=options['api_secret'],
+        )
+        exchange.set_price(symbol, prices[0])
+        server = MockExchangeServer(exchange, options['host'], options['port']).start()
+        exchange.replay(symbol, prices, options['interval'], options['loop'])
+
+        self.stdout.write(self.style.SUCCESS(f'模擬交易所已啟動 ({len(prices)} 筆價格)，請設定：'))
+        self.stdout.write(f'BINANCE_BASE_URL={server.base_url}')
+        self.stdout.write(f'BINANCE_WS_URL={server.ws_url}')
+        self.stdout.write(f'成交統計: {server.base_url}/mock/stats')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write(str(exchange.stats()))
+        finally:
+            server.stop()
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from trade.ledger import rebuild
+
+
+class Command(BaseCommand):
+    help = '重播歷史成交，重建 FIFO 損益 ledger 與 open lot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='只重建指定使用者')
+
+    def handle(self, *args, **options):
+        counts = rebuild(options.get('email'))
+        for (email, pair), count in counts.items():
+            self.stdout.write(f'{email} {pair}: {count} 筆賣單')
+        self.stdout.write(self.style.SUCCESS(f'已重建 {len(counts)} 個交易對'))
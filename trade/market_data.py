@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import ssl
+import asyncio
+import threading
+import websocket
+from . import user_stream
+from .user_stream import BINANCE_WS_URL
+from .async_ws import connect, WebSocketClosed
+from .metrics import record_retry
+
+# 超過此秒數沒有報價即視為過期，改用 REST 查價
+MARKET_DATA_MAX_AGE = float(os.getenv('MARKET_DATA_MAX_AGE', 60))
+# bookTicker (最佳買賣中間價，即時) 或 miniTicker (最新成交價，每秒)
+MARKET_DATA_STREAM = os.getenv('MARKET_DATA_STREAM', 'bookTicker')
+# 行情串流斷線後重新連線的等待秒數
+RECONNECT_DELAY = 5
+
+
+def parse_ticker(data):
+    """bookTicker 取買賣中間價、miniTicker 取最新成交價，回傳 (symbol, price)；非報價訊息回傳 None"""
+    symbol = data.get('s')
+    if symbol is None:
+        return None  # SUBSCRIBE 回應
+    if 'b' in data and 'a' in data:
+        return symbol, (float(data['b']) + float(data['a'])) / 2
+    if 'c' in data:
+        return symbol, float(data['c'])
+    return None
+
+
+class PriceBook:
+    """各交易對最新價格、時間戳與報價回呼；MarketDataFeed (執行緒) 與 AsyncMarketData (asyncio) 共用
+
+    只負責記帳，連線與送出 SUBSCRIBE / UNSUBSCRIBE 由子類別處理
+    """
+
+    def __init__(self, stream=MARKET_DATA_STREAM, max_age=MARKET_DATA_MAX_AGE, log=print):
+        self.stream = stream
+        self.max_age = max_age
+        self.log = log
+        self.prices = {}  # symbol -> (price, monotonic 時間戳)
+        self.symbols = set()
+        self.listeners = {}  # symbol -> [callback(symbol, price, ts)]
+        self.connected = False
+        self._first_price = {}
+        self._request_id = 0
+
+    def _stream_name(self, symbol):
+        return f"{symbol.lower()}@{self.stream}"
+
+    def _new_event(self):
+        raise NotImplementedError
+
+    def _request(self, method, symbols):
+        """SUBSCRIBE / UNSUBSCRIBE 訊息"""
+        self._request_id += 1
+        return json.dumps({'method': method, 'params': [self._stream_name(s) for s in symbols], 'id': self._request_id})
+
+    def add(self, symbol, listener=None):
+        """登記交易對與回呼，新訂閱的交易對回傳 True"""
+        listeners = self.listeners.setdefault(symbol, [])
+        if listener is not None and listener not in listeners:
+            listeners.append(listener)
+        if symbol in self.symbols:
+            return False
+        self.symbols.add(symbol)
+        self._first_price.setdefault(symbol, self._new_event())
+        return True
+
+    def remove(self, symbol):
+        """移除交易對，原本有訂閱時回傳 True"""
+        self.listeners.pop(symbol, None)
+        if symbol not in self.symbols:
+            return False
+        self.symbols.discard(symbol)
+        self.prices.pop(symbol, None)
+        self._first_price.pop(symbol, None)
+        return True
+
+    def clear(self):
+        self.symbols.clear()
+        self.listeners.clear()
+        self.prices.clear()
+        self._first_price.clear()
+
+    def on_text(self, message):
+        tick = parse_ticker(json.loads(message))
+        if tick is None:
+            return
+        symbol, price = tick
+        ts = time.monotonic()
+        self.prices[symbol] = (price, ts)
+        event = self._first_price.get(symbol)
+        if event is not None and not event.is_set():
+            event.set()
+        for listener in self.listeners.get(symbol, ()):
+            listener(symbol, price, ts)
+
+    def get_price(self, symbol):
+        """回傳最新價格；未連線、未訂閱或報價過期時回傳 None"""
+        entry = self.prices.get(symbol)
+        if entry is None or not self.connected:
+            return None
+        price, ts = entry
+        if time.monotonic() - ts > self.max_age:
+            return None
+        return price
+
+
+class MarketDataFeed(PriceBook):
+    """訂閱 Binance 行情串流 (websocket-client 執行緒)，於記憶體保存各交易對最新價格與時間戳"""
+
+    def __init__(self, url=BINANCE_WS_URL, stream=MARKET_DATA_STREAM, max_age=MARKET_DATA_MAX_AGE, log=print):
+        super().__init__(stream, max_age, log)
+        self.url = url
+        self.ws = None
+        self.thread = None
+        self.manual_close = False
+        self._lock = threading.Lock()
+
+    def _new_event(self):
+        return threading.Event()
+
+    def subscribe(self, symbol, listener=None):
+        """訂閱交易對行情，可附帶每筆報價的回呼"""
+        with self._lock:
+            if not self.add(symbol, listener):
+                return
+            if self.ws is None:
+                self._connect()
+            elif self.connected:
+                self._send('SUBSCRIBE', [symbol])
+
+    def unsubscribe(self, symbol):
+        with self._lock:
+            if not self.remove(symbol):
+                return
+            if self.connected:
+                self._send('UNSUBSCRIBE', [symbol])
+            if not self.symbols:
+                self._close()
+
+    def wait_for_price(self, symbol, timeout=1.0):
+        event = self._first_price.get(symbol)
+        return event.wait(timeout) if event is not None else False
+
+    def stop(self):
+        with self._lock:
+            self.clear()
+            self._close()
+
+    def _send(self, method, symbols):
+        try:
+            self.ws.send(self._request(method, symbols))
+        except Exception as e:
+            self.log(f"❌ 行情訂閱失敗 {method} {symbols}: {e}")
+
+    def _connect(self):
+        self.manual_close = False
+        self.ws = websocket.WebSocketApp(
+            f"{self.url}/ws",
+            on_open=self.on_open,
+            on_message=self.on_message,
+            on_error=self.on_error,
+            on_close=self.on_close,
+        )
+        self.thread = threading.Thread(
+            target=lambda: self.ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE}),
+            daemon=True
+        )
+        self.thread.start()
+
+    def _close(self):
+        self.manual_close = True
+        self.connected = False
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+
+    def on_open(self, ws):
+        with self._lock:
+            self.connected = True
+            if self.symbols:
+                self._send('SUBSCRIBE', self.symbols)
+        self.log("✅ 行情 WebSocket 連線成功")
+
+    def on_message(self, ws, message):
+        self.on_text(message)
+
+    def on_error(self, ws, error):
+        self.log(f"❌ 行情 WebSocket 錯誤: {error}")
+
+    def on_close(self, ws, close_status_code, close_msg):
+        self.connected = False
+        if self.manual_close or ws is not self.ws:
+            return
+        self.log("⚠️ 行情 WebSocket 斷線，5 秒後重新連線 (期間改用 REST 查價)")
+        record_retry('/ws', 'market_data_reconnect')
+        time.sleep(RECONNECT_DELAY)
+        with self._lock:
+            if not self.manual_close and self.symbols:
+                self._connect()
+
+
+class AsyncMarketData(PriceBook):
+    """asyncio 版本的行情串流 (TRADE_ENGINE=async)，介面同 MarketDataFeed，需在事件迴圈上呼叫"""
+
+    def __init__(self, url=None, stream=MARKET_DATA_STREAM, max_age=MARKET_DATA_MAX_AGE, log=print):
+        super().__init__(stream, max_age, log)
+        self.url = url
+        self.ws = None
+        self.task = None
+        self._sending = set()  # 事件迴圈只保留 task 的弱參照，需自行持有
+
+    def _new_event(self):
+        return asyncio.Event()
+
+    def subscribe(self, symbol, listener=None):
+        if not self.add(symbol, listener):
+            return
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        elif self.connected:
+            self._send_later('SUBSCRIBE', [symbol])
+
+    def unsubscribe(self, symbol):
+        if not self.remove(symbol):
+            return
+        if not self.symbols:
+            self.stop()
+        elif self.connected:
+            self._send_later('UNSUBSCRIBE', [symbol])
+
+    async def wait_for_price(self, symbol, timeout=1.0):
+        event = self._first_price.get(symbol)
+        if event is None:
+            return False
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def stop(self):
+        self.clear()
+        self.connected = False
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+        self.task = None
+
+    def _send_later(self, method, symbols):
+        task = asyncio.get_running_loop().create_task(self._send(method, symbols))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, method, symbols):
+        try:
+            await self.ws.send(self._request(method, symbols))
+        except (AttributeError, OSError, WebSocketClosed) as e:
+            self.log(f"❌ 行情訂閱失敗 {method} {symbols}: {e}")
+
+    async def run(self):
+        while self.symbols:
+            try:
+                self.ws = await connect(f"{self.url or user_stream.BINANCE_WS_URL}/ws")
+            except (OSError, asyncio.TimeoutError, WebSocketClosed) as e:
+                self.log(f"❌ 行情 WebSocket 錯誤: {e}")
+            else:
+                try:
+                    self.connected = True
+                    await self._send('SUBSCRIBE', self.symbols)
+                    self.log("✅ 行情 WebSocket 連線成功")
+                    async for message in self.ws:
+                        self.on_text(message)
+                except (OSError, WebSocketClosed) as e:
+                    self.log(f"❌ 行情 WebSocket 錯誤: {e}")
+                finally:
+                    self.connected = False
+                    await self.ws.close()
+                    self.ws = None
+            if not self.symbols:
+                return
+            self.log("⚠️ 行情 WebSocket 斷線，5 秒後重新連線 (期間改用 REST 查價)")
+            record_retry('/ws', 'market_data_reconnect')
+            await asyncio.sleep(RECONNECT_DELAY)
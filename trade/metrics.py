@@ -0,0 +1,163 @@
+import time
+import bisect
+import threading
+
+# REST 延遲與成交補單延遲的 histogram 區間 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues):
+        return self.values.get(labelvalues, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self.values.items())
+        for labelvalues, value in items:
+            lines.append(f'{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # labelvalues -> [各區間次數 (含 +Inf), 總和]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(labelvalues)
+            if entry is None:
+                entry = self.values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, *labelvalues):
+        entry = self.values.get(labelvalues)
+        return sum(entry[0]) if entry else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for labelvalues, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _labels(self.labelnames, labelvalues, [('le', _number(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {_number(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+rest_latency = registry.register(Histogram(
+    'exchange_rest_request_duration_seconds', '交易所 REST 請求耗時',
+    ['exchange', 'method', 'endpoint', 'outcome'],
+))
+rest_responses = registry.register(Counter(
+    'exchange_rest_responses_total', '交易所 REST 回應次數 (依 HTTP 狀態碼，連線失敗為 error)',
+    ['exchange', 'method', 'endpoint', 'code'],
+))
+rest_sent_bytes = registry.register(Counter(
+    'exchange_rest_sent_bytes_total', '送出的 URL 與 body 位元組數',
+    ['exchange', 'method', 'endpoint'],
+))
+rest_received_bytes = registry.register(Counter(
+    'exchange_rest_received_bytes_total', '收到的回應 body 位元組數',
+    ['exchange', 'method', 'endpoint'],
+))
+retries = registry.register(Counter(
+    'exchange_retries_total', '失敗後改走備援或重試的次數',
+    ['exchange', 'endpoint', 'reason'],
+))
+fill_reaction = registry.register(Histogram(
+    'grid_fill_replacement_latency_seconds', 'executionReport 事件時間到補單送出完成的延遲',
+    ['pair'],
+))
+scheduler_wait = registry.register(Histogram(
+    'exchange_scheduler_wait_seconds', 'REST 請求在排程器排隊等待額度的時間',
+    ['lane'],
+))
+rate_limit_bans = registry.register(Counter(
+    'exchange_rate_limit_bans_total', '收到 429 / 418 (超過限制或被封鎖) 的次數',
+    ['code'],
+))
+
+
+def outcome(status_code):
+    if status_code is None:
+        return 'error'
+    if status_code < 400:
+        return 'ok'
+    return 'client_error' if status_code < 500 else 'server_error'
+
+
+def observe_rest(exchange, method, endpoint, status_code, seconds, sent_bytes, received_bytes):
+    """記錄一次 REST 請求；status_code 為 None 代表連線失敗或逾時"""
+    rest_latency.observe(seconds, exchange, method, endpoint, outcome(status_code))
+    rest_responses.inc(exchange, method, endpoint, 'error' if status_code is None else str(status_code))
+    rest_sent_bytes.inc(exchange, method, endpoint, amount=sent_bytes)
+    rest_received_bytes.inc(exchange, method, endpoint, amount=received_bytes)
+
+
+def record_retry(endpoint, reason, exchange='binance'):
+    retries.inc(exchange, endpoint, reason)
+
+
+def observe_fill_reaction(pair, event_time_ms):
+    """以 executionReport 的事件時間 (E，毫秒) 計算到目前為止的補單延遲"""
+    if event_time_ms is None:
+        return
+    fill_reaction.observe(max(time.time() - int(event_time_ms) / 1000, 0.0), pair)
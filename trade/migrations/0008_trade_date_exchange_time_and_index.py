@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0007_alter_trade_fee_symbol'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trade',
+            name='trade_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user_email', 'pair', 'action', 'trade_date'], name='trade_user_pair_action_date'),
+        ),
+    ]
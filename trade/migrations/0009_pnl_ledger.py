@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0008_trade_date_exchange_time_and_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RealizedProfit',
+            fields=[
+                ('trade', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='realized_profit', serialize=False, to='trade.trade')),
+                ('profit', models.DecimalField(decimal_places=10, max_digits=30)),
+                ('unmatched_qty', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PnlLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_email', models.CharField(max_length=50, null=True)),
+                ('pair', models.CharField(max_length=10)),
+                ('buy_remaining', models.DecimalField(decimal_places=10, default=0, max_digits=20)),
+                ('last_sell_date', models.DateTimeField(null=True)),
+                ('last_sell_id', models.CharField(max_length=20, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('buy_trade', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='trade.trade')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_email', 'pair'), name='pnl_ledger_user_pair')],
+            },
+        ),
+    ]
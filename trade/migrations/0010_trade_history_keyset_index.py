@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0009_pnl_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user_email', 'trade_date', 'id'], name='trade_user_date_id'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0010_trade_history_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spottrade',
+            name='price',
+            field=models.DecimalField(decimal_places=10, default=0, max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='spottrade',
+            name='trade_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='spottrade',
+            name='fee',
+            field=models.DecimalField(decimal_places=10, default=0, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='spottrade',
+            name='fee_symbol',
+            field=models.CharField(default='twd', max_length=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='spottrade',
+            name='open_position',
+            field=models.DecimalField(decimal_places=10, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='spottrade',
+            name='profit',
+            field=models.DecimalField(decimal_places=10, default=0, max_digits=30),
+        ),
+        migrations.AlterField(
+            model_name='spottrade',
+            name='quantity',
+            field=models.DecimalField(decimal_places=10, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='spottrade',
+            name='sold_price',
+            field=models.DecimalField(decimal_places=10, default=0, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='spottrade',
+            name='target_after_exceed',
+            field=models.DecimalField(decimal_places=10, default=0, max_digits=20),
+        ),
+        migrations.AddIndex(
+            model_name='spottrade',
+            index=models.Index(fields=['user_email', 'sold_or_not', 'trade_date', 'id'], name='spot_user_open_date'),
+        ),
+    ]
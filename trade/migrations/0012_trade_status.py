@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0011_spot_trade_open_lots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='status',
+            field=models.CharField(max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,665 @@
+import os
+import hmac
+import json
+import time
+import base64
+import struct
+import hashlib
+import itertools
+import threading
+from decimal import Decimal
+from collections import defaultdict, deque
+from urllib.parse import urlsplit, parse_qsl
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+MOCK_EXCHANGE_HOST = os.getenv('MOCK_EXCHANGE_HOST', '127.0.0.1')
+MOCK_EXCHANGE_PORT = int(os.getenv('MOCK_EXCHANGE_PORT', 8765))
+# 成交手續費率，買單以 base、賣單以 quote 收取 (同 Binance 預設)
+MOCK_FEE_RATE = Decimal(os.getenv('MOCK_FEE_RATE', '0.001'))
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_TEXT, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+class MockExchangeError(Exception):
+    """以 Binance 的錯誤格式 {"code", "msg"} 回應"""
+
+    def __init__(self, code, msg, status=400):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.status = status
+
+
+def symbol_info(symbol, base_asset, quote_asset, tick_size='0.01', step_size='0.00001', min_notional='5'):
+    """exchangeInfo 單一交易對 (只含 bot 會用到的 filters)"""
+    return {
+        'symbol': symbol,
+        'status': 'TRADING',
+        'baseAsset': base_asset,
+        'quoteAsset': quote_asset,
+        'filters': [
+            {'filterType': 'PRICE_FILTER', 'minPrice': tick_size, 'maxPrice': '1000000', 'tickSize': tick_size},
+            {'filterType': 'LOT_SIZE', 'minQty': step_size, 'maxQty': '9000', 'stepSize': step_size},
+            {'filterType': 'NOTIONAL', 'minNotional': min_notional},
+        ],
+    }
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class MockExchange:
+    """記憶體內的 Binance 現貨：限價單撮合、帳戶餘額、成交明細與 user-data / 行情推送
+
+    價格只由 set_price() (或 replay() 的腳本價格) 推動：
+    BUY 掛單價 >= 市價、SELL 掛單價 <= 市價時以掛單價全部成交
+    """
+
+    def __init__(self, symbols=None, balances=None, fee_rate=MOCK_FEE_RATE, api_key=None, api_secret=None):
+        symbols = symbols or [symbol_info('BTCUSDT', 'BTC', 'USDT')]
+        self.symbols = {s['symbol']: s for s in symbols}
+        self.fee_rate = Decimal(str(fee_rate))
+        self.api_key = api_key
+        self.secret = api_secret.encode('utf-8') if api_secret else None
+        self.balances = defaultdict(Decimal)
+        for asset, amount in (balances or {'BTC': 100, 'USDT': 10_000_000}).items():
+            self.balances[asset] = Decimal(str(amount))
+        self.prices = {}
+        self.orders = {}                       # orderId -> 訂單 (REST 格式)
+        self.open_orders = defaultdict(dict)   # symbol -> {orderId: 訂單}
+        self.trades = defaultdict(list)        # symbol -> myTrades
+        self.listen_keys = set()
+        self.user_sessions = []
+        self.market_sessions = {}              # session -> {stream 名稱}
+        self.order_ids = itertools.count(1)
+        self.trade_ids = itertools.count(1)
+        self.lock = threading.RLock()
+        self.replays = []
+        self.reset_stats()
+
+    # ---- 統計 (壓測用) ----
+
+    def reset_stats(self):
+        with self.lock:
+            self.counters = {'orders': 0, 'cancels': 0, 'amends': 0, 'fills': 0}
+            self.pending_fills = defaultdict(deque)   # symbol -> 等待補單的成交時間
+            self.reaction_times = []                  # 成交推送 -> 收到下一張新單 (秒)
+            self.started_at = time.monotonic()
+
+    def stats(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started_at
+            reactions = sorted(self.reaction_times)
+
+        def percentile(q):
+            if not reactions:
+                return None
+            return round(reactions[min(len(reactions) - 1, int(q * len(reactions)))] * 1000, 3)
+
+        return {
+            **self.counters,
+            'open_orders': sum(len(orders) for orders in self.open_orders.values()),
+            'elapsed': round(elapsed, 3),
+            'fills_per_second': round(self.counters['fills'] / elapsed, 3) if elapsed else None,
+            'reaction_ms': {
+                'count': len(reactions),
+                'p50': percentile(0.5),
+                'p99': percentile(0.99),
+                'max': round(reactions[-1] * 1000, 3) if reactions else None,
+            },
+        }
+
+    # ---- 價格與撮合 ----
+
+    def set_price(self, symbol, price):
+        """更新市價並撮合所有被穿過的掛單，推送行情與成交回報"""
+        price = Decimal(str(price))
+        events = []
+        with self.lock:
+            self.prices[symbol] = price
+            crossed = [
+                order for order in self.open_orders[symbol].values()
+                if (order['side'] == 'BUY' and Decimal(order['price']) >= price)
+                or (order['side'] == 'SELL' and Decimal(order['price']) <= price)
+            ]
+            # 依價格穿過的先後成交：買單由高到低、賣單由低到高
+            crossed.sort(key=lambda o: -Decimal(o['price']) if o['side'] == 'BUY' else Decimal(o['price']))
+            for order in crossed:
+                events.append(self._fill(order))
+            if crossed:
+                # 成交後推送餘額異動 (只含有變動的資產)
+                info = self.symbols[symbol]
+                balances = self._balances({info['baseAsset'], info['quoteAsset']})
+                events.append({
+                    'e': 'outboundAccountPosition', 'E': now_ms(), 'u': now_ms(),
+                    'B': [{'a': b['asset'], 'f': b['free'], 'l': b['locked']} for b in balances],
+                })
+        self._broadcast_ticker(symbol, price)
+        for event in events:
+            self._push_user(event)
+
+    def _fill(self, order):
+        symbol = self.symbols[order['symbol']]
+        qty = Decimal(order['origQty'])
+        price = Decimal(order['price'])
+        quote_qty = qty * price
+        if order['side'] == 'BUY':
+            fee, fee_asset = qty * self.fee_rate, symbol['baseAsset']
+            self.balances[symbol['baseAsset']] += qty - fee
+            self.balances[symbol['quoteAsset']] -= quote_qty
+        else:
+            fee, fee_asset = quote_qty * self.fee_rate, symbol['quoteAsset']
+            self.balances[symbol['baseAsset']] -= qty
+            self.balances[symbol['quoteAsset']] += quote_qty - fee
+
+        ts = now_ms()
+        trade_id = next(self.trade_ids)
+        order.update(executedQty=order['origQty'], cummulativeQuoteQty=str(quote_qty), status='FILLED', updateTime=ts)
+        del self.open_orders[order['symbol']][order['orderId']]
+        self.trades[order['symbol']].append({
+            'symbol': order['symbol'],
+            'id': trade_id,
+            'orderId': order['orderId'],
+            'price': order['price'],
+            'qty': order['origQty'],
+            'quoteQty': str(quote_qty),
+            'commission': str(fee),
+            'commissionAsset': fee_asset,
+            'time': ts,
+            'isBuyer': order['side'] == 'BUY',
+            'isMaker': True,
+        })
+        self.counters['fills'] += 1
+        self.pending_fills[order['symbol']].append(time.monotonic())
+        return self._execution_report(order, 'TRADE', last_qty=order['origQty'], last_price=order['price'],
+                                      fee=str(fee), fee_asset=fee_asset, trade_id=trade_id)
+
+    def _execution_report(self, order, execution_type, last_qty='0', last_price='0', fee='0', fee_asset=None, trade_id=-1):
+        return {
+            'e': 'executionReport',
+            'E': now_ms(),
+            's': order['symbol'],
+            'c': order['clientOrderId'],
+            'S': order['side'],
+            'o': order['type'],
+            'f': order['timeInForce'],
+            'q': order['origQty'],
+            'p': order['price'],
+            'x': execution_type,
+            'X': order['status'],
+            'i': order['orderId'],
+            'l': last_qty,
+            'z': order['executedQty'],
+            'L': last_price,
+            'n': fee,
+            'N': fee_asset,
+            'T': order['updateTime'],
+            't': trade_id,
+            'O': order['time'],
+            'Z': order['cummulativeQuoteQty'],
+        }
+
+    def replay(self, symbol, prices, interval=1.0, loop=False):
+        """背景執行緒依序以 interval 秒推動腳本價格，回傳可 set() 的停止事件"""
+        stop = threading.Event()
+
+        def run():
+            while not stop.is_set():
+                for price in prices:
+                    if stop.is_set():
+                        return
+                    self.set_price(symbol, price)
+                    if interval:
+                        stop.wait(interval)
+                if not loop:
+                    return
+
+        thread = threading.Thread(target=run, name=f'mock-replay-{symbol}', daemon=True)
+        self.replays.append(stop)
+        thread.start()
+        return stop
+
+    def stop(self):
+        for stop in self.replays:
+            stop.set()
+        with self.lock:
+            sessions = list(self.user_sessions) + list(self.market_sessions)
+        for session in sessions:
+            session.close()
+
+    # ---- REST ----
+
+    ROUTES = {
+        ('GET', '/api/v3/ping'): ('public', 'ping'),
+        ('GET', '/api/v3/exchangeInfo'): ('public', 'exchange_info'),
+        ('GET', '/api/v3/ticker/price'): ('public', 'ticker_price'),
+        ('POST', '/api/v3/order'): ('signed', 'new_order'),
+        ('GET', '/api/v3/order'): ('signed', 'query_order'),
+        ('DELETE', '/api/v3/order'): ('signed', 'cancel_order'),
+        ('PUT', '/api/v3/order/amend/keepPriority'): ('signed', 'amend_order'),
+        ('GET', '/api/v3/openOrders'): ('signed', 'get_open_orders'),
+        ('DELETE', '/api/v3/openOrders'): ('signed', 'cancel_open_orders'),
+        ('GET', '/api/v3/myTrades'): ('signed', 'my_trades'),
+        ('GET', '/api/v3/account'): ('signed', 'account'),
+        ('POST', '/api/v3/userDataStream'): ('keyed', 'new_listen_key'),
+        ('PUT', '/api/v3/userDataStream'): ('keyed', 'keepalive_listen_key'),
+        ('DELETE', '/api/v3/userDataStream'): ('keyed', 'close_listen_key'),
+        ('GET', '/mock/stats'): ('public', 'get_stats'),
+    }
+
+    def handle(self, method, path, query, headers):
+        """處理一個 REST 請求，回傳 (HTTP 狀態碼, JSON 內容)"""
+        route = self.ROUTES.get((method, path))
+        if route is None:
+            return 404, {'code': -1, 'msg': f'Unknown endpoint {method} {path}'}
+        auth, name = route
+        params = dict(parse_qsl(query))
+        try:
+            if auth != 'public':
+                self._authenticate(auth, query, headers)
+            return 200, getattr(self, name)(params)
+        except MockExchangeError as e:
+            return e.status, {'code': e.code, 'msg': e.msg}
+
+    def _authenticate(self, auth, query, headers):
+        if self.api_key is not None and headers.get('X-MBX-APIKEY') != self.api_key:
+            raise MockExchangeError(-2014, 'API-key format invalid.', status=401)
+        if auth == 'signed' and self.secret is not None:
+            payload, _, signature = query.rpartition('&signature=')
+            expected = hmac.new(self.secret, payload.encode('utf-8'), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(signature, expected):
+                raise MockExchangeError(-1022, 'Signature for this request is not valid.')
+
+    def _symbol(self, params):
+        symbol = params.get('symbol')
+        if symbol not in self.symbols:
+            raise MockExchangeError(-1121, 'Invalid symbol.')
+        return symbol
+
+    def _order(self, params):
+        order = self.orders.get(int(params.get('orderId') or 0))
+        if order is None or order['symbol'] != self._symbol(params):
+            raise MockExchangeError(-2013, 'Order does not exist.')
+        return order
+
+    def ping(self, params):
+        return {}
+
+    def exchange_info(self, params):
+        return {'timezone': 'UTC', 'serverTime': now_ms(), 'symbols': list(self.symbols.values())}
+
+    def ticker_price(self, params):
+        symbol = self._symbol(params)
+        if symbol not in self.prices:
+            raise MockExchangeError(-1121, 'Invalid symbol.')
+        return {'symbol': symbol, 'price': str(self.prices[symbol])}
+
+    def new_order(self, params):
+        symbol = self._symbol(params)
+        try:
+            qty = Decimal(params['quantity'])
+            price = Decimal(params['price'])
+        except (KeyError, ArithmeticError):
+            raise MockExchangeError(-1102, 'Mandatory parameter was not sent, was empty/null, or malformed.')
+        if params.get('type', 'LIMIT') != 'LIMIT' or params.get('side') not in ('BUY', 'SELL'):
+            raise MockExchangeError(-1116, 'Invalid orderType.')
+        filters = {f['filterType']: f for f in self.symbols[symbol]['filters']}
+        if price <= 0 or price % Decimal(filters['PRICE_FILTER']['tickSize']):
+            raise MockExchangeError(-1013, 'Filter failure: PRICE_FILTER')
+        if qty < Decimal(filters['LOT_SIZE']['minQty']) or qty % Decimal(filters['LOT_SIZE']['stepSize']):
+            raise MockExchangeError(-1013, 'Filter failure: LOT_SIZE')
+        if qty * price < Decimal(filters['NOTIONAL']['minNotional']):
+            raise MockExchangeError(-1013, 'Filter failure: NOTIONAL')
+
+        ts = now_ms()
+        with self.lock:
+            order_id = next(self.order_ids)
+            order = {
+                'symbol': symbol,
+                'orderId': order_id,
+                'clientOrderId': params.get('newClientOrderId') or f'mock{order_id}',
+                'price': str(price),
+                'origQty': str(qty),
+                'executedQty': '0',
+                'cummulativeQuoteQty': '0',
+                'status': 'NEW',
+                'timeInForce': params.get('timeInForce', 'GTC'),
+                'type': 'LIMIT',
+                'side': params['side'],
+                'time': ts,
+                'updateTime': ts,
+            }
+            self.orders[order_id] = order
+            self.open_orders[symbol][order_id] = order
+            self.counters['orders'] += 1
+            pending = self.pending_fills[symbol]
+            while pending:
+                self.reaction_times.append(time.monotonic() - pending.popleft())
+            events = [self._execution_report(order, 'NEW')]
+            # 掛單價已穿過市價時立即成交
+            market = self.prices.get(symbol)
+            if market is not None and ((order['side'] == 'BUY' and price >= market) or (order['side'] == 'SELL' and price <= market)):
+                events.append(self._fill(order))
+            response = {**order, 'transactTime': ts}
+        for event in events:
+            self._push_user(event)
+        return response
+
+    def query_order(self, params):
+        with self.lock:
+            return dict(self._order(params))
+
+    def cancel_order(self, params):
+        with self.lock:
+            order = self._order(params)
+            if order['status'] != 'NEW':
+                raise MockExchangeError(-2011, 'Unknown order sent.')
+            event = self._cancel(order)
+        self._push_user(event)
+        return dict(order)
+
+    def _cancel(self, order):
+        order.update(status='CANCELED', updateTime=now_ms())
+        del self.open_orders[order['symbol']][order['orderId']]
+        self.counters['cancels'] += 1
+        return self._execution_report(order, 'CANCELED')
+
+    def amend_order(self, params):
+        with self.lock:
+            order = self._order(params)
+            new_qty = Decimal(params.get('newQty') or 0)
+            if order['status'] != 'NEW' or not 0 < new_qty < Decimal(order['origQty']):
+                raise MockExchangeError(-2038, 'Order amend (quantity decrease) rejected.')
+            order.update(origQty=str(new_qty), updateTime=now_ms())
+            self.counters['amends'] += 1
+            event = self._execution_report(order, 'REPLACED')
+        self._push_user(event)
+        return {'transactTime': order['updateTime'], 'executionId': -1, 'amendedOrder': dict(order)}
+
+    def get_open_orders(self, params):
+        with self.lock:
+            return [dict(order) for order in self.open_orders[self._symbol(params)].values()]
+
+    def cancel_open_orders(self, params):
+        with self.lock:
+            orders = list(self.open_orders[self._symbol(params)].values())
+            if not orders:
+                raise MockExchangeError(-2011, 'Unknown order sent.')
+            events = [self._cancel(order) for order in orders]
+        for event in events:
+            self._push_user(event)
+        return [dict(order) for order in orders]
+
+    def my_trades(self, params):
+        start_time = int(params.get('startTime') or 0)
+        limit = min(int(params.get('limit') or 500), 1000)
+        with self.lock:
+            trades = [t for t in self.trades[self._symbol(params)] if t['time'] >= start_time]
+        return trades[:limit]
+
+    def _balances(self, assets=None):
+        """(持有 lock 時呼叫) 各資產的可用與掛單凍結數量"""
+        locked = defaultdict(Decimal)
+        for orders in self.open_orders.values():
+            for order in orders.values():
+                symbol = self.symbols[order['symbol']]
+                if order['side'] == 'BUY':
+                    locked[symbol['quoteAsset']] += Decimal(order['origQty']) * Decimal(order['price'])
+                else:
+                    locked[symbol['baseAsset']] += Decimal(order['origQty'])
+        return [
+            {'asset': asset, 'free': str(total - locked[asset]), 'locked': str(locked[asset])}
+            for asset, total in self.balances.items()
+            if assets is None or asset in assets
+        ]
+
+    def account(self, params):
+        with self.lock:
+            balances = self._balances()
+        return {'accountType': 'SPOT', 'canTrade': True, 'updateTime': now_ms(), 'balances': balances}
+
+    def new_listen_key(self, params):
+        listen_key = base64.urlsafe_b64encode(os.urandom(30)).decode('ascii')
+        with self.lock:
+            self.listen_keys.add(listen_key)
+        return {'listenKey': listen_key}
+
+    def keepalive_listen_key(self, params):
+        if params.get('listenKey') not in self.listen_keys:
+            raise MockExchangeError(-1125, 'This listenKey does not exist.')
+        return {}
+
+    def close_listen_key(self, params):
+        with self.lock:
+            self.listen_keys.discard(params.get('listenKey'))
+        return {}
+
+    def get_stats(self, params):
+        return self.stats()
+
+    # ---- websocket ----
+
+    def attach(self, session, path):
+        """/ws/<listenKey> 為 user-data 串流，/ws 為行情串流；listenKey 不存在時回傳 False"""
+        with self.lock:
+            if path == '/ws':
+                self.market_sessions[session] = set()
+                return True
+            if path.startswith('/ws/') and path[4:] in self.listen_keys:
+                self.user_sessions.append(session)
+                return True
+        return False
+
+    def detach(self, session):
+        with self.lock:
+            self.market_sessions.pop(session, None)
+            if session in self.user_sessions:
+                self.user_sessions.remove(session)
+
+    def on_ws_message(self, session, message):
+        """行情串流的 SUBSCRIBE / UNSUBSCRIBE，訂閱後立即推送一次目前價格"""
+        try:
+            request = json.loads(message)
+        except ValueError:
+            return
+        streams = set(request.get('params') or [])
+        with self.lock:
+            subscribed = self.market_sessions.get(session)
+            if subscribed is None:
+                return
+            if request.get('method') == 'SUBSCRIBE':
+                subscribed |= streams
+            elif request.get('method') == 'UNSUBSCRIBE':
+                subscribed -= streams
+            prices = dict(self.prices)
+        session.send(json.dumps({'result': None, 'id': request.get('id')}))
+        if request.get('method') == 'SUBSCRIBE':
+            for stream in streams:
+                symbol = stream.split('@')[0].upper()
+                if symbol in prices:
+                    session.send(json.dumps(self._ticker(stream, symbol, prices[symbol])))
+
+    def _ticker(self, stream, symbol, price):
+        if stream.endswith('@bookTicker'):
+            return {'u': now_ms(), 's': symbol, 'b': str(price), 'B': '1', 'a': str(price), 'A': '1'}
+        return {'e': '24hrMiniTicker', 'E': now_ms(), 's': symbol, 'c': str(price)}
+
+    def _broadcast_ticker(self, symbol, price):
+        prefix = f'{symbol.lower()}@'
+        with self.lock:
+            targets = [
+                (session, stream)
+                for session, streams in self.market_sessions.items()
+                for stream in streams if stream.startswith(prefix)
+            ]
+        for session, stream in targets:
+            session.send(json.dumps(self._ticker(stream, symbol, price)))
+
+    def _push_user(self, event):
+        with self.lock:
+            sessions = list(self.user_sessions)
+        message = json.dumps(event)
+        for session in sessions:
+            session.send(message)
+
+
+def encode_frame(payload, opcode=WS_TEXT):
+    """伺服器端 frame (不加遮罩)"""
+    header = bytearray([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header.append(length)
+    elif length < 1 << 16:
+        header.append(126)
+        header += struct.pack('>H', length)
+    else:
+        header.append(127)
+        header += struct.pack('>Q', length)
+    return bytes(header) + payload
+
+
+def read_frame(rfile):
+    """讀取一個 client frame，連線中斷時回傳 (None, b'')；不支援分段訊息"""
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None, b''
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', rfile.read(8))[0]
+    mask = rfile.read(4) if head[1] & 0x80 else None
+    payload = rfile.read(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class WebSocketSession:
+    """單一 websocket 連線；send() 可由撮合或行情執行緒呼叫"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def send(self, text, opcode=WS_TEXT):
+        data = encode_frame(text.encode('utf-8') if isinstance(text, str) else text, opcode)
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self.handler.wfile.write(data)
+                self.handler.wfile.flush()
+            except OSError:
+                self.closed = True
+
+    def close(self):
+        self.send(b'', WS_CLOSE)
+        with self._lock:
+            self.closed = True
+
+
+class MockExchangeHandler(BaseHTTPRequestHandler):
+    # keep-alive，讓 RestClient 的連線池可以重複使用連線
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get('Upgrade', '').lower() == 'websocket':
+            self.websocket()
+        else:
+            self.rest('GET')
+
+    def do_POST(self):
+        self.rest('POST')
+
+    def do_PUT(self):
+        self.rest('PUT')
+
+    def do_DELETE(self):
+        self.rest('DELETE')
+
+    def rest(self, method):
+        url = urlsplit(self.path)
+        query = url.query
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode('utf-8')
+            query = f'{query}&{body}' if query else body
+        status, payload = self.server.exchange.handle(method, url.path, query, self.headers)
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def websocket(self):
+        exchange = self.server.exchange
+        path = urlsplit(self.path).path
+        session = WebSocketSession(self)
+        if not exchange.attach(session, path):
+            self.send_error(404)
+            return
+
+        key = self.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        try:
+            while not session.closed:
+                opcode, payload = read_frame(self.rfile)
+                if opcode is None or opcode == WS_CLOSE:
+                    session.close()
+                    break
+                if opcode == WS_PING:
+                    session.send(payload, WS_PONG)
+                elif opcode == WS_TEXT:
+                    exchange.on_ws_message(session, payload.decode('utf-8'))
+        except OSError:
+            pass
+        finally:
+            exchange.detach(session)
+
+
+class MockExchangeServer(ThreadingHTTPServer):
+    """REST 與 websocket 共用同一個 port；以 BINANCE_BASE_URL / BINANCE_WS_URL 指向此處"""
+
+    daemon_threads = True
+
+    def __init__(self, exchange=None, host=MOCK_EXCHANGE_HOST, port=MOCK_EXCHANGE_PORT):
+        super().__init__((host, port), MockExchangeHandler)
+        self.exchange = exchange or MockExchange()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def ws_url(self):
+        host, port = self.server_address[:2]
+        return f'ws://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='mock-exchange', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.exchange.stop()
+        self.shutdown()
+        self.server_close()
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 ACTION_CHOICE = [
     ('BUY', 'BUY'),
@@ -15,19 +16,58 @@ class Trade(models.Model):
     price = models.DecimalField(max_digits=20, decimal_places=10)
     fee = models.DecimalField(max_digits=20, decimal_places=10)
     fee_symbol = models.CharField(max_length=10, null=True)
-    trade_date = models.DateTimeField(auto_now_add=True)
+    trade_date = models.DateTimeField(default=timezone.now)  # 交易所成交時間 (updateTime)
     trade_or_not = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, null=True)  # 交易所訂單狀態 (FILLED / CANCELED / EXPIRED ...)
+
+    class Meta:
+        indexes = [
+            # 報表皆以 user_email + pair + action 篩選並依 trade_date 排序
+            models.Index(fields=['user_email', 'pair', 'action', 'trade_date'], name='trade_user_pair_action_date'),
+            # 交易明細分頁以 (trade_date, id) 為 keyset
+            models.Index(fields=['user_email', 'trade_date', 'id'], name='trade_user_date_id'),
+        ]
 
 class SpotTrade(models.Model):
+    """未平倉買單 (open lot)：買單成交時建立，賣單成交時依 FIFO 扣減 open_position"""
     user_email = models.CharField(max_length=50, null=True)
-    id = models.CharField(max_length=20, primary_key=True)
-    quantity = models.DecimalField(max_digits=10, decimal_places=8)
+    id = models.CharField(max_length=20, primary_key=True)  # 買單 orderId
+    quantity = models.DecimalField(max_digits=20, decimal_places=10)
     pair = models.CharField(max_length=10)
-    open_position = models.DecimalField(max_digits=10, decimal_places=8)
-    sold_price = models.DecimalField(max_digits=10, decimal_places=8)
+    price = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    open_position = models.DecimalField(max_digits=20, decimal_places=10)
+    sold_price = models.DecimalField(max_digits=20, decimal_places=10, default=0)  # 最近一次扣減時的賣價
     sold_or_not = models.BooleanField(default=False)
-    profit = models.DecimalField(max_digits=10, decimal_places=8)
-    fee = models.DecimalField(max_digits=10, decimal_places=8)
-    fee_symbol = models.CharField(max_length=10, default='twd')
+    profit = models.DecimalField(max_digits=30, decimal_places=10, default=0)  # 已賣出部分的價差 (未扣手續費)
+    fee = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    fee_symbol = models.CharField(max_length=10, null=True, default='twd')
     exceed_or_not = models.BooleanField(default=False)
-    target_after_exceed = models.DecimalField(max_digits=10, decimal_places=8)
\ No newline at end of file
+    target_after_exceed = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    trade_date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # get_spots 只讀取仍有持倉的 lot
+            models.Index(fields=['user_email', 'sold_or_not', 'trade_date', 'id'], name='spot_user_open_date'),
+        ]
+
+class PnlLedger(models.Model):
+    """每個交易對的 FIFO 游標：目前對應中的買單與其剩餘數量，以及已處理到的最後一筆賣單"""
+    user_email = models.CharField(max_length=50, null=True)
+    pair = models.CharField(max_length=10)
+    buy_trade = models.ForeignKey(Trade, null=True, on_delete=models.SET_NULL, related_name='+')
+    buy_remaining = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    last_sell_date = models.DateTimeField(null=True)
+    last_sell_id = models.CharField(max_length=20, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_email', 'pair'], name='pnl_ledger_user_pair'),
+        ]
+
+class RealizedProfit(models.Model):
+    """賣單成交時以 FIFO 計算好的已實現損益"""
+    trade = models.OneToOneField(Trade, primary_key=True, on_delete=models.CASCADE, related_name='realized_profit')
+    profit = models.DecimalField(max_digits=30, decimal_places=10)
+    unmatched_qty = models.DecimalField(max_digits=20, decimal_places=10, default=0)
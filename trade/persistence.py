@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+
+from django.db import close_old_connections, connection
+
+from .models import Trade, SpotTrade
+from .ledger import apply_fills, rebuild_pair
+
+# 衝突時要覆寫的欄位 (trade_date 為交易所最後更新時間)
+TRADE_UPDATE_FIELDS = ['user_email', 'pair', 'action', 'quantity', 'price', 'fee', 'fee_symbol', 'trade_date', 'trade_or_not', 'status']
+
+_STOP = object()
+
+
+class TradeWriter:
+    """背景批次寫入 Trade，成交處理只需把資料放進佇列"""
+
+    def __init__(self, batch_size=50, flush_interval=0.5, max_queue=10000, log=print, on_flushed=None,
+                 retry_delay=0.5, max_retry_delay=30):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.log = log
+        self.on_flushed = on_flushed  # on_flushed(訂單 id, 異動的 lot id)，寫入與 ledger 更新完成後呼叫
+        # 寫入失敗後的重試間隔 (秒)，每次加倍直到 max_retry_delay
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.dirty_pairs = set()  # ledger 增量更新失敗、待 rebuild_pair 的 (user_email, pair)
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name='trade-writer', daemon=True)
+        self.thread.start()
+
+    def offer(self, fields):
+        """不等待地排入一筆 Trade 欄位資料，佇列已滿時回傳 False"""
+        try:
+            self.queue.put_nowait(fields)
+        except queue.Full:
+            return False
+        return True
+
+    def submit(self, fields):
+        """排入一筆 Trade 欄位資料 (需包含 id)"""
+        if not self.offer(fields):
+            # 佇列滿代表資料庫跟不上，只能等待，避免遺失成交紀錄
+            self.log(f"⚠️ Trade 寫入佇列已滿 ({self.queue.maxsize})，等待資料庫寫入")
+            self.queue.put(fields)
+
+    def join(self):
+        """等待目前佇列中的資料全部寫入"""
+        self.queue.join()
+
+    def stop(self, timeout=10):
+        """送出停止訊號，寫完佇列中剩餘資料後結束"""
+        if self.thread is None:
+            return
+        self.queue.put(_STOP)
+        self.thread.join(timeout=timeout)
+        if not self.thread.is_alive():
+            self.thread = None
+
+    def _run(self):
+        try:
+            while True:
+                batch = []
+                deadline = None
+                stopping = False
+                while len(batch) < self.batch_size:
+                    try:
+                        if deadline is None:
+                            item = self.queue.get()
+                        else:
+                            item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        self.queue.task_done()
+                        stopping = True
+                        break
+                    batch.append(item)
+                    if deadline is None:
+                        # 收到第一筆後開始計時，達到批次大小或時間到就寫入
+                        deadline = time.monotonic() + self.flush_interval
+
+                if batch:
+                    self._flush(batch)
+                if stopping:
+                    return
+        finally:
+            connection.close()
+
+    def _flush(self, batch):
+        # 同一訂單在同一批內只保留最後一次狀態
+        latest = {}
+        for fields in batch:
+            latest[str(fields['id'])] = fields
+        try:
+            self._write(latest)
+            # 成交落地後再推進 FIFO ledger，報表直接讀預先算好的損益
+            try:
+                lot_ids = apply_fills(latest.values())
+            except Exception as e:
+                self.log(f"❌ 損益 ledger 更新失敗，改為重算交易對: {e}")
+                self.dirty_pairs.update((fields['user_email'], fields['pair']) for fields in latest.values())
+                lot_ids = []
+            lot_ids += self._rebuild_dirty_pairs()
+            if self.on_flushed is not None:
+                try:
+                    self.on_flushed(list(latest), lot_ids)
+                except Exception as e:
+                    self.log(f"❌ 成交事件推送失敗: {e}")
+        finally:
+            # 寫入成功後才標記完成，join() 不會在資料落地前返回
+            for _ in batch:
+                self.queue.task_done()
+
+    def _write(self, latest):
+        """寫入失敗時整批保留，退避後重試直到成功，成交紀錄不能遺失"""
+        delay = self.retry_delay
+        while True:
+            try:
+                close_old_connections()
+                Trade.objects.bulk_create(
+                    [Trade(**fields) for fields in latest.values()],
+                    update_conflicts=True,
+                    unique_fields=['id'],
+                    update_fields=TRADE_UPDATE_FIELDS,
+                )
+                return
+            except Exception as e:
+                self.log(f"❌ Trade 批次寫入失敗 ({len(latest)} 筆)，{delay} 秒後重試: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def _rebuild_dirty_pairs(self):
+        """從頭重算 ledger 更新失敗的交易對，仍失敗的留待下一批寫入後再試；回傳重建後的 open lot id"""
+        lot_ids = []
+        for email, pair in list(self.dirty_pairs):
+            try:
+                rebuild_pair(email, pair)
+            except Exception as e:
+                self.log(f"❌ {pair} 損益重算失敗，下一批寫入後再試: {e}")
+                continue
+            self.dirty_pairs.discard((email, pair))
+            lot_ids.extend(SpotTrade.objects.filter(user_email=email, pair=pair).values_list('id', flat=True))
+        return lot_ids
@@ -0,0 +1,126 @@
+import threading
+from .ws import TradeWSManager
+from .persistence import TradeWriter
+from .dispatcher import OrderDispatcher
+from .user_stream import UserDataStream
+from .market_data import MarketDataFeed
+from .history_log import history_print
+from .events import publish_balance_event
+from .reports import publish_flushed
+
+
+class BaseBotRegistry:
+    """以交易對為 key 管理多個網格機器人的共同介面 (供 views 使用)，本身不持有連線或執行緒資源
+
+    子類別實作 start() 與 execute()：BotRegistry 以執行緒執行，AsyncBotRegistry 交給事件迴圈
+    """
+
+    def __init__(self, bots=None):
+        self.bots = {} if bots is None else bots
+        self.lock = threading.RLock()
+
+    def get(self, pair):
+        return self.bots.get(pair)
+
+    def running_bots(self):
+        return [bot for bot in self.bots.values() if bot.is_running]
+
+    def resolve(self, pair=None):
+        """取得指定交易對的機器人；未指定時若只有一個運行中則回傳該機器人"""
+        if pair:
+            return self.bots.get(pair)
+        running = self.running_bots()
+        return running[0] if len(running) == 1 else None
+
+    def start(self, pair, **params):
+        raise NotImplementedError
+
+    def stop(self, pair):
+        with self.lock:
+            bot = self.bots.get(pair)
+            if bot is None:
+                return '機器人未運行'
+            return self.execute(bot, bot.stop())
+
+    def update(self, pair, **params):
+        bot = self.bots.get(pair)
+        if bot is None:
+            return '機器人未運行'
+        return self.execute(bot, bot.update(**params))
+
+    def stop_all(self):
+        with self.lock:
+            for bot in self.running_bots():
+                self.execute(bot, bot.stop())
+
+    def execute(self, bot, steps):
+        """執行機器人的流程並回傳結果"""
+        raise NotImplementedError
+
+
+class BotRegistry(BaseBotRegistry):
+    """以執行緒執行的多交易對網格，共用一條 user-data websocket、TradeWriter 與 dispatcher"""
+
+    def __init__(self):
+        super().__init__()
+        self.trade_writer = TradeWriter(log=history_print, on_flushed=publish_flushed)
+        self.dispatcher = OrderDispatcher()
+        self.stream = UserDataStream(on_event=self.dispatch, on_lost=self.on_stream_lost, log=history_print)
+        self.market_data = MarketDataFeed(log=history_print)
+
+    def dispatch(self, event):
+        """依 executionReport 的 symbol 排入對應機器人的佇列 (各自一條執行緒處理)，餘額異動直接推送給前端"""
+        if event.get('e') == 'outboundAccountPosition':
+            publish_balance_event(event)
+            return
+        if event.get('e') != 'executionReport':
+            return
+        bot = self.bots.get(event.get('s'))
+        if bot is not None and bot.is_running:
+            bot.events.put(event)
+
+    def start(self, pair, **params):
+        with self.lock:
+            bot = self.bots.get(pair)
+            if bot is not None and bot.is_running:
+                return "機器人運作中"
+            if bot is None:
+                bot = TradeWSManager(
+                    stream=self.stream,
+                    trade_writer=self.trade_writer,
+                    dispatcher=self.dispatcher,
+                    market_data=self.market_data,
+                    on_stopped=self.on_bot_stopped,
+                )
+                self.bots[pair] = bot
+
+            self.trade_writer.start()
+            error = self.stream.start()
+            if error:
+                self._release_stream()
+                return error
+            resp = self.execute(bot, bot.start(pair=pair, **params))
+            if resp != 0 and not bot.is_running:
+                self._release_stream()
+            return resp
+
+    def execute(self, bot, steps):
+        """在呼叫端執行緒執行機器人的流程"""
+        return bot.run(steps)
+
+    def on_bot_stopped(self, bot):
+        # 機器人可能因風控或初始掛單失敗自行停止，一樣要釋放共用資源
+        with self.lock:
+            self._release_stream()
+
+    def on_stream_lost(self, reason):
+        for bot in self.running_bots():
+            bot.error_message.append(reason)
+            bot.history_print(f"❌ {reason}")
+            bot.run(bot.stop())
+
+    def _release_stream(self):
+        # 沒有任何機器人運行時關閉共用的 websocket，並寫完待寫入的成交
+        if not self.running_bots():
+            self.stream.stop()
+            self.trade_writer.stop()
@@ -0,0 +1,160 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+from django.utils import timezone
+from .grid_bot import EMAIL
+from .models import Trade, SpotTrade
+from .events import publish
+
+# 分頁 limit 上限
+PAGE_SIZE_MAX = 1000
+# 串流模式每次從資料庫取出的筆數
+STREAM_CHUNK_SIZE = 500
+
+
+def format_date(value):
+    return timezone.localtime(value).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def encode_cursor(trade_date, trade_id):
+    raw = f'{trade_date.isoformat()}|{trade_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """回傳 (trade_date, id)，格式錯誤時拋出 ValueError"""
+    try:
+        trade_date, trade_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(trade_date), trade_id
+    except ValueError:
+        raise ValueError(f'cursor 格式錯誤: {cursor}')
+
+
+def before(queryset, trade_date, trade_id):
+    """(trade_date, id) 之前的資料 (keyset，由新到舊翻頁)"""
+    return queryset.filter(Q(trade_date__lt=trade_date) | Q(trade_date=trade_date, id__lt=trade_id))
+
+
+def user_history(email=EMAIL):
+    """依 (trade_date, id) 由新到舊，走 (user_email, trade_date, id) 索引"""
+    return (
+        Trade.objects.filter(user_email=email)
+        .select_related('realized_profit')
+        .order_by('-trade_date', '-id')
+    )
+
+
+def keyset_page(queryset, limit, cursor, to_row):
+    """queryset 需依 (-trade_date, -id) 排序，回傳 (本頁資料, 下一頁 cursor)，沒有下一頁時 cursor 為 None"""
+    if cursor:
+        queryset = before(queryset, *decode_cursor(cursor))
+    page = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        last = page[limit - 1]
+        next_cursor = encode_cursor(last.trade_date, last.id)
+    return [to_row(item) for item in page[:limit]], next_cursor
+
+
+def trade_page(limit, cursor=None, email=EMAIL):
+    return keyset_page(user_history(email), limit, cursor, trade_row)
+
+
+def keyset_stream(queryset, limit, cursor, to_row, chunk_size=STREAM_CHUNK_SIZE):
+    """串流版 keyset_page：回傳逐筆產生資料列的 generator，結束時以 return 值 (StopIteration.value) 給出下一頁 cursor
+
+    cursor 在建立時就解析，格式錯誤時於開始輸出前拋出 ValueError
+    """
+    if cursor:
+        queryset = before(queryset, *decode_cursor(cursor))
+    if limit is not None:
+        queryset = queryset[:limit + 1]
+        chunk_size = min(chunk_size, limit + 1)
+
+    def rows():
+        last = None
+        for count, item in enumerate(queryset.iterator(chunk_size=chunk_size)):
+            if count == limit:
+                return encode_cursor(last.trade_date, last.id)
+            yield to_row(item)
+            last = item
+        return None
+
+    return rows()
+
+
+def iter_trade_rows(limit=None, cursor=None, email=EMAIL, chunk_size=STREAM_CHUNK_SIZE):
+    """串流輸出用，記憶體只保留一個 chunk"""
+    return keyset_stream(user_history(email), limit, cursor, trade_row, chunk_size)
+
+
+def trade_report(email=EMAIL):
+    """單一查詢讀出所有成交，賣單損益直接取自 ledger 預先算好的結果"""
+    trades = (
+        Trade.objects.filter(user_email=email)
+        .select_related('realized_profit')
+        .order_by('trade_date')
+    )
+    return [trade_row(trade) for trade in trades.iterator(chunk_size=STREAM_CHUNK_SIZE)]
+
+
+def trade_row(trade):
+    row = {
+        "id" : trade.id,
+        "pair" : trade.pair,
+        "action" : trade.action,
+        "price" : float(trade.price),
+        "fee" : float(trade.fee),
+        "fee_symbol" : trade.fee_symbol,
+        "quantity" : float(trade.quantity),
+        "trade_date" : format_date(trade.trade_date)
+    }
+    # 賣單一律帶 profit 欄位；尚未完全成交 (或 ledger 尚未重建) 時為 None
+    if trade.action == 'SELL':
+        realized = getattr(trade, 'realized_profit', None)
+        row["profit"] = realized.profit if realized is not None else None
+    return row
+
+
+def open_spot_lots(email=EMAIL):
+    """仍有持倉的 open lot，由新到舊，走 (user_email, sold_or_not, trade_date, id) 索引"""
+    return SpotTrade.objects.filter(user_email=email, sold_or_not=False).order_by('-trade_date', '-id')
+
+
+def spot_row(lot):
+    # 整筆未動用的 lot 扣掉手續費顯示，部分賣出的 lot 只顯示剩餘數量
+    if lot.open_position == lot.quantity:
+        quantity = float(lot.quantity) - float(lot.fee)
+    else:
+        quantity = float(lot.open_position)
+    return {
+        "id": lot.id,
+        "pair": lot.pair,
+        "price": float(lot.price),
+        "quantity": quantity,
+        "trade_date": format_date(lot.trade_date)
+    }
+
+
+def spot_report(email=EMAIL):
+    return [spot_row(lot) for lot in open_spot_lots(email)]
+
+
+def iter_spot_rows(limit=None, cursor=None, email=EMAIL, chunk_size=STREAM_CHUNK_SIZE):
+    return keyset_stream(open_spot_lots(email), limit, cursor, spot_row, chunk_size)
+
+
+def spot_page(limit, cursor=None, email=EMAIL):
+    return keyset_page(open_spot_lots(email), limit, cursor, spot_row)
+
+
+def publish_flushed(trade_ids, lot_ids):
+    """TradeWriter 寫入一批後推送異動的明細列與持倉列 (已賣完的持倉以 removed 通知前端移除)"""
+    trades = Trade.objects.filter(pk__in=trade_ids).select_related('realized_profit').order_by('trade_date', 'id')
+    for trade in trades:
+        publish('trade', row=trade_row(trade))
+    for lot in SpotTrade.objects.filter(pk__in=lot_ids).order_by('trade_date', 'id'):
+        if lot.sold_or_not:
+            publish('spot', id=lot.id, pair=lot.pair, removed=True)
+        else:
+            publish('spot', row=spot_row(lot))
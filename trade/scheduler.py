@@ -0,0 +1,176 @@
+import os
+import time
+import asyncio
+import heapq
+import itertools
+import threading
+import requests
+from .metrics import scheduler_wait, rate_limit_bans
+
+# Binance 現貨預設限制 (exchangeInfo rateLimits)
+BINANCE_WEIGHT_LIMIT = int(os.getenv('BINANCE_WEIGHT_LIMIT', 6000))          # 每分鐘 request weight
+BINANCE_ORDER_LIMIT_10S = int(os.getenv('BINANCE_ORDER_LIMIT_10S', 100))     # 每 10 秒下單數
+BINANCE_ORDER_LIMIT_1D = int(os.getenv('BINANCE_ORDER_LIMIT_1D', 200000))    # 每日下單數
+# 查詢與報表類請求需保留的 weight 比例，確保取消與補單不會被擠掉
+SCHEDULER_RESERVE = float(os.getenv('SCHEDULER_RESERVE', 0.2))
+# 排隊超過此秒數即放棄請求
+SCHEDULER_MAX_WAIT = float(os.getenv('SCHEDULER_MAX_WAIT', 30))
+# asyncio 版本不是隊首時重新檢查的間隔秒數
+SCHEDULER_POLL_INTERVAL = 0.01
+
+# 優先順序 (數字越小越優先)
+CANCEL, ORDER, QUERY, REPORT = 0, 1, 2, 3
+LANE_NAMES = {CANCEL: 'cancel', ORDER: 'order', QUERY: 'query', REPORT: 'report'}
+
+# (method, path) -> (lane, request weight, 下單數)；weight 依 Binance 文件 (帶 symbol 參數時)
+ENDPOINT_COSTS = {
+    ('DELETE', '/api/v3/order'): (CANCEL, 1, 0),
+    ('DELETE', '/api/v3/openOrders'): (CANCEL, 1, 0),
+    ('POST', '/api/v3/order'): (ORDER, 1, 1),
+    ('PUT', '/api/v3/order/amend/keepPriority'): (ORDER, 4, 1),
+    ('GET', '/api/v3/ticker/price'): (QUERY, 2, 0),
+    ('GET', '/api/v3/order'): (QUERY, 4, 0),
+    ('GET', '/api/v3/openOrders'): (QUERY, 6, 0),
+    ('POST', '/api/v3/userDataStream'): (QUERY, 2, 0),
+    ('PUT', '/api/v3/userDataStream'): (QUERY, 2, 0),
+    ('GET', '/api/v3/exchangeInfo'): (QUERY, 20, 0),
+    ('GET', '/api/v3/myTrades'): (REPORT, 20, 0),
+    ('GET', '/api/v3/account'): (REPORT, 20, 0),
+}
+
+
+def request_cost(method, path):
+    return ENDPOINT_COSTS.get((method, path), (QUERY, 1, 0))
+
+
+class RateLimitExceeded(requests.RequestException):
+    """無法在 SCHEDULER_MAX_WAIT 內取得額度 (或仍在 429/418 封鎖期間)"""
+
+
+class TokenBucket:
+    def __init__(self, capacity, interval):
+        self.capacity = capacity
+        self.rate = capacity / interval
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount, reserve=0.0):
+        """取得 amount 且剩餘不低於 reserve 需等待的秒數"""
+        needed = amount + reserve - self.tokens
+        return 0.0 if needed <= 0 else needed / self.rate
+
+    def consume(self, amount):
+        self.tokens -= amount
+
+    def sync(self, used):
+        """以交易所回報的已使用量校正 (只往下修，避免漏算進行中的請求)"""
+        self.tokens = min(self.tokens, self.capacity - used)
+
+
+class RequestScheduler:
+    """集中管理 Binance REST 的 request weight 與下單數限制
+
+    每個限制一個 token bucket，並以回應標頭 X-MBX-USED-WEIGHT-* / X-MBX-ORDER-COUNT-* 校正；
+    等待中的請求依 lane 優先順序 (取消 > 補單 > 查詢 > 報表) 放行，同 lane 先到先放行。
+    收到 429 / 418 時依 Retry-After 暫停所有請求。
+    """
+
+    def __init__(self, weight_limit=BINANCE_WEIGHT_LIMIT, order_limit_10s=BINANCE_ORDER_LIMIT_10S,
+                 order_limit_1d=BINANCE_ORDER_LIMIT_1D, reserve=SCHEDULER_RESERVE, max_wait=SCHEDULER_MAX_WAIT):
+        self.weight = TokenBucket(weight_limit, 60)
+        self.order_buckets = [TokenBucket(order_limit_10s, 10), TokenBucket(order_limit_1d, 86400)]
+        self.headers = {
+            'X-MBX-USED-WEIGHT-1M': self.weight,
+            'X-MBX-ORDER-COUNT-10S': self.order_buckets[0],
+            'X-MBX-ORDER-COUNT-1D': self.order_buckets[1],
+        }
+        self.reserve = reserve * weight_limit
+        self.max_wait = max_wait
+        self.banned_until = 0.0
+        self._waiting = []  # (lane, 序號) 的 heap
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _delay(self, lane, weight, orders, now):
+        delays = [self.banned_until - now]
+        for bucket in [self.weight] + self.order_buckets:
+            bucket.refill(now)
+        delays.append(self.weight.delay(weight, self.reserve if lane > ORDER else 0.0))
+        if orders:
+            delays.extend(bucket.delay(orders) for bucket in self.order_buckets)
+        return max(delays + [0.0])
+
+    def _poll(self, ticket, weight, orders, deadline):
+        """(持有鎖時呼叫) 輪到且額度足夠時扣除額度並回傳 0，否則回傳需等待秒數 (None 代表等前面的請求)"""
+        now = time.monotonic()
+        lane = ticket[0]
+        delay = self._delay(lane, weight, orders, now) if self._waiting[0] == ticket else None
+        if delay == 0:
+            self.weight.consume(weight)
+            for bucket in self.order_buckets:
+                bucket.consume(orders)
+            return 0.0
+        if now >= deadline or (delay is not None and now + delay > deadline):
+            raise RateLimitExceeded(f'{LANE_NAMES[lane]} 請求無法在 {self.max_wait} 秒內取得額度')
+        return delay
+
+    def _leave(self, ticket):
+        self._waiting.remove(ticket)
+        heapq.heapify(self._waiting)
+        self._cond.notify_all()
+
+    def acquire(self, lane, weight=1, orders=0):
+        """排隊直到輪到此請求且額度足夠，逾時拋出 RateLimitExceeded"""
+        ticket = (lane, next(self._sequence))
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    delay = self._poll(ticket, weight, orders, deadline)
+                    if delay == 0:
+                        break
+                    # 不是隊首時等前面的請求放行後被喚醒
+                    self._cond.wait(min(delay if delay is not None else self.max_wait, deadline - time.monotonic()))
+            finally:
+                self._leave(ticket)
+        scheduler_wait.observe(time.monotonic() - started, LANE_NAMES[lane])
+
+    async def acquire_async(self, lane, weight=1, orders=0):
+        """acquire 的 asyncio 版本：與同步請求共用同一個佇列與額度，等待時不佔用事件迴圈"""
+        ticket = (lane, next(self._sequence))
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                with self._cond:
+                    delay = self._poll(ticket, weight, orders, deadline)
+                if delay == 0:
+                    break
+                # 事件迴圈無法等 Condition 的通知，不是隊首時以短間隔重新檢查
+                await asyncio.sleep(min(delay if delay is not None else SCHEDULER_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+        finally:
+            with self._cond:
+                self._leave(ticket)
+        scheduler_wait.observe(time.monotonic() - started, LANE_NAMES[lane])
+
+    def observe(self, status_code, headers):
+        """以回應標頭校正用量；429 / 418 依 Retry-After 暫停"""
+        with self._cond:
+            for header, bucket in self.headers.items():
+                used = headers.get(header)
+                if used is not None:
+                    bucket.refill(time.monotonic())
+                    bucket.sync(int(used))
+            if status_code in (429, 418):
+                rate_limit_bans.inc(str(status_code))
+                retry_after = float(headers.get('Retry-After') or 60)
+                self.banned_until = max(self.banned_until, time.monotonic() + retry_after)
+            self._cond.notify_all()
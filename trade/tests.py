@@ -1,3 +1,1396 @@
-from django.test import TestCase
+import os
+import json
+import time
+import random
+import itertools
+import threading
+import tempfile
+import numpy as np
+import re
+import base64
+import asyncio
+import hashlib
+import unittest
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase
+from .backtest import GridBacktest, load_prices, resample
+from django.contrib.auth.models import User
+from .ws import TradeWSManager
+from .grid_bot import EMAIL, GridBot, Blocking, exchange_time
+from .persistence import TradeWriter
+from .models import Trade, RealizedProfit, SpotTrade, PnlLedger
+from .benchmarks import StubResponse, regressions, run_benchmarks
+from .ledger import apply_fills, rebuild, match_sells, filled_trades, after, fill_key
+from .reports import trade_report, spot_report, trade_page
+from .scheduler import RequestScheduler, RateLimitExceeded, CANCEL, ORDER, QUERY, REPORT
+from .fees import FeeAccumulator
+from .exchange_info import ExchangeInfoCache, exchange_info
+from .dispatcher import OrderDispatcher
+from .registry import BotRegistry
+from .market_data import MarketDataFeed
+from .volatility import RollingWindow, VolatilityGuard
+from .grid import ladder, diff_ladder
+from .fifo import FixedColumns, fifo_match, fifo_match_vectorized, from_fixed
+from .client import binance, BinanceClient, RestClient
+from .metrics import observe_fill_reaction
+from .mock_exchange import MockExchange, MockExchangeServer, WS_GUID
+from .async_ws import connect, WebSocketClosed
+from .async_engine import AsyncBotRegistry, AsyncEngine
+from .events import EventHub, Subscription, event_stream, parse_last_id, hub
+from . import history_log
 
-# Create your tests here.
+
+def redirect_history_file(path):
+    """關閉已開啟的交易歷程檔案，下一筆紀錄起改寫到 path；回傳原路徑"""
+    handler = history_log._listener.handlers[0]
+    with handler.lock:
+        if handler.stream is not None:
+            handler.stream.close()
+            handler.stream = None
+        previous, handler.baseFilename = handler.baseFilename, path
+    return previous
+
+
+def setUpModule():
+    # 交易歷程與 exchangeInfo 快照寫到暫存目錄，測試結束後連同目錄刪除，不留在專案目錄
+    output_dir = tempfile.TemporaryDirectory(prefix='bitobot-test-')
+    unittest.addModuleCleanup(output_dir.cleanup)
+    previous = redirect_history_file(os.path.join(output_dir.name, 'debug.txt'))
+    unittest.addModuleCleanup(redirect_history_file, previous)
+    snapshot = mock.patch.object(exchange_info, 'snapshot_path', os.path.join(output_dir.name, 'exchange_info.json'))
+    snapshot.start()
+    unittest.addModuleCleanup(snapshot.stop)
+
+
+class HTTPResponse(StubResponse):
+    """benchmarks 的固定回應加上 raise_for_status，供 ScriptedClient 路由使用"""
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise OSError(f"HTTP {self.status_code}")
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def tick(self, seconds=1.0):
+        self.now += seconds
+        return self.now
+
+
+class RecordingTradeWriter:
+    """取代背景 TradeWriter，只記錄送出的欄位"""
+
+    def __init__(self):
+        self.rows = []
+
+    def offer(self, fields):
+        self.rows.append(fields)
+        return True
+
+    def submit(self, fields):
+        self.rows.append(fields)
+
+    def start(self):
+        pass
+
+    def stop(self, timeout=None):
+        pass
+
+    def join(self):
+        pass
+
+
+class ScriptedClient:
+    """依 (method, path) 回傳預設回應的 REST client，記錄每次呼叫；回應可為 list (依序取用) 或 callable(params)"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    def request(self, method, path, params=None):
+        self.calls.append((method, path, params))
+        route = self.routes[(method, path)]
+        if isinstance(route, list):
+            route = route.pop(0)
+        return route(params) if callable(route) else route
+
+    signed = keyed = public = request
+
+    def prewarm(self, connections=1):
+        pass
+
+
+def trade_report_event(order_id, trade_id, status, last_qty, cum_qty, fee, order_time=1700000000000):
+    return {
+        'e': 'executionReport', 's': 'BTCUSDT', 'i': order_id, 'S': 'BUY', 'x': 'TRADE', 'X': status,
+        'p': '100', 'q': '2', 'z': cum_qty, 'l': last_qty, 'n': fee, 'N': 'BNB', 't': trade_id,
+        'T': order_time + 1000, 'O': order_time,
+    }
+
+
+def exchange_info_response(*symbols):
+    return HTTPResponse({'symbols': [
+        {
+            'symbol': symbol, 'status': 'TRADING', 'baseAsset': symbol[:-4], 'quoteAsset': 'USDT',
+            'filters': [
+                {'filterType': 'PRICE_FILTER', 'tickSize': '0.01'},
+                {'filterType': 'LOT_SIZE', 'minQty': '0.00001', 'stepSize': '0.00001'},
+                {'filterType': 'NOTIONAL', 'minNotional': '5'},
+            ],
+        }
+        for symbol in symbols
+    ]})
+
+
+class MockClientTestCase(TestCase):
+    """TradeWSManager 的 REST 換成 ScriptedClient，stream、寫入皆為 stub，交易歷程記在 self.logs；背景流程改為同步執行"""
+
+    def setUp(self):
+        self.logs = []
+        for patch in (
+            mock.patch.object(TradeWSManager, 'history_print', lambda bot, txt, **fields: self.logs.append(txt)),
+            mock.patch('trade.grid_bot.send_telegram', mock.Mock(return_value=None)),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def bot(self, routes=None, pair='BTCUSDT'):
+        """routes 未指定時沿用前一次建立的 ScriptedClient (多個機器人共用)"""
+        if routes is not None:
+            self.rest = ScriptedClient(routes)
+            patch = mock.patch('trade.ws.binance', self.rest)
+            patch.start()
+            self.addCleanup(patch.stop)
+        bot = TradeWSManager(stream=mock.Mock(), trade_writer=RecordingTradeWriter())
+        self.addCleanup(bot.dispatcher.shutdown)
+        bot.spawn = bot.run
+        bot.pair = pair
+        bot.is_running = True
+        return bot
+
+    def paths(self):
+        return [(method, path) for method, path, _ in self.rest.calls]
+
+
+class FeeAccumulatorTests(MockClientTestCase):
+    def test_duplicate_trade_is_counted_once(self):
+        fees = FeeAccumulator()
+        report = trade_report_event(1, 10, 'PARTIALLY_FILLED', '1', '1', '0.01')
+        fees.add(report)
+        fees.add(report)  # 重連後重送
+        fees.add({**report, 'x': 'NEW', 't': -1})
+        self.assertEqual(fees.get(1, '1'), (Decimal('0.01'), 'BNB', True))
+
+    def test_partial_fills_complete_when_quantities_match(self):
+        fees = FeeAccumulator()
+        fees.add(trade_report_event(1, 10, 'PARTIALLY_FILLED', '0.5', '0.5', '0.01'))
+        self.assertEqual(fees.get(1, '2'), (Decimal('0.01'), 'BNB', False))
+        fees.add(trade_report_event(1, 11, 'FILLED', '1.5', '2', '0.02'))
+        self.assertEqual(fees.get(1, '2'), (Decimal('0.03'), 'BNB', True))
+        fees.pop(1)
+        self.assertEqual(fees.get(1, '0'), (Decimal(0), None, True))
+
+    def test_missed_partial_fill_is_reconciled_from_my_trades(self):
+        my_trades = HTTPResponse([
+            {'orderId': 1, 'commission': '0.01', 'commissionAsset': 'BNB'},
+            {'orderId': 1, 'commission': '0.02', 'commissionAsset': 'BNB'},
+            {'orderId': 2, 'commission': '5', 'commissionAsset': 'BNB'},  # 非待補齊訂單
+        ])
+        bot = self.bot({('GET', '/api/v3/myTrades'): my_trades})
+        # 第一筆部分成交的推送遺失，只收到最後一筆
+        with mock.patch.object(bot, 'spawn') as spawn:
+            bot.run(bot.on_execution_report(trade_report_event(1, 11, 'FILLED', '1.5', '2', '0.02')))
+        spawn.assert_called_once()
+        self.assertEqual(bot.pending_fee_orders, {1: ('BTCUSDT', 1700000000000)})
+        self.assertEqual([row['fee'] for row in bot.trade_writer.rows], [Decimal('0.02')])
+        Trade.objects.create(
+            id='1', user_email=EMAIL, pair='BTCUSDT', action='BUY', quantity=Decimal('2'), price=Decimal('100'),
+            fee=Decimal('0.02'), trade_or_not=True,
+        )
+
+        bot.run(bot.reconcile_fees())
+        self.assertEqual(self.rest.calls, [
+            ('GET', '/api/v3/myTrades', {'symbol': 'BTCUSDT', 'limit': 1000, 'startTime': 1700000000000}),
+        ])
+        self.assertEqual(bot.pending_fee_orders, {})
+        trade = Trade.objects.get(id='1')
+        self.assertEqual((trade.fee, trade.fee_symbol), (Decimal('0.03'), 'BNB'))
+
+    def test_failed_my_trades_requeues_pending_orders(self):
+        bot = self.bot({('GET', '/api/v3/myTrades'): HTTPResponse({'code': -1003}, status_code=429)})
+        bot.pending_fee_orders[1] = ('BTCUSDT', 1700000000000)
+        bot.run(bot.reconcile_fees())
+        self.assertEqual(bot.pending_fee_orders, {1: ('BTCUSDT', 1700000000000)})
+
+class OrderDispatcherTests(MockClientTestCase):
+    def test_results_keep_input_order_and_errors(self):
+        dispatcher = OrderDispatcher(max_workers=4)
+        self.addCleanup(dispatcher.shutdown)
+
+        def work(delay, value):
+            time.sleep(delay)
+            if value is None:
+                raise ValueError('rejected')
+            return value
+
+        results = dispatcher.run_all(work, [(0.05, 'a'), (0, None), (0.01, 'c')])
+        self.assertEqual(results[0], 'a')
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], 'c')
+
+    def test_concurrency_is_bounded(self):
+        dispatcher = OrderDispatcher(max_workers=3)
+        self.addCleanup(dispatcher.shutdown)
+        lock = threading.Lock()
+        active, peak = 0, 0
+
+        def work(_):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+
+        dispatcher.run_all(work, [(i,) for i in range(12)])
+        self.assertEqual(peak, 3)
+        self.assertEqual(OrderDispatcher(max_workers=0).max_workers, 1)
+
+    def test_initial_ladder_is_placed_in_parallel(self):
+        order_ids = itertools.count(1)
+        barrier = threading.Barrier(4, timeout=2)
+
+        def place(params):
+            # 四筆請求必須同時在途才會全部通過
+            barrier.wait()
+            if float(params['price']) == 98:
+                raise OSError('connection reset')
+            return HTTPResponse({'orderId': next(order_ids)})
+
+        bot = self.bot({
+            ('GET', '/api/v3/ticker/price'): HTTPResponse({'symbol': 'BTCUSDT', 'price': '100'}),
+            ('POST', '/api/v3/order'): place,
+        })
+        bot.order_size, bot.precision, bot.trade_count = 1, 0, 2
+        bot.price_increase_percentage = bot.price_decrease_percentage = 0.01
+        bot.run(bot.place_initial_orders())
+        self.assertEqual(sorted(bot.sell_orders + bot.buy_orders), [1, 2, 3])
+        self.assertEqual(len(bot.buy_orders), 1)
+
+
+class CancelAllOrdersTests(MockClientTestCase):
+    def grid_bot(self, routes):
+        bot = self.bot(routes)
+        bot.buy_orders[:] = [1, 2]
+        bot.sell_orders[:] = [3, 4]
+        return bot
+
+    def test_batch_cancel_forgets_cancelled_orders(self):
+        bot = self.grid_bot({('DELETE', '/api/v3/openOrders'): HTTPResponse([
+            {'orderId': 1}, {'orderId': 3},
+            {'orderListId': 9, 'orderReports': [{'orderId': 4}]},  # OCO
+        ])})
+        result = bot.run(bot.cancel_all_orders())
+        self.assertEqual(result, {'cancelled': [1, 3, 4], 'failed': []})
+        self.assertEqual((bot.buy_orders, bot.sell_orders), ([2], []))
+
+    def test_unknown_order_clears_local_orders(self):
+        # -2011：交易所上已沒有任何掛單，本地清單直接清空，不再逐筆取消
+        bot = self.grid_bot({('DELETE', '/api/v3/openOrders'): HTTPResponse(
+            {'code': -2011, 'msg': 'Unknown order sent.'}, status_code=400,
+        )})
+        result = bot.run(bot.cancel_all_orders())
+        self.assertEqual(result, {'cancelled': [], 'failed': []})
+        self.assertEqual((bot.buy_orders, bot.sell_orders), ([], []))
+        self.assertEqual(self.paths(), [('DELETE', '/api/v3/openOrders')])
+
+    def test_batch_failure_falls_back_to_parallel_cancel(self):
+        def cancel_one(params):
+            if params['orderId'] == 3:
+                return HTTPResponse({'code': -1021, 'msg': 'Timestamp outside recvWindow'}, status_code=400)
+            return HTTPResponse({'orderId': params['orderId'], 'status': 'CANCELED'})
+
+        bot = self.grid_bot({
+            ('DELETE', '/api/v3/openOrders'): HTTPResponse({'code': -1003, 'msg': 'Too many requests'}, status_code=429),
+            ('GET', '/api/v3/openOrders'): HTTPResponse([{'orderId': o} for o in (1, 2, 3, 4)]),
+            ('DELETE', '/api/v3/order'): cancel_one,
+        })
+        result = bot.run(bot.cancel_all_orders())
+        self.assertEqual(result, {'cancelled': [1, 2, 4], 'failed': [3]})
+        self.assertEqual((bot.buy_orders, bot.sell_orders), ([], [3]))
+        self.assertEqual(self.paths().count(('DELETE', '/api/v3/order')), 4)
+        self.assertTrue(any('訂單 3 取消失敗' in message for message in bot.error_message))
+
+    def test_fallback_without_open_orders_list(self):
+        bot = self.grid_bot({
+            ('DELETE', '/api/v3/openOrders'): HTTPResponse({'code': -1003}, status_code=429),
+            ('GET', '/api/v3/openOrders'): HTTPResponse({'code': -1003}, status_code=429),
+        })
+        result = bot.run(bot.cancel_all_orders())
+        self.assertEqual(result, {'cancelled': [], 'failed': []})
+        self.assertEqual((bot.buy_orders, bot.sell_orders), ([1, 2], [3, 4]))
+
+
+class GridLadderTests(TestCase):
+    def live(self, target, qty='1', executed='0', first_id=1):
+        return [
+            {'orderId': first_id + i, 'side': side, 'price': f'{price:.2f}', 'origQty': qty, 'executedQty': executed}
+            for i, (side, price) in enumerate(target)
+        ]
+
+    def test_identical_ladder_needs_nothing(self):
+        target = ladder(100, 100, 0.01, 0.01, 2, 2)
+        plan = diff_ladder(target, self.live(target), 1)
+        self.assertEqual(plan, {'cancel': [], 'amend': [], 'place': []})
+
+    def test_shifted_ladder_only_moves_the_edges(self):
+        # 中心 100 -> 101：SELL 102 與 BUY 99 兩個價位不動，其餘取消或新掛
+        live = self.live(ladder(100, 100, 0.01, 0.01, 2, 2))
+        plan = diff_ladder(ladder(101, 100, 0.01, 0.01, 2, 2), live, 1)
+        self.assertEqual(sorted(plan['cancel']), [1, 4])  # SELL 101、BUY 98
+        self.assertEqual(plan['amend'], [])
+        self.assertEqual(sorted(plan['place']), [('BUY', 100), ('SELL', 103)])
+
+    def test_partially_filled_order_at_target_quantity_is_kept(self):
+        target = [('BUY', 99)]
+        plan = diff_ladder(target, self.live(target, qty='1', executed='0.4'), 1)
+        self.assertEqual(plan, {'cancel': [], 'amend': [], 'place': []})
+
+    def test_quantity_change_amends_only_between_executed_and_original(self):
+        target = [('BUY', 99)]
+        # 下修且大於已成交量：amend 保留排隊順位
+        plan = diff_ladder(target, self.live(target, qty='2', executed='0.5'), 1)
+        self.assertEqual(plan, {'cancel': [], 'amend': [(1, Decimal('1'))], 'place': []})
+        # 新數量不大於已成交量：只能取消重掛
+        plan = diff_ladder(target, self.live(target, qty='2', executed='1'), 1)
+        self.assertEqual(plan, {'cancel': [1], 'amend': [], 'place': [('BUY', 99)]})
+        # 上修：交易所不支援加量，取消重掛
+        plan = diff_ladder(target, self.live(target, qty='1'), 2)
+        self.assertEqual(plan, {'cancel': [1], 'amend': [], 'place': [('BUY', 99)]})
+
+    def test_duplicate_orders_at_one_level_are_cancelled(self):
+        target = [('SELL', 101)]
+        live = self.live(target) + self.live(target, first_id=2)
+        plan = diff_ladder(target, live, 1)
+        self.assertEqual(plan, {'cancel': [2], 'amend': [], 'place': []})
+
+
+class BotRegistryTests(MockClientTestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = BotRegistry()
+        self.addCleanup(self.registry.dispatcher.shutdown)
+        self.registry.stream = mock.Mock(**{'start.return_value': None})
+        self.registry.trade_writer = mock.Mock()
+        order_ids = itertools.count(100)
+        self.btc = self.grid_bot('BTCUSDT', {
+            ('POST', '/api/v3/order'): lambda params: HTTPResponse({'orderId': next(order_ids)}),
+            ('DELETE', '/api/v3/openOrders'): HTTPResponse({'code': -2011, 'msg': 'Unknown order sent.'}, status_code=400),
+        })
+        self.eth = self.grid_bot('ETHUSDT')
+
+    def grid_bot(self, pair, routes=None):
+        bot = self.bot(routes, pair)
+        bot.on_stopped = self.registry.on_bot_stopped
+        bot.order_size, bot.precision = 1, 2
+        bot.origin_price = bot.last_trade_price = 100.0
+        bot.price_increase_percentage = bot.price_decrease_percentage = 0.01
+        bot.buy_orders[:] = [1]
+        bot.sell_orders[:] = [2]
+        bot.start_consumer()
+        self.addCleanup(bot.stop_consumer)
+        self.registry.bots[pair] = bot
+        return bot
+
+    def filled(self, symbol, order_id):
+        return {
+            'e': 'executionReport', 's': symbol, 'i': order_id, 'S': 'BUY', 'x': 'TRADE', 'X': 'FILLED',
+            'p': '99', 'q': '1', 'z': '1', 'l': '1', 'n': '0', 'N': 'USDT', 't': 1, 'T': 1700000000000, 'O': 1700000000000,
+        }
+
+    def test_dispatch_routes_fill_to_its_pair_only(self):
+        self.registry.dispatch(self.filled('ETHUSDT', 1))
+        self.eth.events.join()
+        self.assertEqual({params['symbol'] for _, _, params in self.rest.calls}, {'ETHUSDT'})
+        # 補單的買單與賣單平行送出，orderId 先後不固定
+        self.assertEqual((len(self.eth.buy_orders), sorted(self.eth.buy_orders + self.eth.sell_orders)), (1, [2, 100, 101]))
+        self.assertEqual((self.btc.buy_orders, self.btc.sell_orders), ([1], [2]))
+
+    def test_dispatch_ignores_stopped_and_unknown_pairs(self):
+        self.eth.is_running = False
+        self.registry.dispatch(self.filled('ETHUSDT', 1))
+        self.registry.dispatch(self.filled('BNBUSDT', 1))
+        self.registry.dispatch({'e': 'listStatus', 's': 'BTCUSDT'})
+        self.btc.events.join()
+        self.eth.events.join()
+        self.assertEqual(self.rest.calls, [])
+
+    def test_slow_pair_does_not_hold_up_other_pairs(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        handled = []
+
+        def on_execution_report(bot, event):
+            if bot is self.eth:
+                release.wait(5)
+            handled.append(bot.pair)
+            yield from ()
+
+        with mock.patch.object(TradeWSManager, 'on_execution_report', on_execution_report):
+            self.registry.dispatch(self.filled('ETHUSDT', 1))
+            self.registry.dispatch(self.filled('BTCUSDT', 1))  # dispatch 不等 ETH 處理完
+            self.btc.events.join()
+            self.assertEqual(handled, ['BTCUSDT'])
+            release.set()
+            self.eth.events.join()
+        self.assertEqual(handled, ['BTCUSDT', 'ETHUSDT'])
+
+    def test_balance_update_is_published(self):
+        with mock.patch('trade.registry.publish_balance_event') as publish_balance:
+            self.registry.dispatch({'e': 'outboundAccountPosition', 'B': [{'a': 'USDT', 'f': '10', 'l': '0'}]})
+        publish_balance.assert_called_once()
+        self.assertEqual(self.rest.calls, [])
+
+    def test_resolve(self):
+        self.assertIs(self.registry.resolve('ETHUSDT'), self.eth)
+        self.assertIsNone(self.registry.resolve())  # 兩個運行中，需指定交易對
+        self.btc.is_running = False
+        self.assertIs(self.registry.resolve(), self.eth)
+
+    def test_start_rejects_running_pair_and_releases_stream_on_error(self):
+        self.assertEqual(self.registry.start('BTCUSDT'), "機器人運作中")
+        self.btc.is_running = self.eth.is_running = False
+        self.registry.stream.start.return_value = "WS 連線超時"
+        self.assertEqual(self.registry.start('BTCUSDT'), "WS 連線超時")
+        self.registry.stream.stop.assert_called_once()
+        self.registry.trade_writer.stop.assert_called_once()
+
+    def test_stream_lost_stops_every_bot_and_releases_stream_once_all_stopped(self):
+        self.registry.on_stream_lost("WebSocket 連線失敗")
+        self.assertEqual(self.registry.running_bots(), [])
+        self.assertEqual(self.registry.stream.stop.call_count, 1)
+        self.assertEqual(self.paths(), [('DELETE', '/api/v3/openOrders')] * 2)
+
+
+class MarketDataFeedTests(MockClientTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        for patch in (
+            mock.patch('trade.market_data.time.monotonic', lambda: self.clock.now),
+            mock.patch.object(MarketDataFeed, '_connect'),  # 不建立真實連線
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.feed = MarketDataFeed(max_age=60, log=lambda message: None)
+        self.ticks = []
+        self.feed.subscribe('BTCUSDT', lambda *tick: self.ticks.append(tick))
+        self.feed.connected = True
+
+    def push(self, **data):
+        self.feed.on_message(None, json.dumps(data))
+
+    def test_stale_price_returns_none(self):
+        self.assertIsNone(self.feed.get_price('BTCUSDT'))
+        self.push(s='BTCUSDT', b='99', a='101')
+        self.assertEqual(self.feed.get_price('BTCUSDT'), 100.0)
+        self.assertEqual(self.ticks, [('BTCUSDT', 100.0, self.clock.now)])
+        self.clock.tick(60)
+        self.assertEqual(self.feed.get_price('BTCUSDT'), 100.0)
+        self.clock.tick(1)
+        self.assertIsNone(self.feed.get_price('BTCUSDT'))
+        # 新報價 (miniTicker 取最新成交價) 後恢復
+        self.push(s='BTCUSDT', c='102.5')
+        self.assertEqual(self.feed.get_price('BTCUSDT'), 102.5)
+
+    def test_disconnected_or_unsubscribed_returns_none(self):
+        self.push(s='BTCUSDT', c='100')
+        self.push(result=None, id=1)  # SUBSCRIBE 回應
+        self.feed.connected = False
+        self.assertIsNone(self.feed.get_price('BTCUSDT'))
+        self.feed.connected = True
+        self.feed.ws = mock.Mock()
+        self.feed.unsubscribe('BTCUSDT')
+        self.assertIsNone(self.feed.get_price('BTCUSDT'))
+
+    def test_current_price_falls_back_to_rest_when_stale(self):
+        bot = self.bot({('GET', '/api/v3/ticker/price'): HTTPResponse({'symbol': 'BTCUSDT', 'price': '98.5'})})
+        bot.market_data = self.feed
+        self.push(s='BTCUSDT', c='100')
+        self.assertEqual(bot.run(bot.get_current_price()), 100.0)
+        self.assertEqual(self.rest.calls, [])
+        self.clock.tick(61)
+        self.assertEqual(bot.run(bot.get_current_price()), 98.5)
+        self.assertEqual(self.rest.calls, [('GET', '/api/v3/ticker/price', {'symbol': 'BTCUSDT'})])
+
+
+class VolatilityGuardTests(TestCase):
+    def guard(self, reset_cv=0.05, cancel_cv=0.2, window_seconds=10):
+        self.actions = []
+        # 回呼改為同步執行，不另開執行緒
+        patch = mock.patch('trade.volatility.threading', SimpleNamespace(
+            Lock=threading.Lock,
+            Thread=lambda target, args, daemon: SimpleNamespace(start=lambda: target(*args)),
+        ))
+        patch.start()
+        self.addCleanup(patch.stop)
+        return VolatilityGuard(
+            reset_cv, cancel_cv, window_seconds=window_seconds,
+            on_reset=lambda change_pct: self.actions.append(('reset', round(change_pct, 6))),
+            on_cancel=lambda change_pct: self.actions.append(('cancel', round(change_pct, 6))),
+        )
+
+    def test_min_max_match_brute_force(self):
+        clock = FakeClock()
+        window = RollingWindow(5)
+        rng = random.Random(7)
+        history = []
+        for _ in range(500):
+            ts = clock.tick(rng.choice([0.5, 1, 2]))
+            price = rng.randint(90, 110)
+            history.append((ts, price))
+            window.push(ts, price)
+            visible = [p for t, p in history if t >= ts - 5]
+            self.assertEqual((window.low, window.high), (min(visible), max(visible)))
+            self.assertEqual([p for _, p in window.ticks], visible)
+            # 單調佇列：min_q 價格遞增、max_q 價格遞減
+            self.assertEqual([p for _, p in window.min_q], sorted(p for _, p in window.min_q))
+            self.assertEqual([p for _, p in window.max_q], sorted((p for _, p in window.max_q), reverse=True))
+
+    def test_window_expiry_drops_old_extremes(self):
+        clock = FakeClock()
+        window = RollingWindow(10)
+        self.assertTrue(window.push(clock.now, 100))
+        self.assertTrue(window.push(clock.tick(), 90))
+        self.assertFalse(window.push(clock.tick(), 95))
+        self.assertEqual((window.low, window.high), (90, 100))
+        # 100 在 11 秒前，超出視窗
+        self.assertTrue(window.push(clock.tick(9), 95))
+        self.assertEqual((window.low, window.high), (90, 95))
+        self.assertTrue(window.push(clock.tick(10), 96))
+        self.assertEqual((window.low, window.high, len(window.ticks)), (95, 96, 2))
+        self.assertAlmostEqual(window.change(), 96 / 95 - 1)
+
+    def test_reset_triggers_at_low_times_one_plus_cv(self):
+        clock = FakeClock()
+        guard = self.guard()
+        guard.on_tick('BTCUSDT', 100, clock.now)
+        guard.on_tick('BTCUSDT', 104.99, clock.tick())
+        self.assertEqual(self.actions, [])
+        guard.on_tick('BTCUSDT', 100 * 1.05, clock.tick())
+        self.assertEqual(self.actions, [('reset', 0.05)])
+        # 觸發後停止檢查，直到 rearm
+        guard.on_tick('BTCUSDT', 200, clock.tick())
+        self.assertEqual(len(self.actions), 1)
+
+    def test_reset_triggers_at_high_times_one_minus_cv(self):
+        clock = FakeClock()
+        guard = self.guard()
+        guard.on_tick('BTCUSDT', 100, clock.now)
+        guard.on_tick('BTCUSDT', 95.01, clock.tick())
+        self.assertEqual(self.actions, [])
+        guard.on_tick('BTCUSDT', 95, clock.tick())
+        self.assertEqual(self.actions, [('reset', 0.05)])
+
+    def test_cancel_takes_precedence_over_reset(self):
+        clock = FakeClock()
+        guard = self.guard()
+        guard.on_tick('BTCUSDT', 100, clock.now)
+        guard.on_tick('BTCUSDT', 79, clock.tick())
+        self.assertEqual(self.actions, [('cancel', 0.21)])
+
+    def test_expired_extreme_no_longer_triggers(self):
+        clock = FakeClock()
+        guard = self.guard()
+        guard.on_tick('BTCUSDT', 100, clock.now)
+        # 11 秒後 100 已離開視窗，96 相對 97 未超過 5%
+        guard.on_tick('BTCUSDT', 97, clock.tick(11))
+        guard.on_tick('BTCUSDT', 96, clock.tick())
+        self.assertEqual(self.actions, [])
+
+    def test_rearm_restarts_window(self):
+        clock = FakeClock()
+        guard = self.guard()
+        guard.on_tick('BTCUSDT', 100, clock.now)
+        guard.on_tick('BTCUSDT', 110, clock.tick())
+        self.assertEqual(self.actions, [('reset', 0.1)])
+        guard.rearm()
+        self.assertIsNone(guard.stats())
+        guard.on_tick('BTCUSDT', 110, clock.tick())
+        guard.on_tick('BTCUSDT', 112, clock.tick())
+        self.assertEqual(len(self.actions), 1)
+        self.assertEqual(guard.stats()['low'], 110)
+
+
+class VolatilityHandlerTests(MockClientTestCase):
+    def grid_bot(self, routes):
+        bot = self.bot(routes)
+        bot.volatility_guard = VolatilityGuard(0.05, 0.2, on_reset=None, on_cancel=None)
+        bot.volatility_guard.triggered = True
+        return bot
+
+    def test_handlers_after_shutdown_do_nothing(self):
+        bot = self.grid_bot({})
+        bot.volatility_guard = None  # stop / shutdown 已先清掉風控
+        bot.run(bot.on_volatility_reset(0.1))
+        bot.run(bot.on_volatility_cancel(0.3))
+        self.assertEqual(self.rest.calls, [])
+        self.assertFalse(any('風控' in log for log in self.logs))
+
+    def test_reset_does_not_replace_orders_once_stopped(self):
+        def stopped_meanwhile(params):
+            bot.is_running = False
+            bot.volatility_guard = None
+            return HTTPResponse([])
+
+        bot = self.grid_bot({('DELETE', '/api/v3/openOrders'): stopped_meanwhile})
+        guard = bot.volatility_guard
+        bot.run(bot.on_volatility_reset(0.1))
+        self.assertEqual(self.paths(), [('DELETE', '/api/v3/openOrders')])
+        self.assertTrue(guard.triggered)
+
+
+class ExchangeInfoCacheTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patch = mock.patch('trade.exchange_info.time.time', lambda: self.clock.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.snapshot = os.path.join(tmp.name, 'exchange_info.json')
+
+    def cache(self, responses):
+        self.rest = ScriptedClient({('GET', '/api/v3/exchangeInfo'): responses})
+        return ExchangeInfoCache(client=self.rest, ttl=100, snapshot_path=self.snapshot)
+
+    def test_refetches_only_after_ttl(self):
+        cache = self.cache([exchange_info_response('BTCUSDT'), exchange_info_response('BTCUSDT', 'ETHUSDT')])
+        self.assertEqual(cache.get_symbol('BTCUSDT')['precision'], 2)
+        self.clock.tick(99)
+        self.assertIsNone(cache.get_symbol('ETHUSDT'))
+        self.assertEqual(len(self.rest.calls), 1)
+        self.clock.tick(1)
+        self.assertEqual(cache.get_all_pairs(), ['BTCUSDT', 'ETHUSDT'])
+        self.assertEqual(cache.get_all_base_assets(), ['BTC', 'ETH'])
+        self.assertEqual(len(self.rest.calls), 2)
+
+    def test_cold_start_uses_fresh_snapshot(self):
+        self.cache([exchange_info_response('BTCUSDT')]).get_all_pairs()
+        self.clock.tick(50)
+        cache = self.cache([])
+        self.assertEqual(cache.get_all_pairs(), ['BTCUSDT'])
+        self.assertEqual(self.rest.calls, [])
+        # 快照過期則重新下載
+        self.clock.tick(50)
+        cache = self.cache([exchange_info_response('ETHUSDT')])
+        self.assertEqual(cache.get_all_pairs(), ['ETHUSDT'])
+
+    def test_failed_refresh_keeps_stale_data_and_retries_in_60_seconds(self):
+        unavailable = HTTPResponse({}, status_code=503)
+        cache = self.cache([exchange_info_response('BTCUSDT'), unavailable, exchange_info_response('ETHUSDT')])
+        cache.get_all_pairs()
+        self.clock.tick(100)
+        self.assertEqual(cache.get_all_pairs(), ['BTCUSDT'])
+        self.clock.tick(59)
+        self.assertEqual(cache.get_all_pairs(), ['BTCUSDT'])
+        self.assertEqual(len(self.rest.calls), 2)
+        self.clock.tick(1)
+        self.assertEqual(cache.get_all_pairs(), ['ETHUSDT'])
+
+    def test_failed_cold_start_falls_back_to_expired_snapshot(self):
+        self.cache([exchange_info_response('BTCUSDT')]).get_all_pairs()
+        self.clock.tick(1000)
+        cache = self.cache([HTTPResponse({}, status_code=503)])
+        self.assertEqual(cache.get_all_pairs(), ['BTCUSDT'])
+
+    def test_snapshot_write_failure_is_logged(self):
+        self.snapshot = os.path.join(os.path.dirname(self.snapshot), 'missing', 'exchange_info.json')
+        cache = self.cache([exchange_info_response('BTCUSDT')])
+        with self.assertLogs('trade.exchange_info', 'WARNING') as logs:
+            self.assertEqual(cache.get_all_pairs(), ['BTCUSDT'])
+        self.assertIn('寫入 exchangeInfo 快照失敗', logs.output[0])
+
+
+class TradeSchemaTests(TestCase):
+    def test_exchange_time_from_epoch_ms(self):
+        self.assertEqual(exchange_time(1700000000123), datetime(2023, 11, 14, 22, 13, 20, 123000, tzinfo=timezone.utc))
+        self.assertIsNone(exchange_time(None))
+
+    def test_ledger_fills_use_composite_index(self):
+        plan = filled_trades(EMAIL, 'BTCUSDT', 'BUY').explain()
+        self.assertIn('trade_user_pair_action_date', plan)
+
+
+class ReportTests(TestCase):
+    def setUp(self):
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        rows = [
+            ('1', 'BTCUSDT', 'BUY', '1', '100', '0.01'),
+            ('2', 'BTCUSDT', 'BUY', '2', '90', '0.02'),
+            ('3', 'BTCUSDT', 'SELL', '2', '110', '0.1'),
+            ('4', 'ETHUSDT', 'BUY', '5', '10', '0'),
+            ('5', 'ETHUSDT', 'SELL', '5', '12', '0'),
+        ]
+        for i, (order_id, pair, action, qty, price, fee) in enumerate(rows):
+            Trade.objects.create(
+                id=order_id, user_email=EMAIL, pair=pair, action=action, quantity=Decimal(qty),
+                price=Decimal(price), fee=Decimal(fee), trade_date=start + timedelta(minutes=i), trade_or_not=True,
+            )
+
+    def test_trade_report_reads_all_pairs_in_one_query(self):
+        rebuild(EMAIL)
+        with self.assertNumQueries(1):
+            result = trade_report()
+        profits = {row['id']: row['profit'] for row in result if row['action'] == 'SELL'}
+        # 1 @100 + 1 @90 (部分) ，每次匹配都扣賣單手續費
+        self.assertEqual(profits['3'], Decimal('10') - Decimal('0.1') - Decimal('0.01') + Decimal('20') - Decimal('0.1') - Decimal('0.01'))
+        self.assertEqual(profits['5'], Decimal('10'))
+        self.assertEqual(len(result), 5)
+
+    def test_sell_without_realized_profit_still_has_profit_key(self):
+        # ledger 尚未重建：賣單仍帶 profit (None)，買單沒有
+        rows = {row['id']: row for row in trade_report()}
+        self.assertIsNone(rows['3']['profit'])
+        self.assertNotIn('profit', rows['1'])
+
+    def test_spot_report_only_returns_open_positions(self):
+        rebuild(EMAIL)
+        with self.assertNumQueries(1):
+            result = spot_report()
+        self.assertEqual([(row['id'], row['quantity']) for row in result], [('2', 1.0)])
+
+
+class LedgerTests(TestCase):
+    def create(self, order_id, action, qty, price, fee, minute, **extra):
+        fields = {
+            'id': order_id, 'user_email': EMAIL, 'pair': 'BTCUSDT', 'action': action,
+            'quantity': Decimal(qty), 'price': Decimal(price), 'fee': Decimal(fee),
+            'trade_date': datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=minute),
+            'trade_or_not': True, **extra,
+        }
+        Trade.objects.create(**fields)
+        return fields
+
+    def cancelled(self, order_id, action, qty, price, minute):
+        return self.create(order_id, action, qty, price, '0', minute, trade_or_not=False, status='CANCELED')
+
+    def profits(self):
+        return {p.trade_id: (p.profit, p.unmatched_qty) for p in RealizedProfit.objects.all()}
+
+    def lots(self):
+        return {lot.id: (lot.open_position, lot.sold_or_not, lot.profit) for lot in SpotTrade.objects.all()}
+
+    def test_incremental_updates_match_rebuild(self):
+        fills = [
+            ('1', 'BUY', '1.5', '100', '0.003', 0),
+            ('2', 'BUY', '1', '95', '0.002', 1),
+            ('3', 'SELL', '1', '105', '0.1', 2),
+            ('4', 'SELL', '1', '101', '0.1', 3),
+            ('5', 'BUY', '2', '90', '0.004', 4),
+            ('6', 'SELL', '1.5', '99', '0.1', 5),
+        ]
+        for fill in fills:
+            apply_fills([self.create(*fill)])
+        incremental = self.profits()
+        incremental_lots = self.lots()
+
+        rebuild(EMAIL)
+        self.assertEqual(incremental, self.profits())
+        self.assertEqual(incremental_lots, self.lots())
+        self.assertEqual(len(incremental), 3)
+        # 共買 4.5 賣 3.5，只剩最後一筆買單的 1
+        self.assertEqual(
+            {lot_id: lot[0] for lot_id, lot in incremental_lots.items() if not lot[1]},
+            {'5': Decimal('1')},
+        )
+
+    def test_out_of_order_fills_match_rebuild(self):
+        # 賣單先於買單寫入、較早的買單晚到，以及同一時間 orderId 位數不同 ("9" < "10")
+        fills = [
+            ('10', 'SELL', '1', '105', '0.1', 2),
+            ('9', 'BUY', '1', '100', '0.002', 2),
+            ('11', 'BUY', '1', '95', '0.002', 3),
+            ('12', 'SELL', '1', '101', '0.1', 4),
+            ('8', 'BUY', '1', '90', '0.002', 1),
+            ('7', 'SELL', '0.5', '99', '0.1', 0),
+        ]
+        for fill in fills:
+            apply_fills([self.create(*fill)])
+        incremental = self.profits()
+        incremental_lots = self.lots()
+        ledger = PnlLedger.objects.get()
+
+        rebuild(EMAIL)
+        self.assertEqual(incremental, self.profits())
+        self.assertEqual(incremental_lots, self.lots())
+        rebuilt = PnlLedger.objects.get()
+        self.assertEqual(
+            (ledger.buy_trade_id, ledger.buy_remaining, ledger.last_sell_id),
+            (rebuilt.buy_trade_id, rebuilt.buy_remaining, rebuilt.last_sell_id),
+        )
+        self.assertEqual(rebuilt.last_sell_id, '12')
+
+    def test_cursor_orders_ids_numerically(self):
+        first = self.create('9', 'SELL', '1', '100', '0', 0)
+        second = self.create('10', 'SELL', '1', '100', '0', 0)
+        self.assertEqual([t.id for t in filled_trades(EMAIL, 'BTCUSDT', 'SELL')], ['9', '10'])
+        self.assertEqual([t.id for t in after(filled_trades(EMAIL, 'BTCUSDT', 'SELL'), first['trade_date'], '9')], ['10'])
+        self.assertLess(fill_key(first['trade_date'], first['id']), fill_key(second['trade_date'], second['id']))
+
+    def test_partially_filled_then_cancelled_orders_count(self):
+        apply_fills([self.create('1', 'BUY', '2', '100', '0', 0)])
+        # 賣單只成交 0.5 就被取消；完全未成交的取消單不計
+        apply_fills([self.cancelled('2', 'SELL', '0.5', '110', 1), self.cancelled('3', 'SELL', '0', '120', 2)])
+        incremental = self.profits()
+        self.assertEqual(incremental, {'2': (Decimal('5'), Decimal('0'))})
+
+        rebuild(EMAIL)
+        self.assertEqual(self.profits(), incremental)
+        self.assertEqual([trade.id for trade in filled_trades(EMAIL, 'BTCUSDT', 'SELL')], ['2'])
+
+    def test_partially_filled_then_cancelled_buy_opens_a_lot(self):
+        apply_fills([self.cancelled('1', 'BUY', '0.4', '100', 0), self.cancelled('2', 'BUY', '0', '99', 1)])
+        self.assertEqual(self.lots(), {'1': (Decimal('0.4'), False, Decimal('0'))})
+        apply_fills([self.create('3', 'SELL', '0.4', '105', '0', 2)])
+        incremental = self.lots()
+        self.assertEqual(incremental, {'1': (Decimal('0'), True, Decimal('2'))})
+        rebuild(EMAIL)
+        self.assertEqual(self.lots(), incremental)
+
+
+class TradeWriterTests(TestCase):
+    def setUp(self):
+        self.logs = []
+        self.writer = TradeWriter(log=self.logs.append, retry_delay=0)
+
+    def flush(self, *rows):
+        """在測試執行緒寫入一批 (背景執行緒看不到 TestCase 的交易)"""
+        for row in rows:
+            self.writer.submit(row)
+        self.writer._flush([self.writer.queue.get() for _ in rows])
+
+    def fill(self, order_id, action='BUY'):
+        return {
+            'id': order_id, 'user_email': EMAIL, 'pair': 'BTCUSDT', 'action': action, 'quantity': Decimal('1'),
+            'price': Decimal('100'), 'fee': Decimal('0'), 'fee_symbol': 'USDT',
+            'trade_date': datetime(2025, 1, 1, tzinfo=timezone.utc), 'trade_or_not': True,
+        }
+
+    def test_failed_write_is_retried_before_task_done(self):
+        bulk_create = Trade.objects.bulk_create
+        attempts = []
+
+        def locked_once(*args, **kwargs):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise OperationalError('database is locked')
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Trade.objects, 'bulk_create', locked_once):
+            self.flush(self.fill('1'))
+        self.assertEqual(len(attempts), 2)
+        self.assertTrue(Trade.objects.filter(id='1').exists())
+        self.assertEqual(self.writer.queue.unfinished_tasks, 0)
+        self.assertIn('Trade 批次寫入失敗 (1 筆)', self.logs[0])
+
+    def test_ledger_failure_rebuilds_the_pair(self):
+        with mock.patch('trade.persistence.apply_fills', side_effect=RuntimeError('ledger')), \
+                mock.patch('trade.persistence.rebuild_pair', side_effect=RuntimeError('rebuild')):
+            self.flush(self.fill('1'))
+        self.assertEqual(self.writer.dirty_pairs, {(EMAIL, 'BTCUSDT')})
+        self.assertFalse(SpotTrade.objects.exists())
+        # 下一批寫入後重算成功，漏掉的 open lot 補回
+        self.flush(self.fill('2'))
+        self.assertEqual(self.writer.dirty_pairs, set())
+        self.assertEqual(sorted(SpotTrade.objects.values_list('id', flat=True)), ['1', '2'])
+
+    def test_stop_keeps_thread_that_did_not_finish(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.writer.thread = threading.Thread(target=release.wait, daemon=True)
+        self.writer.thread.start()
+        self.writer.stop(timeout=0.01)
+        self.assertIsNotNone(self.writer.thread)
+        release.set()
+        self.writer.thread.join()
+        self.writer.stop(timeout=0.01)
+        self.assertIsNone(self.writer.thread)
+
+
+class TradeHistoryPaginationTests(TestCase):
+    def setUp(self):
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for i in range(7):
+            # 兩兩同一時間，確認 keyset 以 id 區分
+            Trade.objects.create(
+                id=str(100 + i), user_email=EMAIL, pair='BTCUSDT', action='BUY', quantity=Decimal('1'),
+                price=Decimal('100'), fee=Decimal('0'), trade_date=start + timedelta(minutes=i // 2), trade_or_not=True,
+            )
+        self.client.force_login(User.objects.create_user('tester', password='x'))
+
+    def test_pages_cover_history_once_in_order(self):
+        ids, cursor = [], None
+        while True:
+            rows, cursor = trade_page(3, cursor)
+            ids.extend(row['id'] for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(ids, [str(100 + i) for i in reversed(range(7))])
+
+    def test_get_trades_limit_and_stream(self):
+        page = self.client.get('/get_trades/', {'limit': 2}).json()['response']
+        self.assertEqual([row['id'] for row in page['data']], ['106', '105'])
+        self.assertIsNotNone(page['next_cursor'])
+
+        response = self.client.get('/get_trades/', {'stream': '1'})
+        body = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(body['response']['status'], 'success')
+        self.assertEqual(len(body['response']['data']), 7)
+        self.assertIsNone(body['response']['next_cursor'])
+
+    def test_stream_honors_limit_and_cursor(self):
+        rebuild(EMAIL)  # 全為買單，每筆都是 open lot
+        for path in ('/get_trades/', '/get_spots/'):
+            ids, cursor = [], None
+            while True:
+                params = {'stream': '1', 'limit': 3, **({'cursor': cursor} if cursor else {})}
+                response = self.client.get(path, params)
+                page = json.loads(b''.join(response.streaming_content))['response']
+                self.assertLessEqual(len(page['data']), 3)
+                ids.extend(row['id'] for row in page['data'])
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            self.assertEqual(ids, [str(100 + i) for i in reversed(range(7))])
+
+        body = self.client.get('/get_spots/', {'stream': '1', 'cursor': 'not-a-cursor'}).json()
+        self.assertEqual(body['response']['status'], 'error')
+
+    def test_invalid_limit_is_rejected(self):
+        body = self.client.get('/get_trades/', {'limit': 0}).json()
+        self.assertEqual(body['response']['status'], 'error')
+
+
+class FixedPointFifoTests(TestCase):
+    def test_matches_decimal_version(self):
+        rng = random.Random(7)
+
+        def amount(low, high, places):
+            value = Decimal(rng.randint(int(low * 10 ** places), int(high * 10 ** places))).scaleb(-places)
+            return value.quantize(Decimal('1e-10'))
+
+        # 買單不足時 match_sells 對每筆未匹配的賣單記一筆 warning
+        unmatched_sells = 0
+        with self.assertLogs('trade.ledger', 'WARNING') as logs:
+            for _ in range(200):
+                order_size = amount(0.001, 2, 4)
+                buys = [
+                    Trade(id=f'b{i}', quantity=order_size if rng.random() < 0.7 else amount(0, 2, 6),
+                          price=amount(1, 70000, 2), fee=amount(0, 0.01, rng.choice([0, 8])))
+                    for i in range(rng.randint(0, 20))
+                ]
+                sells = [
+                    Trade(id=f's{i}', quantity=order_size if rng.random() < 0.7 else amount(0, 2, 6),
+                          price=amount(1, 70000, 2), fee=amount(0, 0.5, 8))
+                    for i in range(rng.randint(0, 20))
+                ]
+                ledger = SimpleNamespace(buy_trade=None, buy_remaining=Decimal('0'), last_sell_date=None, last_sell_id=None)
+                buy_iter = iter(buys)
+                reference = match_sells(ledger, sells, lambda: next(buy_iter, None))
+                unmatched_sells += sum(1 for _, _, unmatched in reference if unmatched > 0)
+
+                columns = FixedColumns(buys, sells)
+                engines = [fifo_match, fifo_match_vectorized] if columns.fits_int64() else [fifo_match]
+                for engine in engines:
+                    result = engine(columns)
+                    self.assertEqual([profit for _, profit, _ in reference], result['profits'])
+                    self.assertEqual(
+                        [unmatched for _, _, unmatched in reference],
+                        [from_fixed(qty, columns.qty_scale) for qty in result['unmatched']],
+                    )
+                    buy_index = result['buy_index']
+                    self.assertIs(ledger.buy_trade, buys[buy_index - 1] if buy_index else None)
+                    self.assertEqual(ledger.buy_remaining, from_fixed(result['buy_remaining'], columns.qty_scale))
+        self.assertEqual(len(logs.records), unmatched_sells)
+
+
+class GridBacktestTests(TestCase):
+    def replay(self, timestamps, prices):
+        return GridBacktest(
+            timestamps, prices, order_size=1, price_increase_percentage=0.01, price_decrease_percentage=0.01,
+            trade_count=2, price_reset_cv=0.05, price_cancel_cv=0.2, window_seconds=10,
+        ).run()
+
+    def test_ladder_fills_and_pnl(self):
+        # 100 -> 98 觸及兩張買單，回到 101 賣出 99 與 100 的補單
+        prices = np.array([100, 99.5, 99, 98.5, 98, 99, 100, 101, 100.5])
+        report = self.replay(np.arange(len(prices), dtype=float), prices)
+        self.assertEqual((report['buys'], report['sells']), (2, 3))
+        self.assertEqual(report['resets'], 0)
+        self.assertAlmostEqual(report['fees'], (99 + 98 + 99 + 100 + 101) * 0.001)
+
+    def test_guard_reset_and_cancel(self):
+        prices = np.array([100, 100, 106, 106, 106, 140])
+        report = self.replay(np.arange(len(prices), dtype=float), prices)
+        self.assertEqual(report['resets'], 1)
+        self.assertEqual(report['stopped_at'], 5.0)
+
+    def test_load_kline_csv(self):
+        path = os.path.join(tempfile.mkdtemp(), 'BTCUSDT-1s.csv')
+        with open(path, 'w') as f:
+            f.write('1700000000000,1,1,1,100.5,1,1700000000999,1,1,1,1,0\n')
+            f.write('1700000003000,1,1,1,101.5,1,1700000003999,1,1,1,1,0\n')
+        timestamps, prices = resample(*load_prices(path))
+        self.assertEqual(list(timestamps - timestamps[0]), [0, 1, 2, 3])
+        self.assertEqual(list(prices), [100.5, 100.5, 100.5, 101.5])
+
+
+class MockExchangeTestCase(TransactionTestCase):
+    """REST 與 websocket 指向本地模擬交易所"""
+
+    def setUp(self):
+        self.exchange = MockExchange()
+        self.exchange.set_price('BTCUSDT', 100)
+        self.server = MockExchangeServer(self.exchange, port=0).start()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patches = [
+            mock.patch.object(binance, 'base_url', self.server.base_url),
+            mock.patch('trade.user_stream.BINANCE_WS_URL', self.server.ws_url),
+            mock.patch('trade.binance.exchange_info', ExchangeInfoCache(
+                client=binance, snapshot_path=os.path.join(tmp.name, 'exchange_info.json'))),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.server.stop)
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(0.02)
+        return False
+
+
+class MockExchangeIntegrationTests(MockExchangeTestCase):
+    """TradeWSManager 對本地模擬交易所完整跑一次：初始掛單、成交補單、寫入成交、停止"""
+
+    def test_grid_round_trip(self):
+        bot = TradeWSManager(market_data=MarketDataFeed(url=self.server.ws_url))
+        result = bot.run(bot.start(
+            pair='BTCUSDT', order_size=0.1, price_increase_percentage=0.01, price_decrease_percentage=0.01,
+            user='tester', trade_count=2, price_reset_cv=0.5, price_cancel_cv=0.9,
+        ))
+        self.assertEqual(result, 0)
+        open_prices = lambda: sorted(float(o['price']) for o in self.exchange.open_orders['BTCUSDT'].values())
+        self.assertEqual(open_prices(), [98, 99, 101, 102])
+
+        # 99 的買單成交：補 97 買單與 100 賣單
+        self.exchange.set_price('BTCUSDT', 98.5)
+        self.assertTrue(self.wait_for(lambda: open_prices() == [97, 98, 100, 101, 102]))
+        filled = next(o for o in self.exchange.orders.values() if o['status'] == 'FILLED')
+
+        self.assertEqual(bot.run(bot.stop()), 0)
+        self.assertEqual(self.exchange.open_orders['BTCUSDT'], {})
+        trade = Trade.objects.get(id=filled['orderId'])
+        self.assertTrue(trade.trade_or_not)
+        self.assertEqual((trade.action, trade.price, trade.fee), ('BUY', Decimal('99'), Decimal('0.0001')))
+        self.assertEqual(self.exchange.stats()['reaction_ms']['count'], 1)
+
+
+class AsyncEngineIntegrationTests(MockExchangeTestCase):
+    """同一組流程改走 asyncio 引擎 (httpx + asyncio websocket)，經由 views 使用的同步介面操作"""
+
+    def test_grid_round_trip(self):
+        registry = AsyncBotRegistry(AsyncEngine(ws_url=self.server.ws_url))
+        result = registry.start(
+            pair='BTCUSDT', order_size=0.1, price_increase_percentage=0.01, price_decrease_percentage=0.01,
+            user='tester', trade_count=2, price_reset_cv=0.5, price_cancel_cv=0.9,
+        )
+        self.assertEqual(result, 0)
+        self.assertEqual(registry.resolve().get_manager_state()['trade_count'], 2)
+        open_prices = lambda: sorted(float(o['price']) for o in self.exchange.open_orders['BTCUSDT'].values())
+        self.assertEqual(open_prices(), [98, 99, 101, 102])
+
+        self.exchange.set_price('BTCUSDT', 98.5)
+        self.assertTrue(self.wait_for(lambda: open_prices() == [97, 98, 100, 101, 102]))
+        filled = next(o for o in self.exchange.orders.values() if o['status'] == 'FILLED')
+
+        self.assertEqual(registry.update(
+            'BTCUSDT', order_size=0.1, price_increase_percentage=0.01, price_decrease_percentage=0.01,
+            trade_count=1, price_reset_cv=0.5, price_cancel_cv=0.9,
+        ), 0)
+        self.assertEqual(len(self.exchange.open_orders['BTCUSDT']), 2)
+
+        self.assertEqual(registry.stop('BTCUSDT'), 0)
+        self.assertEqual(registry.running_bots(), [])
+        self.assertEqual(self.exchange.open_orders['BTCUSDT'], {})
+        trade = Trade.objects.get(id=filled['orderId'])
+        self.assertEqual((trade.action, trade.price, trade.fee), ('BUY', Decimal('99'), Decimal('0.0001')))
+
+
+class AsyncEngineTests(TestCase):
+    def test_registry_uses_the_engine_bots_without_threaded_resources(self):
+        engine = SimpleNamespace(bots={})
+        registry = AsyncBotRegistry(engine)
+        engine.bots['BTCUSDT'] = bot = SimpleNamespace(pair='BTCUSDT', is_running=True)
+        self.assertIs(registry.resolve(), bot)
+        self.assertEqual(registry.stop('ETHUSDT'), '機器人未運行')
+        self.assertFalse(any(hasattr(registry, name) for name in ('stream', 'trade_writer', 'dispatcher', 'market_data')))
+
+    def test_call_times_out_and_cancels(self):
+        engine = AsyncEngine()
+        cancelled = threading.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with self.assertRaises(TimeoutError):
+            engine.call(slow(), timeout=0.05)
+        self.assertTrue(cancelled.wait(1))
+        engine.loop.call_soon_threadsafe(engine.loop.stop)
+
+    def test_full_writer_queue_is_waited_on_outside_the_flow(self):
+        writer = TradeWriter(max_queue=1)
+        bot = GridBot(writer, market_data=None)
+        fill = {'orderId': 1, 'symbol': 'BTCUSDT', 'side': 'BUY', 'status': 'FILLED', 'price': '100', 'executedQty': '0'}
+        self.assertEqual(list(bot.save_order(fill)), [])
+        # 佇列已滿：流程不自行阻塞，而是 yield Blocking 交給執行端 (async 引擎以執行緒等待)
+        effect = next(bot.save_order({**fill, 'orderId': 2}))
+        self.assertIsInstance(effect, Blocking)
+        self.assertEqual((effect.fn, effect.args[0]['id']), (writer.submit, 2))
+
+
+class AsyncWebSocketTests(TestCase):
+    def test_keepalive_drops_silent_connection(self):
+        """握手後不再回應 (half-open) 的連線由 ping 逾時關閉，讀取端不會永久卡住"""
+        async def scenario():
+            done = asyncio.Event()
+
+            async def silent(reader, writer):
+                request = await reader.readuntil(b'\r\n\r\n')
+                key = re.search(rb'Sec-WebSocket-Key: (\S+)', request, re.I).group(1)
+                accept = base64.b64encode(hashlib.sha1(key + WS_GUID.encode('ascii')).digest()).decode('ascii')
+                writer.write((
+                    'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                    f'Sec-WebSocket-Accept: {accept}\r\n\r\n'
+                ).encode('ascii'))
+                await writer.drain()
+                await done.wait()
+                writer.close()
+
+            server = await asyncio.start_server(silent, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            with mock.patch.multiple('trade.async_ws', WS_PING_INTERVAL=0.05, WS_PING_TIMEOUT=0.05, WS_CLOSE_TIMEOUT=0.05):
+                ws = await connect(f'ws://127.0.0.1:{port}/ws')
+            try:
+                with self.assertRaises(WebSocketClosed):
+                    await asyncio.wait_for(ws.recv(), 2)
+            finally:
+                done.set()
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run(scenario())
+
+
+class EventStreamTests(MockExchangeTestCase):
+    def test_hub_replays_missed_events_or_requests_resync(self):
+        events = EventHub(buffer=3)
+        for i in range(5):
+            events.publish('fill', order_id=i)
+        replay = events.subscribe(Subscription(), last_id=3)
+        self.assertEqual([e['id'] for e in list(replay.queue.queue)], [4, 5])
+        gap = events.subscribe(Subscription(), last_id=1)
+        self.assertEqual([e['type'] for e in list(gap.queue.queue)], ['resync'])
+
+        slow = events.subscribe(Subscription(maxsize=1))
+        stream = event_stream(keepalive=0.01, events=events)
+        self.assertTrue(next(stream).startswith('retry:'))
+        self.assertEqual(next(stream), ': keepalive\n\n')
+        events.publish('guard', pair='BTCUSDT', action='reset', change=0.05)
+        self.assertIn('event: guard\ndata: {"id": 6, "type": "guard"', next(stream))
+        events.publish('fill', order_id=7)
+        self.assertTrue(slow.overflow)
+        stream.close()
+        self.assertEqual(len(events.subscribers), 3)
+
+    def test_events_view_streams_grid_activity(self):
+        User.objects.create_user('tester', password='pw')
+        self.client.login(username='tester', password='pw')
+        response = self.client.get('/events/', HTTP_LAST_EVENT_ID=str(hub.last_id()))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = iter(response.streaming_content)
+        self.assertTrue(next(chunks).startswith(b'retry:'))
+
+        registry = BotRegistry()
+        registry.market_data = MarketDataFeed(url=self.server.ws_url)
+        received = hub.subscribe(Subscription())
+        self.addCleanup(hub.unsubscribe, received)
+        self.assertEqual(registry.start(
+            'BTCUSDT', order_size=0.1, price_increase_percentage=0.01, price_decrease_percentage=0.01,
+            user='tester', trade_count=1, price_reset_cv=0.5, price_cancel_cv=0.9,
+        ), 0)
+        self.exchange.set_price('BTCUSDT', 98.5)
+        seen = []
+
+        def drain():
+            while True:
+                event = received.get(0)
+                if event is None:
+                    return {e['type'] for e in seen}
+                seen.append(event)
+
+        self.assertTrue(self.wait_for(lambda: {'trade', 'spot', 'balance', 'fill'} <= drain()))
+        self.assertEqual(registry.stop('BTCUSDT'), 0)
+        drain()
+        types = [e['type'] for e in seen]
+        self.assertEqual((types[0], types[-1]), ('order_placed', 'bot_state'))
+        self.assertTrue(any(e['type'] == 'bot_state' and e['running'] for e in seen))
+        trade = next(e['row'] for e in seen if e['type'] == 'trade' and e['row']['action'] == 'BUY' and e['row']['quantity'] == 0.1)
+        self.assertEqual(trade['price'], 99.0)
+        spot = next(e['row'] for e in seen if e['type'] == 'spot')
+        self.assertEqual(spot['id'], trade['id'])
+        balance = next(e for e in seen if e['type'] == 'balance')
+        self.assertEqual({b['asset'] for b in balance['balances']}, {'BTC', 'USDT'})
+
+        # 同一條 SSE 連線收到相同的事件
+        body = b''.join(itertools.islice(chunks, len(seen)))
+        self.assertIn(b'event: fill', body)
+        response.close()
+
+    def test_wsgi_stream_ends_and_resumes_from_handshake_id(self):
+        events = EventHub()
+        events.publish('fill', order_id=1)
+        stream = event_stream(keepalive=0.01, events=events, max_seconds=0.05)
+        first = next(stream)
+        self.assertTrue(first.startswith('retry: 3000\nid: 1\n'))
+        rest = list(stream)  # 到期後產生器自行結束，不再佔用 worker 執行緒
+        self.assertTrue(rest and set(rest) == {': keepalive\n\n'})
+        self.assertEqual(events.subscribers, set())
+
+        # 重連前發生的事件，以握手時的 id 補送
+        events.publish('fill', order_id=2)
+        last_id = parse_last_id(re.search(r'^id: (\d+)$', first, re.M).group(1))
+        stream = event_stream(last_id, keepalive=0.01, events=events, max_seconds=0.05)
+        self.assertTrue(next(stream).startswith('retry: 3000\nid: 1\n'))
+        self.assertIn('"order_id": 2', next(stream))
+        stream.close()
+
+
+class OrderEventTests(MockClientTestCase):
+    def test_publish_failure_does_not_abort_fill_handling(self):
+        bot = self.bot({('POST', '/api/v3/order'): [HTTPResponse({'orderId': 10}), HTTPResponse({'orderId': 11})]})
+        bot.order_size, bot.precision = 1, 2
+        bot.origin_price = bot.last_trade_price = 100.0
+        bot.price_increase_percentage = bot.price_decrease_percentage = 0.01
+        bot.buy_orders[:] = [1]
+        report = trade_report_event(1, 1, 'FILLED', '1', '1', '0')
+        report.update({'q': '1', 'p': '99'})
+        with mock.patch('trade.grid_bot.publish_order_event', side_effect=RuntimeError('hub down')):
+            bot.run(bot.on_execution_report(report))
+        self.assertEqual(self.paths(), [('POST', '/api/v3/order')] * 2)
+        self.assertEqual((len(bot.buy_orders), sorted(bot.buy_orders + bot.sell_orders)), (1, [10, 11]))
+        self.assertEqual(len(bot.trade_writer.rows), 1)
+
+    def test_partially_filled_order_is_saved_when_cancelled(self):
+        bot = self.bot({})
+        for order_id, executed in ((1, '0.5'), (2, '0')):
+            report = trade_report_event(order_id, -1, 'CANCELED', '0', executed, '0')
+            bot.run(bot.on_execution_report({**report, 'x': 'CANCELED'}))
+        [row] = bot.trade_writer.rows
+        self.assertEqual(
+            (row['id'], row['quantity'], row['trade_or_not'], row['status']),
+            (1, Decimal('0.5'), False, 'CANCELED'),
+        )
+
+
+class BenchmarkTests(TestCase):
+    def test_stubbed_hot_paths_and_regressions(self):
+        results = run_benchmarks(sizes=(200,), events=50, orders=50, ladders=50)
+        self.assertEqual(
+            set(results['metrics']),
+            {'execution_report', 'place_order', 'ladder', 'fifo_200', 'spot_report_200'},
+        )
+        baseline = {'metrics': {name: {'value': metric['value'] * 2} for name, metric in results['metrics'].items()}}
+        baseline['metrics']['ladder']['value'] = results['metrics']['ladder']['value']
+        self.assertEqual(len(regressions(results, baseline, tolerance=0.3)), 4)
+        self.assertEqual(regressions(results, {'metrics': {}}), [])
+
+
+class RestClientTests(TestCase):
+    def test_prewarm_failure_is_logged(self):
+        client = RestClient('http://127.0.0.1:9', timeout=1)
+        with self.assertLogs('trade.client', 'WARNING') as logs:
+            client.prewarm('/api/v3/ping', connections=2)
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('預熱連線失敗 http://127.0.0.1:9', logs.output[0])
+
+
+class MetricsTests(TestCase):
+    def test_rest_and_fill_reaction_metrics(self):
+        exchange = MockExchange()
+        exchange.set_price('BTCUSDT', 100)
+        server = MockExchangeServer(exchange, port=0).start()
+        self.addCleanup(server.stop)
+        client = BinanceClient('key', 'secret', base_url=server.base_url)
+        client.public('GET', '/api/v3/ticker/price', {'symbol': 'BTCUSDT'})
+        client.signed('GET', '/api/v3/order', {'symbol': 'BTCUSDT', 'orderId': 1})
+        observe_fill_reaction('BTCUSDT', int(time.time() * 1000) - 40)
+
+        body = self.client.get('/metrics/').content.decode()
+        self.assertIn('exchange_rest_responses_total{exchange="binance",method="GET",endpoint="/api/v3/ticker/price",code="200"}', body)
+        self.assertIn('exchange_rest_responses_total{exchange="binance",method="GET",endpoint="/api/v3/order",code="400"}', body)
+        self.assertIn('exchange_rest_request_duration_seconds_count{exchange="binance",method="GET",endpoint="/api/v3/order",outcome="client_error"}', body)
+        self.assertIn('grid_fill_replacement_latency_seconds_bucket{pair="BTCUSDT",le="0.05"}', body)
+        self.assertIn('exchange_rest_received_bytes_total', body)
+
+
+class RequestSchedulerTests(TestCase):
+    def test_cancel_overtakes_queued_report(self):
+        scheduler = RequestScheduler(weight_limit=600, reserve=0, max_wait=5)
+        scheduler.weight.tokens = 0
+        finished = []
+
+        def request(lane):
+            scheduler.acquire(lane)
+            finished.append(lane)
+
+        report = threading.Thread(target=request, args=(REPORT,))
+        report.start()
+        time.sleep(0.02)
+        cancel = threading.Thread(target=request, args=(CANCEL,))
+        cancel.start()
+        report.join()
+        cancel.join()
+        self.assertEqual(finished, [CANCEL, REPORT])
+
+    def test_reserve_and_exchange_headers(self):
+        scheduler = RequestScheduler(weight_limit=60, reserve=0.5, max_wait=0.05)
+        scheduler.weight.tokens = 30
+        with self.assertRaises(RateLimitExceeded):
+            scheduler.acquire(QUERY, 1)
+        scheduler.acquire(ORDER, 1, orders=1)
+
+        scheduler.observe(200, {'X-MBX-USED-WEIGHT-1M': '55', 'X-MBX-ORDER-COUNT-10S': '100'})
+        self.assertLessEqual(scheduler.weight.tokens, 5.1)
+        with self.assertRaises(RateLimitExceeded):
+            scheduler.acquire(ORDER, 1, orders=1)
+
+        scheduler.observe(429, {'Retry-After': '30'})
+        with self.assertRaises(RateLimitExceeded):
+            scheduler.acquire(CANCEL, 1)
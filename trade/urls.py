@@ -2,7 +2,7 @@ from django.urls import path
 from .views import (
     home, login_view, get_pairs, balance,
     start_trade, stop_trade, update_trade, check_trade,
-    get_trades, get_spots,
+    get_trades, get_spots, metrics, events,
 )
 
 urlpatterns = [
@@ -16,4 +16,6 @@ urlpatterns = [
     path('check_trade/', check_trade, name='check_trade'),
     path('get_trades/', get_trades, name='get_trades'),
     path('get_spots/', get_spots, name='get_spots'),
+    path('metrics/', metrics, name='metrics'),
+    path('events/', events, name='events'),
 ]
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import ssl
+import threading
+import websocket
+from .client import binance
+from .metrics import record_retry
+
+BINANCE_WS_URL = os.getenv('BINANCE_WS_URL', 'wss://stream.binance.com:9443')
+
+# listenKey 續約間隔 (Binance 60 分鐘過期)
+LISTEN_KEY_KEEPALIVE = 1800
+
+
+class UserDataStream:
+    """所有網格共用的 Binance user-data websocket，收到的事件交給 on_event 分派"""
+
+    def __init__(self, on_event, on_lost=None, log=print):
+        self.on_event = on_event
+        self.on_lost = on_lost  # 重連失敗時通知 (例如停止所有機器人)
+        self.log = log
+        self.listen_key = None
+        self.ws_url = None
+        self.ws = None
+        self.thread = None
+        self.listen_key_timer = None
+        self.connected_event = threading.Event()
+        self.manual_close = False
+        self.is_running = False
+        self._lock = threading.Lock()
+
+    def start(self, timeout=5):
+        """建立 listenKey 與 websocket 連線，成功回傳 None，失敗回傳錯誤訊息"""
+        with self._lock:
+            if self.is_running:
+                return None
+
+            self.log("嘗試建立 WebSocket 連線中...")
+            listen_key_resp = binance.keyed('POST', '/api/v3/userDataStream')
+            if listen_key_resp.status_code != 200:
+                return "無法取得 listenKey"
+
+            self.listen_key = listen_key_resp.json()['listenKey']
+            self.ws_url = f"{BINANCE_WS_URL}/ws/{self.listen_key}"
+            self.manual_close = False
+            self.connected_event.clear()
+            self._connect(attempt=0)
+            self.is_running = True
+            self.start_listenkey_keepalive()
+
+            # 等待 WS 連線，超時則返回錯誤
+            if not self.connected_event.wait(timeout=timeout):
+                self.log("WS 連線超時")
+                self._close()
+                return "WS 連線超時"
+            return None
+
+    def stop(self):
+        with self._lock:
+            if not self.is_running:
+                return
+            self._close()
+            self.log("🛑 已關閉 user-data WebSocket")
+
+    def _close(self):
+        self.manual_close = True
+        if self.listen_key_timer is not None:
+            self.listen_key_timer.cancel()
+            self.listen_key_timer = None
+        if self.ws:
+            self.ws.close()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        self.is_running = False
+
+    def _connect(self, attempt):
+        self.ws = websocket.WebSocketApp(
+            self.ws_url,
+            on_open=self.on_open,
+            on_message=self.on_message,
+            on_error=self.on_error,
+            on_close=lambda ws, code, msg: self.on_close(ws, code, msg, attempt)  # 傳遞 attempt 次數
+        )
+        self.thread = threading.Thread(
+            target=lambda: self.ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE}),
+            daemon=True
+        )
+        self.thread.start()
+
+    def on_open(self, ws):
+        self.log("✅ WebSocket 連線成功，開始監聽訂單狀態")
+        self.connected_event.set()
+
+    def on_message(self, ws, message):
+        self.on_event(json.loads(message))
+
+    def on_error(self, ws, error):
+        self.log(f"❌ WebSocket 錯誤: {error}")
+
+    def on_close(self, ws, close_status_code, close_msg, attempt=0):
+        self.log("🔴 WebSocket 連線關閉")
+
+        if self.manual_close:
+            self.log("🛑 手動關閉 WebSocket，不啟動重連")
+            return
+
+        if attempt > 3:
+            self.log("❌ WebSocket 連線失敗，超過最大嘗試次數")
+            self.is_running = False
+            if self.listen_key_timer is not None:
+                self.listen_key_timer.cancel()
+            if self.on_lost:
+                self.on_lost("WebSocket 連線失敗，超過最大嘗試次數，機器人停止")
+            return
+
+        self.log(f"⚠️ WebSocket 斷線，嘗試重新連線 (第 {attempt} 次)...")
+        record_retry('/ws', 'user_stream_reconnect')
+        time.sleep(5)  # 等待 5 秒後重新嘗試連線
+        self._connect(attempt + 1)
+
+    def start_listenkey_keepalive(self):
+        def keep_alive():
+            binance.keyed('PUT', '/api/v3/userDataStream', {'listenKey': self.listen_key})
+            self.log("listenKey 已自動續約")
+            self.start_listenkey_keepalive()
+
+        self.listen_key_timer = threading.Timer(LISTEN_KEY_KEEPALIVE, keep_alive)
+        self.listen_key_timer.daemon = True
+        self.listen_key_timer.start()
@@ -1,24 +1,30 @@
 import json
 import logging
-import requests
-from decimal import Decimal
 from functools import wraps
 
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate, login
-from django.utils import timezone
 
 from .binance import get_account_balance, get_all_pairs
-from .ws import TradeWSManager, EMAIL
-from .models import Trade
+from .registry import BotRegistry
+from .async_engine import TRADE_ENGINE, AsyncBotRegistry
+from .metrics import registry as metrics_registry
+from .events import event_stream, async_event_stream, parse_last_id
+from .reports import (
+    PAGE_SIZE_MAX,
+    trade_report, trade_page, iter_trade_rows,
+    spot_report, spot_page, iter_spot_rows,
+)
 
 # 設定 logger
 logger = logging.getLogger(__name__)
 
-# 建立全域的 TradeWSManager 實例
-trade_ws_manager = TradeWSManager()
+# 建立全域的 BotRegistry，以交易對管理多個網格機器人
+bot_registry = AsyncBotRegistry() if TRADE_ENGINE == 'async' else BotRegistry()
 
 def json_login_required(view_func):
     @wraps(view_func)
@@ -28,6 +34,34 @@ def json_login_required(view_func):
          return view_func(request, *args, **kwargs)
     return _wrapped_view
 
+def page_params(request):
+    """解析 ?limit=&cursor=&stream=1，limit 未指定時回傳 None (回傳全部)"""
+    limit = request.GET.get('limit')
+    if limit is not None:
+        limit = int(limit)
+        if not 1 <= limit <= PAGE_SIZE_MAX:
+            raise ValueError(f'limit 需介於 1 ~ {PAGE_SIZE_MAX}')
+    return limit, request.GET.get('cursor') or None, request.GET.get('stream') == '1'
+
+def stream_success(rows, message):
+    """逐筆輸出與 JsonResponse 相同格式的 JSON，不必先在記憶體組出整個列表
+
+    rows 為 keyset_stream 的 generator，結束時的 return 值即 next_cursor
+    """
+    def generate():
+        yield '{"response": {"status": "success", "message": %s, "data": [' % json.dumps(message)
+        separator = ''
+        while True:
+            try:
+                row = next(rows)
+            except StopIteration as stop:
+                next_cursor = stop.value
+                break
+            yield separator + json.dumps(row, cls=DjangoJSONEncoder)
+            separator = ', '
+        yield '], "next_cursor": %s}, "code": "400"}' % json.dumps(next_cursor)
+    return StreamingHttpResponse(generate(), content_type='application/json')
+
 @csrf_exempt
 def balance(request):
     if not request.user.is_authenticated:
@@ -45,7 +79,7 @@ def balance(request):
 @csrf_exempt
 def get_pairs(request):
     try:
-        result = trade_ws_manager.get_all_pairs()
+        result = get_all_pairs()
         if type(result) == list:
             return JsonResponse({'success': True, 'data': result}, status=200)
         else:
@@ -113,8 +147,8 @@ def start_trade(request):
             return JsonResponse({"success": False, "error": "波動百分比格式錯誤"}, status=400)
 
         try:
-            resp = trade_ws_manager.start(
-                pair=pair,
+            resp = bot_registry.start(
+                pair,
                 order_size=order_size,
                 price_increase_percentage=up,
                 price_decrease_percentage=down,
@@ -124,7 +158,7 @@ def start_trade(request):
                 price_cancel_cv=price_cancel_cv,
             )
             if resp == 0:
-                return JsonResponse({'success': True, 'data': trade_ws_manager.get_manager_state()}, status=200)
+                return JsonResponse({'success': True, 'data': bot_registry.get(pair).get_manager_state()}, status=200)
             else:
                 return JsonResponse({'success': False, 'error': resp}, status=200)
         except Exception as e:
@@ -138,7 +172,15 @@ def start_trade(request):
 def stop_trade(request):
     if request.method == 'POST':
         try:
-            resp = trade_ws_manager.stop()
+            data = json.loads(request.body) if request.body else {}
+        except json.JSONDecodeError:
+            return JsonResponse({"success": False, "error": "JSON 格式錯誤"}, status=400)
+        # 未指定交易對時，若只有一個機器人運行中則停止該機器人
+        bot = bot_registry.resolve(data.get('symbol'))
+        if bot is None:
+            return JsonResponse({'success': False, 'error': '機器人未運行或未指定交易對'}, status=200)
+        try:
+            resp = bot_registry.stop(bot.pair)
             if resp == 0:
                 return JsonResponse({"success": True, "data": {"message": "交易機器人已停止"}}, status=200)
             else:
@@ -157,6 +199,9 @@ def update_trade(request):
             data = json.loads(request.body)
         except json.JSONDecodeError:
             return JsonResponse({"success": False, "error": "JSON 格式錯誤"}, status=400)
+        bot = bot_registry.resolve(data.get('symbol'))
+        if bot is None:
+            return JsonResponse({"success": False, "error": "機器人未運行或未指定交易對"}, status=400)
         order_size = data.get('order_size')
         try:
             up = float(data.get('price_up_percentage')) * 0.01
@@ -178,17 +223,23 @@ def update_trade(request):
         except (TypeError, ValueError) as e:
             logger.error(f"start_trade price_cv error: {e}")
             return JsonResponse({"success": False, "error": "波動百分比格式錯誤"}, status=400)
+        # mode: incremental (預設，只異動不同的價位) / reset (全部取消後重掛)
+        incremental = data.get('mode', 'incremental') != 'reset'
         try:
-            resp = trade_ws_manager.update(
+            resp = bot_registry.update(
+                bot.pair,
                 order_size=order_size,
                 price_increase_percentage=up,
                 price_decrease_percentage=down,
                 trade_count=trade_count,
                 price_reset_cv=price_reset_cv,
                 price_cancel_cv=price_cancel_cv,
+                incremental=incremental,
             )
             if resp == 0:
-                return JsonResponse({'success': True, 'data': trade_ws_manager.get_manager_state()}, status=200)
+                state = bot.get_manager_state()
+                state['update_summary'] = bot.last_update_summary
+                return JsonResponse({'success': True, 'data': state}, status=200)
             else:
                 return JsonResponse({'success': False, 'error': resp}, status=400)
         except Exception as e:
@@ -202,8 +253,15 @@ def update_trade(request):
 def check_trade(request):
     if request.method == 'GET':
         try:
-            if trade_ws_manager.is_running:
-                return JsonResponse({'success': True, 'data': trade_ws_manager.get_manager_state()}, status=200)
+            pair = request.GET.get('symbol')
+            running = bot_registry.running_bots()
+            bot = bot_registry.get(pair) if pair else (running[0] if running else None)
+            if bot is not None and bot.is_running:
+                return JsonResponse({
+                    'success': True,
+                    'data': bot.get_manager_state(),
+                    'bots': [b.get_manager_state() for b in running],
+                }, status=200)
             else:
                 return JsonResponse({'success': False, 'error': '機器人未啟動/已停止'}, status=200)
         except Exception as e:
@@ -217,18 +275,24 @@ def check_trade(request):
 def get_trades(request):
     if request.method == 'GET':
         try:
-            result = []
-            pairs = trade_ws_manager.get_all_pairs()
-            for pair in pairs:
-                result.extend(get_trades_by_pair(pair))
-            result.sort(key=lambda x : x['trade_date'], reverse=True)
+            limit, cursor, stream = page_params(request)
+            if stream:
+                return stream_success(iter_trade_rows(limit, cursor), "get trades")
+
+            next_cursor = None
+            if limit is None:
+                result = trade_report()
+                result.sort(key=lambda x : x['trade_date'], reverse=True)
+            else:
+                result, next_cursor = trade_page(limit, cursor)
 
             return JsonResponse(
                 {
                     "response":{
                         "status" : "success", 
                         "message" : f"get trades",
-                        "data" : result
+                        "data" : result,
+                        "next_cursor" : next_cursor
                     },
                     "code" : "400"
                 }
@@ -257,85 +321,29 @@ def get_trades(request):
             }
         )
     
-def get_trades_by_pair(pair):
-    buy_trades = Trade.objects.filter(user_email=EMAIL, pair=pair, action = 'BUY').order_by('trade_date')
-    sell_trades = Trade.objects.filter(user_email=EMAIL, pair=pair, action = 'SELL').order_by('trade_date')
-
-    result = [
-                {
-                    "id" : trade.id,
-                    "pair" : trade.pair,
-                    "action" : trade.action, 
-                    "price" : float(trade.price),
-                    "fee" : float(trade.fee),
-                    "fee_symbol" : trade.fee_symbol,
-                    "quantity" : float(trade.quantity),
-                    "trade_date" : timezone.localtime(trade.trade_date).strftime("%Y-%m-%d %H:%M:%S")
-                } for trade in buy_trades
-            ]
-
-
-    buy_index = 0
-    buy_qty = Decimal('0')
-    buy_price = Decimal('0')
-
-    for sell in sell_trades:
-        sell_qty = sell.quantity
-        sell_price = sell.price
-        profit = Decimal('0')
-
-        while (sell_qty > 0 and (buy_index < len(buy_trades) or buy_qty > 0)):
-
-            if buy_qty <= 0:
-                buy = buy_trades[buy_index]
-                buy_qty = buy.quantity
-                buy_price = buy.price
-                buy_index += 1
-                continue
-            
-            matched_qty = min(sell_qty, buy_qty)
-            profit += matched_qty * (sell_price - buy_price)
-            profit -= sell.fee
-            profit -= buy.fee * (matched_qty / buy_qty)
-            sell_qty -= matched_qty
-            buy_qty -= matched_qty
-
-        result.append(
-            {
-                "id" : sell.id,
-                "pair" : sell.pair,
-                "action" : sell.action, 
-                "price" : float(sell.price),
-                "fee" : float(sell.fee),
-                "fee_symbol" : sell.fee_symbol,
-                "quantity" : float(sell.quantity),
-                "trade_date" : timezone.localtime(sell.trade_date).strftime("%Y-%m-%d %H:%M:%S"),
-                "profit" : profit
-            }
-        )
-
-        if sell_qty > 0:
-            print('異常 : 出現未匹配的賣出單據')
-        
-    return result
-
 @csrf_exempt
 @json_login_required
 def get_spots(request):
     if request.method == 'GET':
         try:
-            result = []
-            pairs = trade_ws_manager.get_all_pairs()
-            for pair in pairs:
-                result.extend(get_spots_by_pair(pair))
-            result.sort(key=lambda x : x['trade_date'], reverse=True)
+            limit, cursor, stream = page_params(request)
+            if stream:
+                return stream_success(iter_spot_rows(limit, cursor), "get trades")
+
+            next_cursor = None
+            if limit is None:
+                result = spot_report()
+                result.sort(key=lambda x : x['trade_date'], reverse=True)
+            else:
+                result, next_cursor = spot_page(limit, cursor)
 
             return JsonResponse(
                 {
                     "response":{
                         "status" : "success", 
                         "message" : f"get trades",
-                        "data" : result
+                        "data" : result,
+                        "next_cursor" : next_cursor
                     },
                     "code" : "400"
                 }
@@ -363,51 +371,19 @@ def get_spots(request):
                 "code" : "400"
             }
         )
-    
-def get_spots_by_pair(pair):
-    buy_trades = Trade.objects.filter(
-        user_email=EMAIL,
-        action='BUY',
-        pair=pair,
-    ).order_by('pair').order_by('trade_date')
 
-    sell_trades = Trade.objects.filter(
-        user_email=EMAIL,
-        action='SELL',
-        pair=pair,
-    ).order_by('pair').order_by('trade_date')
+def metrics(request):
+    """Prometheus 抓取用：交易所 REST 延遲 / 狀態碼 / 重試 / 傳輸量與成交補單延遲"""
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-    # 計算總買入量與總賣出量
-    total_buy_qty = sum(b.quantity for b in buy_trades)
-    total_sell_qty = sum(s.quantity for s in sell_trades)
-
-    remaining_qty = total_buy_qty - total_sell_qty
-
-    result = []
-    qty_needed = remaining_qty
-    buy_trades = reversed(buy_trades)
-
-    for trade in buy_trades:
-        if qty_needed <= 0:
-            break
-        
-        if trade.quantity <= qty_needed:
-            result.append({
-                "id": trade.id,
-                "pair": trade.pair,
-                "price": float(trade.price),
-                "quantity": float(trade.quantity) - float(trade.fee),
-                "trade_date": timezone.localtime(trade.trade_date).strftime("%Y-%m-%d %H:%M:%S")
-            })
-            qty_needed -= trade.quantity
-        else:
-            result.append({
-                "id": trade.id,
-                "pair": trade.pair,
-                "price": float(trade.price),
-                "quantity": float(qty_needed),  # ⚠️ 僅回傳剩下那一點點
-                "trade_date": timezone.localtime(trade.trade_date).strftime("%Y-%m-%d %H:%M:%S")
-            })
-            qty_needed = Decimal('0.0')
-
-    return result
+@json_login_required
+def events(request):
+    """Server-sent events：成交、掛單 / 取消、風控、餘額與機器人狀態的增量推送 (斷線重連以 Last-Event-ID 補送)"""
+    last_id = parse_last_id(request.headers.get('Last-Event-ID') or request.GET.get('last_id'))
+    # ASGI 用非同步產生器 (不佔執行緒，長時間連線)；WSGI 用同步產生器，
+    # 每條連線最多 EVENT_WSGI_MAX_SECONDS 秒即結束，由瀏覽器帶 Last-Event-ID 重連
+    stream = async_event_stream(last_id) if isinstance(request, ASGIRequest) else event_stream(last_id)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 避免 nginx 緩衝
+    return response
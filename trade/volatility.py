@@ -0,0 +1,123 @@
+import os
+import threading
+from collections import deque
+
+# 波動風控的觀察視窗秒數
+VOLATILITY_WINDOW = float(os.getenv('VOLATILITY_WINDOW', 300))
+
+
+class RollingWindow:
+    """時間索引的價格緩衝，以單調佇列維護視窗內的最小 / 最大價 (攤銷 O(1))"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.ticks = deque()     # (ts, price)
+        self.min_q = deque()     # 價格遞增，隊首為最小價
+        self.max_q = deque()     # 價格遞減，隊首為最大價
+
+    def push(self, ts, price):
+        """加入一筆報價，回傳最小價或最大價是否改變"""
+        old_min = self.min_q[0][1] if self.min_q else None
+        old_max = self.max_q[0][1] if self.max_q else None
+
+        self.ticks.append((ts, price))
+        while self.min_q and self.min_q[-1][1] >= price:
+            self.min_q.pop()
+        self.min_q.append((ts, price))
+        while self.max_q and self.max_q[-1][1] <= price:
+            self.max_q.pop()
+        self.max_q.append((ts, price))
+
+        cutoff = ts - self.seconds
+        while self.ticks and self.ticks[0][0] < cutoff:
+            self.ticks.popleft()
+        while self.min_q[0][0] < cutoff:
+            self.min_q.popleft()
+        while self.max_q[0][0] < cutoff:
+            self.max_q.popleft()
+
+        return self.min_q[0][1] != old_min or self.max_q[0][1] != old_max
+
+    def clear(self):
+        self.ticks.clear()
+        self.min_q.clear()
+        self.max_q.clear()
+
+    @property
+    def low(self):
+        return self.min_q[0][1]
+
+    @property
+    def high(self):
+        return self.max_q[0][1]
+
+    def change(self):
+        """視窗內報酬率 (最新價 / 最舊價 - 1)"""
+        if not self.ticks:
+            return 0.0
+        return self.ticks[-1][1] / self.ticks[0][1] - 1
+
+
+class VolatilityGuard:
+    """每筆報價檢查視窗內波動：超過 reset_cv 觸發重新掛單，超過 cancel_cv 觸發停止
+
+    門檻價在最小 / 最大價改變時預先算好，每筆報價只需比較價格與門檻
+    (price >= low * (1 + cv) 或 price <= high * (1 - cv) 即代表與視窗內某筆報價相差超過 cv)
+    """
+
+    def __init__(self, reset_cv, cancel_cv, on_reset, on_cancel, window_seconds=VOLATILITY_WINDOW, runner=None):
+        self.reset_cv = reset_cv
+        self.cancel_cv = cancel_cv
+        self.on_reset = on_reset
+        self.on_cancel = on_cancel
+        self.runner = runner  # runner(action, change_pct)；未指定時另開執行緒執行
+        self.window = RollingWindow(window_seconds)
+        self.triggered = False
+        self._lock = threading.Lock()
+        self._set_thresholds(float('inf'), float('-inf'))
+
+    def _set_thresholds(self, low, high):
+        self.cancel_hi = low * (1 + self.cancel_cv)
+        self.cancel_lo = high * (1 - self.cancel_cv)
+        self.reset_hi = low * (1 + self.reset_cv)
+        self.reset_lo = high * (1 - self.reset_cv)
+
+    def on_tick(self, symbol, price, ts):
+        with self._lock:
+            if self.triggered:
+                return
+            if self.window.push(ts, price):
+                self._set_thresholds(self.window.low, self.window.high)
+
+            if price >= self.cancel_hi or price <= self.cancel_lo:
+                action = self.on_cancel
+            elif price >= self.reset_hi or price <= self.reset_lo:
+                action = self.on_reset
+            else:
+                return
+            self.triggered = True
+            change_pct = max(price / self.window.low - 1, 1 - price / self.window.high)
+
+        if self.runner is not None:
+            self.runner(action, change_pct)
+            return
+        # 取消 / 重掛涉及 REST 呼叫，不能卡住行情執行緒
+        threading.Thread(target=action, args=(change_pct,), daemon=True).start()
+
+    def rearm(self):
+        """重新掛單後以新價格重新起算視窗"""
+        with self._lock:
+            self.window.clear()
+            self._set_thresholds(float('inf'), float('-inf'))
+            self.triggered = False
+
+    def stats(self):
+        with self._lock:
+            if not self.window.ticks:
+                return None
+            return {
+                'low': self.window.low,
+                'high': self.window.high,
+                'change': self.window.change(),
+                'ticks': len(self.window.ticks),
+            }